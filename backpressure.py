@@ -0,0 +1,190 @@
+import select
+import socket
+import ssl
+import time
+from threading import Event, Lock, Thread
+
+import paho.mqtt.client as mqtt
+
+# Backpressure berbasis kredit untuk subscriber. Dengan manual ack, PUBACK/PUBCOMP untuk
+# pesan QoS 1/2 baru dikirim setelah pesan selesai diproses; karena broker tidak boleh
+# mengirim lebih dari ReceiveMaximum pesan yang belum di-ack, antrean subscriber tidak
+# bisa dibanjiri pesan QoS 1/2. ReadGate dan NetworkLoop menghentikan pembacaan socket di
+# atas high water, sehingga QoS 0 dan pesan lain tertahan di broker/TCP alih-alih didrop.
+
+
+class AckTracker:
+    # Satu pesan bisa dipegang beberapa pihak sekaligus (on_message, antrean, worker filter,
+    # pesan di dalam envelope batch); ack dikirim saat pemegang terakhir memanggil release().
+    # Kunci (mid, timestamp): mid saja bisa terpakai ulang setelah reconnect.
+    def __init__(self):
+        self._lock = Lock()
+        self._pending = {} # (mid, timestamp) -> [jumlah pemegang, client, qos]
+        self.stats = {'acked': 0, 'discarded': 0}
+
+    def hold(self, client, msg):
+        # Dipanggil di on_message untuk pesan QoS 1/2 yang diterima dengan manual ack
+        with self._lock:
+            self._pending[(msg.mid, msg.timestamp)] = [1, client, msg.qos]
+
+    def retain(self, msg):
+        # Pemegang baru, misalnya sebelum pesan dimasukkan ke antrean
+        with self._lock:
+            entry = self._pending.get((msg.mid, msg.timestamp))
+            if entry is not None:
+                entry[0] += 1
+
+    def release(self, msg):
+        with self._lock:
+            key = (msg.mid, msg.timestamp)
+            entry = self._pending.get(key)
+            if entry is None:
+                return
+            entry[0] -= 1
+            if entry[0] > 0:
+                return
+            del self._pending[key]
+            self.stats['acked'] += 1
+        entry[1].ack(msg.mid, entry[2])
+
+    def clear(self):
+        # Koneksi putus: ack untuk mid koneksi lama tidak boleh dikirim di koneksi baru
+        with self._lock:
+            self.stats['discarded'] += len(self._pending)
+            self._pending.clear()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, unacked=len(self._pending))
+
+
+class ReadGate:
+    # Histeresis high/low water untuk NetworkLoop: update() dipanggil sebelum setiap select(),
+    # dan selama paused socket tidak dibaca sampai depth() turun ke low_water. max_pause
+    # membatasi lamanya jeda, karena PINGRESP juga tidak terbaca selama jeda dan paho memutus
+    # koneksi jika PINGRESP tidak datang dalam keepalive. Setelah max_pause, gate tetap terbuka
+    # sampai depth() turun di bawah high_water (kelebihan pesan masuk spill buffer).
+    def __init__(self, depth, high_water, low_water, max_pause=30.0, poll_interval=0.01, on_pause=None):
+        if low_water > high_water:
+            raise ValueError("low_water must not exceed high_water")
+        self.depth = depth
+        self.high_water = high_water
+        self.low_water = low_water
+        self.max_pause = max_pause
+        self.poll_interval = poll_interval # Timeout select() selama paused, untuk memeriksa depth() lagi
+        self.on_pause = on_pause # on_pause(depth) saat pembacaan dihentikan
+        self.paused = False
+        self._paused_at = None
+        self._forced_open = False
+        self.stats = {'pauses': 0, 'paused_seconds': 0.0, 'timeouts': 0}
+
+    def update(self):
+        depth = self.depth()
+        now = time.monotonic()
+        if not self.paused:
+            if depth < self.high_water:
+                self._forced_open = False
+            elif not self._forced_open:
+                self.paused = True
+                self._paused_at = now
+                self.stats['pauses'] += 1
+                if self.on_pause is not None:
+                    self.on_pause(depth)
+        elif depth <= self.low_water or now - self._paused_at >= self.max_pause:
+            if depth > self.low_water:
+                self.stats['timeouts'] += 1
+                self._forced_open = True
+            self.paused = False
+            self.stats['paused_seconds'] += now - self._paused_at
+        return self.paused
+
+    def snapshot(self):
+        return dict(self.stats, paused=self.paused, depth=self.depth())
+
+
+class NetworkLoop:
+    # Pengganti loop_start()/loop_forever() untuk client dengan ReadGate, lewat API external
+    # loop paho (loop_read/loop_write/loop_misc). Selama gate paused, socket tidak dimasukkan
+    # ke daftar baca select(): pesan baru tertahan di buffer TCP dan broker, sementara PUBACK/
+    # PUBCOMP, respons request dan PINGREQ tetap ditulis karena thread ini tidak pernah tidur
+    # di dalam callback. Reconnect memakai jeda dari schedule_reconnect (readiness.reconnect_delay).
+    def __init__(self, client, read_gate, readiness, timeout=1.0):
+        self.client = client
+        self.read_gate = read_gate
+        self.readiness = readiness
+        self.timeout = timeout
+        self._stop = Event()
+        self._thread = None
+        # publish()/ack() dari thread lain membangunkan select() lewat socketpair ini
+        self._wake_r, self._wake_w = socket.socketpair()
+        self._wake_r.setblocking(False)
+        self._wake_w.setblocking(False)
+        client.on_socket_register_write = self._wake
+
+    def _wake(self, client=None, userdata=None, sock=None):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass # Buffer penuh: select() sudah pasti akan bangun
+
+    def start(self):
+        self._thread = Thread(target=self.run, name="mqtt-network-loop", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        # DISCONNECT ditulis oleh thread loop, yang berhenti setelah paho menutup socket
+        self._stop.set()
+        self.client.disconnect()
+        self._wake()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def run(self):
+        while True:
+            sock = self.client.socket()
+            if sock is None:
+                if self._stop.is_set():
+                    return
+                self._reconnect()
+            else:
+                self._step(sock)
+
+    def _reconnect(self):
+        if self._stop.wait(self.readiness.reconnect_delay):
+            return
+        try:
+            self.client.reconnect()
+        except OSError:
+            on_connect_fail = self.client.on_connect_fail
+            if on_connect_fail is not None:
+                on_connect_fail(self.client, self.client.user_data_get())
+
+    def _step(self, sock):
+        paused = self.read_gate.update()
+        pending = not paused and isinstance(sock, ssl.SSLSocket) and sock.pending() > 0
+        readers = [self._wake_r] if paused else [sock, self._wake_r]
+        writers = [sock] if self.client.want_write() else []
+        timeout = 0 if pending else (self.read_gate.poll_interval if paused else self.timeout)
+        try:
+            readable, writable, _ = select.select(readers, writers, [], timeout)
+        except (OSError, ValueError):
+            readable, writable = [], [] # Socket ditutup thread lain; loop_misc mendeteksinya
+        if self._wake_r in readable:
+            try:
+                self._wake_r.recv(4096)
+            except BlockingIOError:
+                pass
+            if self.client.want_write():
+                writable = [sock] # Paket baru dari thread lain, coba tulis langsung
+        if sock in readable or pending:
+            if self.client.loop_read() != mqtt.MQTT_ERR_SUCCESS or self.client.socket() is None:
+                return
+        if sock in writable:
+            if self.client.loop_write() != mqtt.MQTT_ERR_SUCCESS or self.client.socket() is None:
+                return
+        self.client.loop_misc()
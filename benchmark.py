@@ -0,0 +1,252 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import struct
+import sys
+import time
+from importlib.metadata import version
+from threading import Event, Lock
+
+import paho.mqtt.client as mqtt
+
+from local_broker import LocalBroker
+
+# Benchmark throughput dan latency terhadap broker MQTT v5 lokal di dalam proses,
+# sehingga hasilnya bisa diulang dan tidak terpengaruh jitter internet.
+# Hasil ditulis sebagai JSON agar bisa dibandingkan antar rilis.
+
+BENCH_TOPIC_PREFIX = "bench"
+TIMESTAMP = struct.Struct("!d")
+
+
+def percentiles(samples):
+    if not samples:
+        return {'p50': None, 'p99': None, 'p999': None}
+    ordered = sorted(samples)
+
+    def pick(percent):
+        return ordered[min(len(ordered) - 1, int(percent / 100.0 * len(ordered)))] * 1000
+
+    return {'p50': pick(50), 'p99': pick(99), 'p999': pick(99.9)}
+
+
+def summarize(count, sent, elapsed, latencies):
+    return {
+        'messages': count,
+        'received': len(latencies),
+        'elapsed_s': elapsed,
+        'msgs_per_sec': len(latencies) / elapsed if elapsed > 0 else None,
+        'latency_ms': percentiles(latencies),
+        'sent': sent
+    }
+
+
+def create_client(client_id):
+    return mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+
+
+def connect_probe(client_id, host, port, topic_filter, qos, on_message):
+    subscribed = Event()
+    client = create_client(client_id)
+    client.on_connect = lambda c, userdata, flags, reason_code, properties: c.subscribe(topic_filter, qos=qos)
+    client.on_subscribe = lambda c, userdata, mid, reason_codes, properties: subscribed.set()
+    client.on_message = on_message
+    client.connect(host, port, keepalive=60)
+    client.loop_start()
+    if not subscribed.wait(10):
+        raise RuntimeError(f"Probe {client_id} failed to subscribe to {topic_filter}")
+    return client
+
+
+def wait_for(predicate, timeout):
+    end = time.monotonic() + timeout
+    while not predicate() and time.monotonic() < end:
+        time.sleep(0.005)
+    return predicate()
+
+
+def bench_publish(publisher, host, port, qos, count, payload_size, timeout):
+    topic = f"{BENCH_TOPIC_PREFIX}/publish/qos{qos}"
+    latencies = []
+    lock = Lock()
+
+    def on_message(client, userdata, msg):
+        latency = time.perf_counter() - TIMESTAMP.unpack_from(msg.payload)[0]
+        with lock:
+            latencies.append(latency)
+
+    probe = connect_probe(f"bench_probe_qos{qos}", host, port, topic, qos, on_message)
+    padding = b"\x00" * max(0, payload_size - TIMESTAMP.size)
+    try:
+        start = time.perf_counter()
+        sent = 0
+        for _ in range(count):
+            result = publisher.send_message_with_flow_control(topic, TIMESTAMP.pack(time.perf_counter()) + padding, qos=qos)
+            if result is not None and result.rc == mqtt.MQTT_ERR_SUCCESS:
+                sent += 1
+        wait_for(lambda: len(latencies) >= sent, timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        probe.loop_stop()
+        probe.disconnect()
+    return summarize(count, sent, elapsed, latencies)
+
+
+def bench_retained(publisher, host, port, count, timeout):
+    topic_prefix = f"{BENCH_TOPIC_PREFIX}/retained"
+    for i in range(count):
+        info = publisher.send_message_with_flow_control(f"{topic_prefix}/{i}", f"retained {i}".encode(), qos=1, retain=True)
+    info.wait_for_publish(timeout)
+    latencies = []
+    start = time.perf_counter()
+
+    def on_message(client, userdata, msg):
+        if msg.retain:
+            latencies.append(time.perf_counter() - start)
+
+    probe = connect_probe("bench_probe_retained", host, port, f"{topic_prefix}/#", 1, on_message)
+    try:
+        wait_for(lambda: len(latencies) >= count, timeout)
+        elapsed = time.perf_counter() - start
+        for i in range(count):
+            # Hapus pesan retained agar run berikutnya mulai dari keadaan bersih
+            publisher.send_message_with_flow_control(f"{topic_prefix}/{i}", b"", qos=1, retain=True)
+    finally:
+        probe.loop_stop()
+        probe.disconnect()
+    return summarize(count, count, elapsed, latencies)
+
+
+def bench_request_response(publisher, count, timeout):
+    latencies = []
+    lock = Lock()
+    start = time.perf_counter()
+    futures = []
+    for i in range(count):
+        sent_at = time.perf_counter()
+        future = publisher.send_request_async({'action': 'get_device_status', 'device_id': f'bench_{i}'}, timeout=timeout)
+
+        def record(done, sent_at=sent_at):
+            if done.exception() is None:
+                with lock:
+                    latencies.append(time.perf_counter() - sent_at)
+        future.add_done_callback(record)
+        futures.append(future)
+    for future in futures:
+        try:
+            future.result()
+        except Exception:
+            pass
+    elapsed = time.perf_counter() - start
+    return summarize(count, count, elapsed, latencies)
+
+
+def bench_subscriber_processing(publisher, subscriber, count, timeout):
+    topic = subscriber.TOPICS_TO_SUBSCRIBE[1][0] # topik data QoS 1
+    latencies = []
+    lock = Lock()
+    original = subscriber.process_message
+
+    def timed_process_message(msg, data=None, limiter=None):
+        original(msg, data, limiter)
+        if msg.topic != topic:
+            return # Misalnya respons request-response yang juga masuk lewat response/#
+        if data is None:
+            data = subscriber.decode_payload(msg.payload, msg.properties)
+        with lock:
+            latencies.append(time.time() - data['timestamp'])
+
+    subscriber.process_message = timed_process_message
+    try:
+        start = time.perf_counter()
+        for i in range(count):
+            publisher.send_message_with_flow_control(topic, {'device_id': f'bench_{i % 64}', 'timestamp': time.time(), 'value': float(i)}, qos=1)
+        wait_for(lambda: len(latencies) >= count, timeout)
+        elapsed = time.perf_counter() - start
+    finally:
+        subscriber.process_message = original
+    return summarize(count, count, elapsed, latencies)
+
+
+def run(args):
+    broker = None
+    if args.host is None:
+        broker = LocalBroker()
+        host, port = broker.start()
+    else:
+        host, port = args.host, args.port
+    os.environ["MQTT_BROKER_HOST"] = host
+    os.environ["MQTT_BROKER_PORT"] = str(port)
+    os.environ["MQTT_USE_TLS"] = "1" if args.tls else "0"
+
+    # Diimpor setelah environment diatur, karena klien dibuat saat modul diimpor
+    import publisher
+    import subscriber
+    from rate_limiter import RateLimiter
+
+    publisher.rate_limiter = RateLimiter(args.rate)
+    subscriber.PROCESSING_DELAY = args.processing_delay
+    subscriber.RATE_LIMIT = 1e9
+
+    results = {}
+    with contextlib.redirect_stdout(io.StringIO()):
+        publisher.publisher_client.connect(host, port, keepalive=60)
+        publisher.publisher_client.loop_start()
+        subscriber.connect_subscriber(subscriber.subscriber_client, host, port)
+        subscriber.start_network_loop(subscriber.subscriber_client)
+        subscriber.start_workers()
+        try:
+            # Siap = CONNACK + SUBACK untuk kedua klien
+            if not (publisher.wait_until_ready(10) and subscriber.wait_until_ready(10)):
+                raise RuntimeError(f"Could not connect to broker at {host}:{port}")
+
+            for qos in (0, 1, 2):
+                results[f'publish_qos{qos}'] = bench_publish(publisher, host, port, qos, args.messages, args.payload_size, args.timeout)
+            results['retained'] = bench_retained(publisher, host, port, args.retained, args.timeout)
+            results['request_response'] = bench_request_response(publisher, args.requests, args.timeout)
+            results['subscriber_processing'] = bench_subscriber_processing(publisher, subscriber, args.processing_messages, args.timeout)
+        finally:
+            subscriber.stop_workers(timeout=2)
+            subscriber.stop_network_loop(subscriber.subscriber_client)
+            publisher.publisher_client.loop_stop()
+            publisher.publisher_client.disconnect()
+            if broker is not None:
+                broker.stop()
+
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'paho_mqtt': version('paho-mqtt'),
+            'broker': 'local' if broker is not None else f'{host}:{port}',
+            'config': vars(args)
+        },
+        'results': results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmark against a local MQTT v5 broker")
+    parser.add_argument("--messages", type=int, default=5000, help="messages per QoS level")
+    parser.add_argument("--payload-size", type=int, default=64)
+    parser.add_argument("--retained", type=int, default=500, help="retained messages to publish and read back")
+    parser.add_argument("--requests", type=int, default=1000, help="request-response round trips")
+    parser.add_argument("--processing-messages", type=int, default=1000, help="messages for the subscriber processing stage")
+    parser.add_argument("--processing-delay", type=float, default=0.0, help="subscriber PROCESSING_DELAY during the run")
+    parser.add_argument("--rate", type=float, default=0, help="publisher QoS 0 rate limit (0 = unlimited); QoS 1/2 follow the in-flight window")
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--host", default=None, help="use an external broker instead of the in-process one")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    sys.stdout.write(report + "\n")
@@ -0,0 +1,245 @@
+import struct
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Condition, Thread
+
+import paho.mqtt.client as mqtt
+
+from codec import encode_with_codec, PAYLOAD_FORMAT_BINARY
+
+# Envelope batch: banyak pesan kecil untuk satu topik dalam satu PUBLISH.
+# [version:B][jumlah content type:B] ([len:B] content_type)* lalu per pesan
+# [indeks content type:B][len:I] payload. Envelope ditandai user property
+# 'batch' (nilai = jumlah pesan) dan ContentType CONTENT_TYPE_BATCH, sehingga
+# consumer yang tidak mengenal envelope gagal decode alih-alih membaca sampah.
+CONTENT_TYPE_BATCH = "application/vnd.insisdemomqtt.batch"
+BATCH_USER_PROPERTY = "batch"
+ENVELOPE_VERSION = 1
+ITEM_HEADER = struct.Struct("!BI")
+
+
+def pack_envelope(items):
+    # items: [(payload, content_type)]
+    content_types = {}
+    body = []
+    for payload, content_type in items:
+        index = content_types.setdefault(content_type, len(content_types))
+        body.append(ITEM_HEADER.pack(index, len(payload)))
+        body.append(payload)
+    header = [bytes((ENVELOPE_VERSION, len(content_types)))]
+    for content_type in content_types:
+        encoded = content_type.encode()
+        header.append(bytes((len(encoded),)))
+        header.append(encoded)
+    return b"".join(header + body)
+
+
+def unpack_envelope(envelope, expected=None):
+    # Mengembalikan [(payload, content_type)]; ValueError untuk envelope yang rusak.
+    # expected (jumlah dari user property 'batch') menangkap envelope yang terpotong tepat di batas pesan
+    if not envelope or envelope[0] != ENVELOPE_VERSION:
+        raise ValueError(f"Unsupported batch envelope version: {envelope[0] if envelope else None}")
+    try:
+        count = envelope[1]
+        offset = 2
+        content_types = []
+        for _ in range(count):
+            length = envelope[offset]
+            content_types.append(bytes(envelope[offset + 1:offset + 1 + length]).decode())
+            offset += 1 + length
+        items = []
+        while offset < len(envelope):
+            index, length = ITEM_HEADER.unpack_from(envelope, offset)
+            offset += ITEM_HEADER.size
+            if offset + length > len(envelope):
+                raise ValueError("Truncated batch envelope")
+            items.append((bytes(envelope[offset:offset + length]), content_types[index]))
+            offset += length
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"Malformed batch envelope: {e}") from e
+    if expected is not None and len(items) != expected:
+        raise ValueError(f"Batch envelope has {len(items)} messages, expected {expected}")
+    return items
+
+
+def is_envelope(properties):
+    if properties is None or getattr(properties, 'ContentType', None) != CONTENT_TYPE_BATCH:
+        return False
+    return any(key == BATCH_USER_PROPERTY for key, _ in getattr(properties, 'UserProperty', ()))
+
+
+def envelope_count(properties):
+    for key, value in getattr(properties, 'UserProperty', ()):
+        if key == BATCH_USER_PROPERTY:
+            try:
+                return int(value)
+            except ValueError:
+                raise ValueError(f"Invalid batch user property: {value!r}") from None
+    return None
+
+
+def split_envelope(msg):
+    # Pecah envelope menjadi MQTTMessage biasa dengan topik, QoS, retain dan waktu terima
+    # yang sama; properties (hanya ContentType) dipakai bersama oleh pesan dengan codec sama
+    messages = []
+    properties_by_type = {}
+    for payload, content_type in unpack_envelope(msg.payload, envelope_count(msg.properties)):
+        properties = properties_by_type.get(content_type)
+        if properties is None:
+            properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+            properties.ContentType = content_type
+            properties_by_type[content_type] = properties
+        item = mqtt.MQTTMessage(msg.mid, msg.topic.encode())
+        item.payload = payload
+        item.qos = msg.qos
+        item.retain = msg.retain
+        item.timestamp = msg.timestamp
+        item.properties = properties
+        messages.append(item)
+    return messages
+
+
+class Coalescer:
+    # Mengumpulkan pesan per (topik, QoS) dan mengirimnya sebagai satu envelope saat
+    # batch mencapai max_messages atau max_bytes, atau saat pesan pertamanya sudah
+    # menunggu linger detik. linger adalah tambahan latency maksimum yang diterima
+    # demi throughput; linger=0 tetap mengumpulkan pesan yang datang bersamaan.
+    # send(topic, envelope, qos, properties) bisa menunggu rate limit atau jendela in-flight,
+    # jadi dipanggil tanpa lock: batch yang siap masuk antrean per topik dan hanya satu thread
+    # yang mengirim untuk satu topik (urutan terjaga), sementara topik lain dikirim oleh
+    # thread lain. Batch penuh dikirim oleh thread pemanggil add(), batch linger oleh
+    # `senders` thread pengirim, dan flush() oleh pemanggilnya.
+    def __init__(self, send, max_messages=100, max_bytes=16 * 1024, linger=0.02, content_type=None, senders=4):
+        if max_messages < 1:
+            raise ValueError("max_messages must be at least 1")
+        self._send = send
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.linger = linger
+        self.content_type = content_type
+        self.senders = senders
+        self._batches = {} # (topik, qos) -> {'items', 'bytes', 'deadline', 'futures'}
+        self._outgoing = {} # (topik, qos) -> deque [(batch, alasan)] yang siap dikirim, sesuai urutan
+        self._sending = set() # (topik, qos) yang sedang dikirim oleh satu thread
+        self._condition = Condition()
+        self._thread = None
+        self._executor = None
+        self._closed = False
+        self.stats = {'messages': 0, 'batches': 0, 'bytes': 0, 'full': 0, 'lingered': 0}
+
+    def _full(self, batch):
+        return len(batch['items']) >= self.max_messages or batch['bytes'] >= self.max_bytes
+
+    def add(self, topic, obj, qos=0):
+        # Encode di thread pemanggil; Future selesai dengan MQTTMessageInfo dari envelope
+        payload, codec = encode_with_codec(obj, self.content_type)
+        future = Future()
+        future.set_running_or_notify_cancel()
+        key = (topic, qos)
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Coalescer is closed")
+            if self._thread is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.senders, thread_name_prefix="coalescer")
+                self._thread = Thread(target=self._linger_worker, daemon=True)
+                self._thread.start()
+            batch = self._batches.get(key)
+            if batch is None:
+                batch = self._batches[key] = {'items': [], 'bytes': 2, 'deadline': time.monotonic() + self.linger, 'futures': []}
+                self._condition.notify_all()
+            batch['items'].append((payload, codec.content_type))
+            batch['bytes'] += ITEM_HEADER.size + len(payload)
+            batch['futures'].append(future)
+            self.stats['messages'] += 1
+            full = self._full(batch)
+        if full:
+            for ready_key in self._take(lambda k, b: k == key and self._full(b), 'full'):
+                self._drain(ready_key)
+        return future
+
+    def _take(self, select, reason=None):
+        # Pindahkan batch terpilih ke antrean kirim; mengembalikan topik yang harus dikirim
+        # oleh pemanggil (topik yang sudah punya pengirim aktif dikirim oleh pengirim itu)
+        with self._condition:
+            ready = [(key, batch) for key, batch in self._batches.items() if select(key, batch)]
+            claimed = []
+            for key, batch in ready:
+                del self._batches[key]
+                self._outgoing.setdefault(key, deque()).append((batch, reason))
+                if key not in self._sending:
+                    self._sending.add(key)
+                    claimed.append(key)
+            return claimed
+
+    def _drain(self, key):
+        while True:
+            with self._condition:
+                outgoing = self._outgoing.get(key)
+                if not outgoing:
+                    self._outgoing.pop(key, None)
+                    self._sending.discard(key)
+                    self._condition.notify_all()
+                    return
+                batch, reason = outgoing.popleft()
+            self._send_batch(key, batch, reason)
+
+    def _send_batch(self, key, batch, reason):
+        topic, qos = key
+        properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+        properties.ContentType = CONTENT_TYPE_BATCH
+        properties.PayloadFormatIndicator = PAYLOAD_FORMAT_BINARY
+        properties.UserProperty = (BATCH_USER_PROPERTY, str(len(batch['items'])))
+        envelope = pack_envelope(batch['items'])
+        with self._condition:
+            self.stats['batches'] += 1
+            self.stats['bytes'] += len(envelope)
+            if reason is not None:
+                self.stats[reason] += 1
+        try:
+            info = self._send(topic, envelope, qos, properties)
+        except Exception as e:
+            for future in batch['futures']:
+                future.set_exception(e)
+            return
+        for future in batch['futures']:
+            future.set_result(info)
+
+    def _linger_worker(self):
+        while True:
+            with self._condition:
+                if self._closed and not self._batches:
+                    return
+                now = time.monotonic()
+                earliest = min((batch['deadline'] for batch in self._batches.values()), default=None)
+                if earliest is None or earliest > now:
+                    self._condition.wait(None if earliest is None else earliest - now)
+                    continue
+            for key in self._take(lambda k, b: b['deadline'] <= now, 'lingered'):
+                self._executor.submit(self._drain, key)
+
+    def flush(self):
+        # Kembali setelah semua batch, termasuk yang sedang dikirim thread lain, diserahkan ke send()
+        for key in self._take(lambda k, b: True):
+            self._drain(key)
+        with self._condition:
+            self._condition.wait_for(lambda: not self._sending)
+
+    def pending(self):
+        with self._condition:
+            return sum(len(batch['items']) for batch in self._batches.values())
+
+    def snapshot(self):
+        stats = dict(self.stats, pending=self.pending())
+        stats['messages_per_batch'] = stats['messages'] / stats['batches'] if stats['batches'] else None
+        return stats
+
+    def close(self):
+        # Kirim sisa batch lalu hentikan thread linger dan thread pengirim
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self.flush()
+        if self._thread is not None:
+            self._thread.join()
+            self._executor.shutdown(wait=True)
@@ -0,0 +1,230 @@
+import json
+import struct
+import time
+
+# Payload codecs. The publisher advertises the codec through the MQTT v5
+# ContentType / PayloadFormatIndicator properties and the subscriber picks the
+# decoder from ContentType; payloads without a ContentType are treated as JSON.
+CONTENT_TYPE_JSON = "application/json"
+CONTENT_TYPE_SENSOR = "application/vnd.insisdemomqtt.sensor-reading"
+CONTENT_TYPE_MSGPACK = "application/msgpack"
+CONTENT_TYPE_CBOR = "application/cbor"
+PAYLOAD_FORMAT_BINARY = 0
+PAYLOAD_FORMAT_UTF8 = 1
+
+
+class JsonCodec:
+    content_type = CONTENT_TYPE_JSON
+    payload_format = PAYLOAD_FORMAT_UTF8
+
+    def can_encode(self, obj):
+        return True
+
+    def encode(self, obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def decode(self, payload):
+        return json.loads(payload)
+
+
+class SensorReadingCodec:
+    # Skema biner untuk pembacaan sensor:
+    # [version:B][timestamp:d][value:d][len:B] device_id [len:B] unit
+    content_type = CONTENT_TYPE_SENSOR
+    payload_format = PAYLOAD_FORMAT_BINARY
+    VERSION = 1
+    HEADER = struct.Struct("!Bdd")
+    REQUIRED_FIELDS = frozenset(("device_id", "timestamp", "value"))
+    OPTIONAL_FIELDS = frozenset(("unit",))
+
+    def can_encode(self, obj):
+        if not isinstance(obj, dict):
+            return False
+        keys = obj.keys()
+        if not self.REQUIRED_FIELDS <= keys or not keys <= self.REQUIRED_FIELDS | self.OPTIONAL_FIELDS:
+            return False
+        if not isinstance(obj["device_id"], str) or len(obj["device_id"].encode()) > 255:
+            return False
+        # Hanya jika round-trip persis: int akan kembali sebagai float dan unit '' tidak bisa dibedakan dari tanpa unit
+        if not all(isinstance(obj[k], float) for k in ("timestamp", "value")):
+            return False
+        unit = obj.get("unit")
+        return unit is None or (isinstance(unit, str) and 0 < len(unit.encode()) <= 255)
+
+    def encode(self, obj):
+        device_id = obj["device_id"].encode()
+        unit = obj.get("unit")
+        unit = unit.encode() if unit is not None else b""
+        return b"".join((
+            self.HEADER.pack(self.VERSION, obj["timestamp"], obj["value"]),
+            bytes((len(device_id),)), device_id,
+            bytes((len(unit),)), unit
+        ))
+
+    def decode(self, payload):
+        # Payload terpotong/rusak selalu menjadi ValueError, karena pemanggil di thread jaringan hanya menangkap ValueError
+        if len(payload) < self.HEADER.size + 2:
+            raise ValueError(f"Truncated sensor reading: {len(payload)} bytes")
+        version, timestamp, value = self.HEADER.unpack_from(payload)
+        if version != self.VERSION:
+            raise ValueError(f"Unsupported sensor reading version: {version}")
+        fields = []
+        offset = self.HEADER.size
+        for _ in range(2): # device_id, unit
+            if offset >= len(payload):
+                raise ValueError(f"Truncated sensor reading: {len(payload)} bytes")
+            length = payload[offset]
+            end = offset + 1 + length
+            if end > len(payload):
+                raise ValueError(f"Truncated sensor reading: {len(payload)} bytes")
+            try:
+                fields.append(bytes(payload[offset + 1:end]).decode())
+            except UnicodeDecodeError as e:
+                raise ValueError(f"Invalid sensor reading string: {e}") from e
+            offset = end
+        if offset != len(payload):
+            raise ValueError(f"Trailing data in sensor reading: {len(payload) - offset} bytes")
+        device_id, unit = fields
+        reading = {"device_id": device_id, "timestamp": timestamp, "value": value}
+        if unit:
+            reading["unit"] = unit
+        return reading
+
+
+class MsgpackCodec:
+    content_type = CONTENT_TYPE_MSGPACK
+    payload_format = PAYLOAD_FORMAT_BINARY
+
+    def __init__(self, module):
+        self._msgpack = module
+
+    def can_encode(self, obj):
+        return True
+
+    def encode(self, obj):
+        return self._msgpack.packb(obj, use_bin_type=True)
+
+    def decode(self, payload):
+        return self._msgpack.unpackb(payload, raw=False)
+
+
+class CborCodec:
+    content_type = CONTENT_TYPE_CBOR
+    payload_format = PAYLOAD_FORMAT_BINARY
+
+    def __init__(self, module):
+        self._cbor2 = module
+
+    def can_encode(self, obj):
+        return True
+
+    def encode(self, obj):
+        return self._cbor2.dumps(obj)
+
+    def decode(self, payload):
+        return self._cbor2.loads(payload)
+
+
+codecs = {} # content type -> codec
+encode_preference = [] # Urutan codec yang dicoba saat encode otomatis
+codec_stats = {} # content type -> {'messages', 'bytes'}
+
+
+def register_codec(codec, preferred=False):
+    codecs[codec.content_type] = codec
+    codec_stats.setdefault(codec.content_type, {'messages': 0, 'bytes': 0})
+    if preferred:
+        encode_preference.insert(0, codec.content_type)
+
+
+register_codec(JsonCodec())
+register_codec(SensorReadingCodec(), preferred=True)
+
+try:
+    import msgpack
+    register_codec(MsgpackCodec(msgpack))
+except ImportError:
+    pass
+
+try:
+    import cbor2
+    register_codec(CborCodec(cbor2))
+except ImportError:
+    pass
+
+
+def get_codec(content_type=None):
+    if content_type is None:
+        return codecs[CONTENT_TYPE_JSON]
+    codec = codecs.get(content_type)
+    if codec is None:
+        raise ValueError(f"No codec registered for content type '{content_type}'")
+    return codec
+
+
+def select_codec(obj, content_type=None):
+    # content_type=None: codec pertama di encode_preference yang bisa meng-encode obj, selain itu JSON
+    if content_type is not None:
+        return get_codec(content_type)
+    for preferred in encode_preference:
+        codec = codecs[preferred]
+        if codec.can_encode(obj):
+            return codec
+    return codecs[CONTENT_TYPE_JSON]
+
+
+def encode_with_codec(obj, content_type=None):
+    # Mengembalikan (payload, codec) tanpa menyentuh properties, misalnya untuk isi envelope batch
+    codec = select_codec(obj, content_type)
+    payload = codec.encode(obj)
+    stats = codec_stats[codec.content_type]
+    stats['messages'] += 1
+    stats['bytes'] += len(payload)
+    return payload, codec
+
+
+def encode_payload(obj, properties=None, content_type=None):
+    payload, codec = encode_with_codec(obj, content_type)
+    if properties is not None:
+        properties.ContentType = codec.content_type
+        properties.PayloadFormatIndicator = codec.payload_format
+    return payload
+
+
+def decode_payload(payload, properties=None):
+    # Semua kegagalan decode menjadi ValueError (struct.error/IndexError dari codec pihak ketiga juga)
+    content_type = getattr(properties, 'ContentType', None) if properties is not None else None
+    codec = get_codec(content_type)
+    try:
+        return codec.decode(payload)
+    except (struct.error, IndexError, TypeError) as e:
+        raise ValueError(f"Malformed {codec.content_type} payload: {e}") from e
+
+
+def measure_codecs(sample, iterations=10000):
+    # Ukuran payload dan waktu encode/decode per pesan untuk setiap codec yang bisa meng-encode sample
+    results = {}
+    for content_type, codec in codecs.items():
+        if not codec.can_encode(sample):
+            continue
+        payload = codec.encode(sample)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            codec.encode(sample)
+        encode_us = (time.perf_counter() - start) / iterations * 1e6
+        start = time.perf_counter()
+        for _ in range(iterations):
+            codec.decode(payload)
+        decode_us = (time.perf_counter() - start) / iterations * 1e6
+        results[content_type] = {'bytes': len(payload), 'encode_us': encode_us, 'decode_us': decode_us}
+    return results
+
+
+if __name__ == "__main__":
+    sample = {'device_id': 'temp_sensor_001', 'timestamp': time.time(), 'value': 22.5, 'unit': 'C'}
+    results = measure_codecs(sample)
+    json_result = results[CONTENT_TYPE_JSON]
+    for content_type, result in results.items():
+        difference = result['bytes'] - json_result['bytes']
+        print(f"{content_type}: {result['bytes']} bytes ({difference:+d} vs JSON), "
+              f"encode {result['encode_us']:.2f} us, decode {result['decode_us']:.2f} us")
@@ -0,0 +1,129 @@
+import random
+import ssl
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from threading import Lock
+
+# Kesiapan koneksi dan reconnect cepat untuk publisher dan subscriber.
+# Koneksi dianggap siap setelah CONNACK sukses dan SUBACK untuk semua SUBSCRIBE
+# yang dikirim dari on_connect, sehingga pemanggil tidak perlu sleep atau polling.
+CONNECT_TIMEOUT = 10 # Detik default untuk wait_until_ready
+RECONNECT_BASE_DELAY = 0.1 # Batas atas jeda reconnect pertama; reconnect pertama hampir langsung
+RECONNECT_MAX_DELAY = 30.0 # Batas atas jeda reconnect setelah gagal berulang
+
+
+class ConnectionReadiness:
+    # Setiap koneksi (dan reconnect) punya Future sendiri yang berisi daftar reason code
+    # SUBACK, atau ConnectionRefusedError jika CONNACK menolak. wait() dan future()
+    # selalu merujuk ke koneksi saat ini; setelah koneksi putus Future baru dibuat.
+    def __init__(self, tls_context=None):
+        self.tls_context = tls_context # TLSSessionContext milik client, sesinya disimpan di connected()
+        self._lock = Lock()
+        self._future = Future()
+        self._pending = set() # mid SUBSCRIBE yang belum dibalas SUBACK
+        self._granted = []
+        self._connected = False
+        self.attempts = 0 # Percobaan reconnect sejak koneksi sukses terakhir
+        self.reconnect_delay = RECONNECT_BASE_DELAY # Jeda terakhir dari schedule_reconnect, untuk loop jaringan sendiri
+        self.stats = {'connects': 0, 'disconnects': 0, 'tls_resumed': 0}
+
+    def _renew(self):
+        if self._future.done():
+            self._future = Future()
+
+    def connected(self, client, subscribe_mids=()):
+        # Dipanggil di akhir on_connect (CONNACK sukses), setelah SUBSCRIBE dikirim.
+        # SUBACK diproses di thread jaringan yang sama, jadi tidak bisa mendahului baris ini.
+        resumed = self.tls_context is not None and self.tls_context.save_session(client.socket())
+        with self._lock:
+            if resumed:
+                self.stats['tls_resumed'] += 1
+            self._renew()
+            self._connected = True
+            self._pending = set(subscribe_mids)
+            self._granted = []
+            self.attempts = 0
+            self.stats['connects'] += 1
+            if not self._pending:
+                self._future.set_result([])
+
+    def refused(self, reason_code):
+        with self._lock:
+            self._renew()
+            self._connected = False
+            self._future.set_exception(ConnectionRefusedError(f"Broker refused connection: {reason_code}"))
+
+    def subscribed(self, mid, reason_codes):
+        with self._lock:
+            if mid not in self._pending:
+                return
+            self._pending.discard(mid)
+            self._granted.extend(reason_codes)
+            if self._connected and not self._pending and not self._future.done():
+                self._future.set_result(list(self._granted))
+
+    def disconnected(self):
+        with self._lock:
+            self._connected = False
+            self._pending.clear()
+            self._renew()
+            self.stats['disconnects'] += 1
+
+    def future(self):
+        with self._lock:
+            return self._future
+
+    def is_ready(self):
+        future = self.future()
+        return future.done() and future.exception() is None
+
+    def wait(self, timeout=CONNECT_TIMEOUT):
+        # True jika siap dalam timeout; False jika timeout atau koneksi ditolak
+        try:
+            self.future().result(timeout)
+            return True
+        except (FutureTimeoutError, ConnectionRefusedError):
+            return False
+
+    def next_reconnect_delay(self, base=RECONNECT_BASE_DELAY, cap=RECONNECT_MAX_DELAY):
+        # Exponential backoff dengan full jitter: acak antara 0 dan base * 2^percobaan,
+        # agar banyak client yang terputus bersamaan tidak reconnect serentak
+        with self._lock:
+            delay = random.uniform(0, min(cap, base * 2 ** self.attempts))
+            self.attempts += 1
+        return delay
+
+
+def schedule_reconnect(client, readiness):
+    # Dipanggil dari on_disconnect/on_connect_fail: paho menunggu jeda minimum ini sebelum reconnect
+    delay = readiness.next_reconnect_delay()
+    readiness.reconnect_delay = delay
+    client.reconnect_delay_set(delay, RECONNECT_MAX_DELAY)
+    return delay
+
+
+class TLSSessionContext(ssl.SSLContext):
+    # SSLContext yang menyimpan sesi TLS dari koneksi terakhir dan memakainya lagi saat
+    # reconnect (session resumption), sehingga handshake ulang tidak perlu pertukaran
+    # sertifikat dan key exchange penuh. Satu context per client (satu host).
+    session = None
+
+    def wrap_socket(self, sock, *args, **kwargs):
+        if self.session is not None and 'session' not in kwargs:
+            kwargs['session'] = self.session
+        return super().wrap_socket(sock, *args, **kwargs)
+
+    def save_session(self, sock):
+        # Dipanggil dari on_connect; pada TLS 1.3 tiket sesi baru tersedia setelah handshake
+        if isinstance(sock, ssl.SSLSocket) and sock.session is not None:
+            self.session = sock.session
+            return sock.session_reused
+        return False
+
+
+def create_tls_context():
+    # Sama dengan client.tls_set(cert_reqs=None, tls_version=ssl.PROTOCOL_TLS_CLIENT):
+    # verifikasi sertifikat dan hostname dengan CA bawaan sistem
+    context = TLSSessionContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.load_default_certs()
+    return context
+
@@ -0,0 +1,137 @@
+import heapq
+import itertools
+import time
+from collections import deque
+from queue import Queue, Empty
+
+ORDER_FIFO = "fifo"
+ORDER_EDF = "edf" # Earliest deadline first
+EXPIRY_USER_PROPERTY = "expiry" # Deadline aplikasi (UNIX timestamp) yang disalin publisher ke user property
+
+
+def message_deadline(msg):
+    # Deadline pesan dalam waktu time.monotonic(), tanpa men-decode payload:
+    # MessageExpiryInterval dihitung dari waktu pesan diterima (msg.timestamp),
+    # deadline aplikasi dibaca dari user property 'expiry'.
+    properties = getattr(msg, 'properties', None)
+    if properties is None:
+        return None
+    deadline = None
+    interval = getattr(properties, 'MessageExpiryInterval', None)
+    if interval is not None:
+        deadline = (msg.timestamp or time.monotonic()) + interval
+    for key, value in getattr(properties, 'UserProperty', ()):
+        if key == EXPIRY_USER_PROPERTY:
+            try:
+                app_deadline = time.monotonic() + (float(value) - time.time())
+            except ValueError:
+                continue
+            deadline = app_deadline if deadline is None else min(deadline, app_deadline)
+    return deadline
+
+
+class DeadlineQueue(Queue):
+    # Queue yang mengindeks deadline setiap item. Item yang kedaluwarsa dibuang
+    # secara massal sebelum get(), sehingga tidak pernah sampai ke worker.
+    # order=ORDER_EDF mengambil item dengan deadline paling awal lebih dulu.
+    def __init__(self, maxsize=0, order=ORDER_FIFO, deadline_fn=message_deadline, on_expired=None):
+        if order not in (ORDER_FIFO, ORDER_EDF):
+            raise ValueError(f"Unknown queue order: {order}")
+        self.order = order
+        self.deadline_fn = deadline_fn
+        self.on_expired = on_expired
+        self.expired = 0
+        super().__init__(maxsize)
+
+    def _init(self, maxsize):
+        self.queue = deque() if self.order == ORDER_FIFO else []
+        self._deadlines = [] # heap [deadline, seq, entry] hanya untuk item yang punya deadline
+        self._deadlines_live = 0 # Entry di _deadlines yang belum diambil/kedaluwarsa
+        self._counter = itertools.count()
+        self._live = 0
+
+    def _qsize(self):
+        return self._live
+
+    def _put(self, item):
+        deadline = self.deadline_fn(item)
+        seq = next(self._counter)
+        # entry: [sort_key, seq, item, alive]
+        entry = [deadline if deadline is not None else float('inf'), seq, item, True]
+        if self.order == ORDER_FIFO:
+            self.queue.append(entry)
+        else:
+            heapq.heappush(self.queue, entry)
+        if deadline is not None:
+            heapq.heappush(self._deadlines, (deadline, seq, entry))
+            self._deadlines_live += 1
+        self._live += 1
+
+    def _get(self):
+        while True:
+            entry = self.queue.popleft() if self.order == ORDER_FIFO else heapq.heappop(self.queue)
+            if entry[3]:
+                entry[3] = False
+                self._live -= 1
+                if entry[0] != float('inf'):
+                    self._deadlines_live -= 1
+                    self._compact_deadlines()
+                return entry[2]
+
+    def _compact_deadlines(self):
+        # Entry yang sudah diambil worker tetap di heap _deadlines sampai deadline-nya lewat;
+        # buang yang ada di puncak heap, dan bangun ulang heap jika entry mati lebih banyak dari yang hidup
+        deadlines = self._deadlines
+        while deadlines and not deadlines[0][2][3]:
+            heapq.heappop(deadlines)
+        if len(deadlines) > 2 * self._deadlines_live + 64:
+            self._deadlines = [item for item in deadlines if item[2][3]]
+            heapq.heapify(self._deadlines)
+
+    def _purge(self, now):
+        expired = []
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, entry = heapq.heappop(self._deadlines)
+            if entry[3]:
+                entry[3] = False
+                expired.append(entry[2])
+        if expired:
+            count = len(expired)
+            self._live -= count
+            self._deadlines_live -= count
+            self.expired += count
+            self.unfinished_tasks -= count
+            if self.unfinished_tasks <= 0:
+                self.all_tasks_done.notify_all()
+            self.not_full.notify(count)
+            # Buang entry mati dari antrean utama jika sudah terlalu banyak
+            if len(self.queue) > 2 * self._live + 64:
+                live = [entry for entry in self.queue if entry[3]]
+                if self.order == ORDER_FIFO:
+                    self.queue = deque(live)
+                else:
+                    heapq.heapify(live)
+                    self.queue = live
+        return expired
+
+    def purge_expired(self, now=None):
+        with self.mutex:
+            expired = self._purge(time.monotonic() if now is None else now)
+        if expired and self.on_expired is not None:
+            self.on_expired(expired)
+        return len(expired)
+
+    def get(self, block=True, timeout=None):
+        self.purge_expired()
+        if not block or timeout is None:
+            return super().get(block, timeout)
+        end = time.monotonic() + timeout
+        while True:
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                raise Empty
+            # Tunggu dalam potongan pendek agar deadline item yang baru masuk tetap diperiksa
+            try:
+                return super().get(True, min(remaining, 0.5))
+            except Empty:
+                self.purge_expired()
@@ -0,0 +1,129 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# Deteksi duplikat dengan memori tetap: kunci pesan disimpan di dua Bloom filter
+# (generasi sekarang dan sebelumnya). Generasi diganti setelah `capacity` kunci baru
+# atau `window` detik, sehingga kunci diingat minimal selama salah satu batas itu
+# tercapai dan memori tidak bertambah berapa pun jumlah pesannya.
+# Bloom filter bisa salah menganggap pesan baru sebagai duplikat dengan peluang
+# sekitar error_rate per generasi; tidak pernah sebaliknya.
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, h1, h2):
+        # Double hashing: k posisi dari dua hash 64 bit
+        size = self.size
+        return [(h1 + i * h2) % size for i in range(self.hashes)]
+
+    def contains(self, h1, h2):
+        bits = self._bits
+        return all(bits[position >> 3] & (1 << (position & 7)) for position in self._positions(h1, h2))
+
+    def add(self, h1, h2):
+        bits = self._bits
+        for position in self._positions(h1, h2):
+            bits[position >> 3] |= 1 << (position & 7)
+
+    @property
+    def nbytes(self):
+        return len(self._bits)
+
+
+class DedupIndex:
+    def __init__(self, capacity=1000000, window=3600.0, error_rate=1e-6):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+        self.capacity = capacity
+        self.window = window
+        self.error_rate = error_rate
+        self._lock = Lock()
+        self._current = BloomFilter(capacity, error_rate)
+        self._previous = None
+        self._count = 0 # Kunci di generasi sekarang
+        self._started = time.monotonic()
+        self.stats = {'hits': 0, 'misses': 0, 'rotations': 0}
+
+    @staticmethod
+    def _hash(key):
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+
+    def check_and_add(self, key):
+        # True jika key (bytes) kemungkinan sudah pernah dilihat; jika tidak, key dicatat
+        h1, h2 = self._hash(key)
+        with self._lock:
+            if self._current.contains(h1, h2) or (self._previous is not None and self._previous.contains(h1, h2)):
+                self.stats['hits'] += 1
+                return True
+            self.stats['misses'] += 1
+            now = time.monotonic()
+            if self._count >= self.capacity or (self.window and now - self._started >= self.window):
+                self._previous = self._current
+                self._current = BloomFilter(self.capacity, self.error_rate)
+                self._count = 0
+                self._started = now
+                self.stats['rotations'] += 1
+            self._current.add(h1, h2)
+            self._count += 1
+            return False
+
+    def snapshot(self):
+        with self._lock:
+            stats = dict(self.stats, keys=self._count, capacity=self.capacity)
+            stats['bytes'] = self._current.nbytes + (self._previous.nbytes if self._previous is not None else 0)
+        total = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = stats['hits'] / total if total else None
+        return stats
+
+
+class ResponseCache:
+    # Respons terakhir per request_id (LRU, maksimum `maxsize`), untuk menjawab request
+    # duplikat tanpa menjalankan handler lagi. Berbeda dengan DedupIndex, cache ini
+    # eksak: request yang belum pernah dilihat tidak pernah dianggap duplikat.
+    PENDING = object() # Penanda request yang masih diproses
+
+    def __init__(self, maxsize=10000):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'in_progress': 0}
+
+    def begin(self, request_id):
+        # None = request baru (ditandai PENDING); PENDING = duplikat yang masih diproses;
+        # selain itu respons yang tersimpan
+        with self._lock:
+            entry = self._entries.get(request_id)
+            if entry is None:
+                self.stats['misses'] += 1
+                self._entries[request_id] = self.PENDING
+                if len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+                return None
+            self._entries.move_to_end(request_id)
+            self.stats['in_progress' if entry is self.PENDING else 'hits'] += 1
+            return entry
+
+    def complete(self, request_id, response):
+        with self._lock:
+            if request_id in self._entries:
+                self._entries[request_id] = response
+
+    def discard(self, request_id):
+        # Request yang tidak diproses (misalnya ditolak karena sibuk) boleh dicoba lagi
+        with self._lock:
+            if self._entries.get(request_id) is self.PENDING:
+                del self._entries[request_id]
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._entries))
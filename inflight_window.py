@@ -0,0 +1,154 @@
+import time
+from threading import Condition
+
+REASON_QUOTA_EXCEEDED = 0x97 # Reason code MQTT v5 di PUBACK/PUBREC saat broker kewalahan
+MQTT_MAX_RECEIVE_MAXIMUM = 65535
+
+
+class InflightWindow:
+    # Jendela pesan QoS 1/2 yang belum di-ack (AIMD, mirip congestion window TCP).
+    # Setiap ack mengukur latency publish-ke-ack. Dari latency rata-rata (EWMA)
+    # dan latency dasar (minimum terbaru) diperkirakan berapa pesan yang sedang
+    # mengantre di broker: window * (1 - dasar / rata-rata), seperti TCP Vegas.
+    # Selama perkiraan itu di bawah queue_threshold, jendela bertambah: +1 per
+    # ack saat slow start, +1 per jendela penuh setelahnya. Di atasnya, atau saat
+    # broker membalas quota exceeded, jendela dikecilkan secara multiplikatif,
+    # paling banyak sekali per jendela ack (seperti fast recovery TCP).
+    # Jendela tidak pernah melebihi ReceiveMaximum dari CONNACK broker.
+    def __init__(self, initial=10, minimum=1, maximum=MQTT_MAX_RECEIVE_MAXIMUM, increase=1.0, decrease=0.5,
+                 queue_threshold=16, latency_floor=0.005, base_latency_period=10.0):
+        if minimum < 1 or initial < minimum:
+            raise ValueError("window sizes must satisfy 1 <= minimum <= initial")
+        if not 0 < decrease < 1:
+            raise ValueError("decrease must be between 0 and 1")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self.queue_threshold = queue_threshold # Perkiraan pesan yang mengantre di broker sebelum jendela dikecilkan
+        self.latency_floor = latency_floor # Latency di bawah ini tidak dianggap kemacetan
+        self.base_latency_period = base_latency_period # Detik sebelum latency dasar diukur ulang
+        self.limit = maximum # min(maximum, ReceiveMaximum broker)
+        self.window = float(min(initial, maximum))
+        self.ssthresh = float(maximum)
+        self.smoothed_latency = None
+        self.base_latency = None
+        self._base_latency_at = 0.0
+        self._period_min = None # Latency minimum sejak latency dasar terakhir diperbarui
+        self._recovery_acks = 0 # Ack yang harus lewat sebelum jendela boleh dikecilkan lagi
+        self._slots = 0 # Slot terpakai, termasuk publish yang mid-nya belum tercatat
+        self._inflight = {} # mid -> (topic, waktu publish)
+        self._early_acks = {} # mid -> (waktu ack, reason code) untuk ack yang tiba sebelum sent()
+        self._condition = Condition()
+        self.stats = {'acked': 0, 'decreases': 0, 'quota_exceeded': 0, 'rejected': 0, 'waits': 0}
+
+    def set_receive_maximum(self, receive_maximum=None):
+        # Dipanggil dari on_connect dengan properti ReceiveMaximum (default MQTT v5: 65535)
+        with self._condition:
+            self.limit = min(self.maximum, receive_maximum or MQTT_MAX_RECEIVE_MAXIMUM)
+            self.window = max(self.minimum, min(self.window, self.limit))
+            self._condition.notify_all()
+
+    def acquire(self, timeout=None):
+        # Tunggu slot kosong di jendela; False jika timeout
+        with self._condition:
+            if self._slots >= int(self.window):
+                self.stats['waits'] += 1
+                if not self._condition.wait_for(lambda: self._slots < int(self.window), timeout):
+                    return False
+            self._slots += 1
+            return True
+
+    def cancel(self):
+        # Slot dari acquire() yang tidak jadi dipakai (publish gagal)
+        with self._condition:
+            self._slots -= 1
+            self._condition.notify()
+
+    def sent(self, mid, topic, sent_at):
+        # Catat publish yang menunggu ack. Jika ack-nya sudah datang lebih dulu,
+        # langsung diselesaikan dan latency-nya dikembalikan.
+        with self._condition:
+            early = self._early_acks.pop(mid, None)
+            if early is None or early[0] < sent_at:
+                self._inflight[mid] = (topic, sent_at)
+                return None
+            return self._complete(topic, early[0] - sent_at, early[1], early[0])
+
+    def acked(self, mid, reason_code=0):
+        # Dipanggil dari on_publish; mengembalikan (topic, latency) untuk mid yang dilacak
+        now = time.perf_counter()
+        reason_code = getattr(reason_code, 'value', reason_code) or 0
+        with self._condition:
+            pending = self._inflight.pop(mid, None)
+            if pending is None:
+                if len(self._early_acks) >= 1024:
+                    self._early_acks.clear() # Ack QoS 0 atau publish di luar jendela yang tidak pernah diambil
+                self._early_acks[mid] = (now, reason_code)
+                return None
+            topic, sent_at = pending
+            latency = now - sent_at
+            self._complete(topic, latency, reason_code, now)
+            return topic, latency
+
+    def _complete(self, topic, latency, reason_code, now):
+        self._slots -= 1
+        self.stats['acked'] += 1
+        if self._recovery_acks:
+            self._recovery_acks -= 1
+        if reason_code == REASON_QUOTA_EXCEEDED:
+            self.stats['quota_exceeded'] += 1
+            self._shrink()
+        elif reason_code >= 0x80:
+            self.stats['rejected'] += 1
+        else:
+            self._update_latency(latency, now)
+        self._condition.notify()
+        return latency
+
+    def _update_latency(self, latency, now):
+        if self.smoothed_latency is None:
+            self.smoothed_latency = latency
+        else:
+            self.smoothed_latency += 0.125 * (latency - self.smoothed_latency)
+        if self._period_min is None or latency < self._period_min:
+            self._period_min = latency
+        if self.base_latency is None or latency < self.base_latency:
+            self.base_latency = latency
+        elif now - self._base_latency_at > self.base_latency_period:
+            # Ukur ulang dari minimum periode terakhir, misalnya setelah rute ke broker berubah
+            self.base_latency = self._period_min
+            self._base_latency_at = now
+            self._period_min = None
+        smoothed = self.smoothed_latency
+        if smoothed > self.latency_floor and self.window * (1 - self.base_latency / smoothed) > self.queue_threshold:
+            self._shrink()
+        elif self.window < self.ssthresh:
+            self.window = min(self.limit, self.window + self.increase)
+        else:
+            self.window = min(self.limit, self.window + self.increase / self.window)
+
+    def _shrink(self):
+        # Pesan yang sudah in-flight saat jendela dikecilkan masih membawa latency lama;
+        # tunggu sampai satu jendela ack lewat sebelum mengecilkan lagi
+        if self._recovery_acks:
+            return
+        self.window = max(self.minimum, self.window * self.decrease)
+        self.ssthresh = self.window
+        self._recovery_acks = max(self._slots, int(self.window))
+        self.stats['decreases'] += 1
+
+    def in_flight(self):
+        return self._slots
+
+    def snapshot(self):
+        with self._condition:
+            stats = dict(self.stats)
+            stats.update(
+                window=int(self.window),
+                limit=self.limit,
+                in_flight=self._slots,
+                latency_ms=self.smoothed_latency * 1000 if self.smoothed_latency is not None else None,
+                base_latency_ms=self.base_latency * 1000 if self.base_latency is not None else None
+            )
+        return stats
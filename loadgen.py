@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import json
+import math
+import platform
+import random
+import sys
+import time
+from importlib.metadata import version
+
+import paho.mqtt.client as mqtt
+
+import mqtt_asyncio
+from benchmark import percentiles
+from codec import encode_payload, decode_payload
+from local_broker import LocalBroker
+from mqtt_asyncio import AsyncPublisher, AsyncSubscriber, YOUR_UNIQUE_TOPIC_PREFIX
+from mqtt_logging import get_logger, setup_logging
+
+# Load generator: N device virtual lewat sejumlah koneksi asyncio (mqtt_asyncio.py), dengan
+# jadwal kedatangan poisson/constant/bursty, campuran QoS, distribusi ukuran payload, dan
+# trafik request-response. Jadwalnya open-loop: jika sistem tidak mampu mengikuti, kedatangan
+# yang melebihi --max-outstanding per koneksi dihitung sebagai drop, bukan ditunda.
+
+DEFAULT_TOPIC = "{prefix}/loadgen/{device}"
+LATENCY_RESERVOIR = 100000 # Sampel latency total per jenis (reservoir sampling), agar memori tetap
+DRAIN_TIMEOUT = 10 # Detik menunggu publish/request yang masih berjalan setelah durasi habis
+PROBE_GRACE = 2 # Detik menunggu pesan terakhir sampai di probe
+
+logger = get_logger("loadgen")
+
+
+def parse_qos_mix(text):
+    # "0=0.7,1=0.25,2=0.05" -> ([0, 1, 2], [0.7, 0.25, 0.05])
+    levels, weights = [], []
+    for part in text.split(","):
+        qos, weight = part.split("=")
+        if int(qos) not in (0, 1, 2):
+            raise ValueError(f"Invalid QoS level in --qos-mix: {qos}")
+        levels.append(int(qos))
+        weights.append(float(weight))
+    return levels, weights
+
+
+def parse_size(text):
+    # fixed:N | uniform:MIN:MAX | lognormal:MEDIAN:SIGMA -> fungsi rng -> ukuran bytes
+    kind, *params = text.split(":")
+    if kind == "fixed" and len(params) == 1:
+        size = int(params[0])
+        return lambda rng: size
+    if kind == "uniform" and len(params) == 2:
+        low, high = int(params[0]), int(params[1])
+        return lambda rng: rng.randint(low, high)
+    if kind == "lognormal" and len(params) == 2:
+        mu, sigma = math.log(float(params[0])), float(params[1])
+        return lambda rng: int(rng.lognormvariate(mu, sigma))
+    raise ValueError(f"Invalid --payload-size: {text}")
+
+
+class Schedule:
+    # Laju total (pesan/detik) sebagai fungsi waktu; bursty = burst_factor x laju selama
+    # burst_duration di awal setiap burst_period, laju di luar burst diturunkan agar rata-ratanya tetap
+    def __init__(self, kind, rate, burst_factor=5.0, burst_duration=1.0, burst_period=10.0):
+        if kind not in ("poisson", "constant", "bursty"):
+            raise ValueError(f"Unknown schedule: {kind}")
+        self.kind = kind
+        self.rate = rate
+        self.burst_factor = burst_factor
+        self.burst_duration = burst_duration
+        self.burst_period = burst_period
+        self.off_rate = max(0.0, rate * (burst_period - burst_factor * burst_duration) / (burst_period - burst_duration)) if kind == "bursty" else rate
+
+    def rate_at(self, t):
+        if self.kind != "bursty":
+            return self.rate
+        return self.rate * self.burst_factor if t % self.burst_period < self.burst_duration else self.off_rate
+
+    def mean_rate(self, start, end, samples=100):
+        step = (end - start) / samples
+        return sum(self.rate_at(start + (i + 0.5) * step) for i in range(samples)) / samples
+
+    def next_gap(self, t, rng):
+        rate = self.rate_at(t)
+        if rate <= 0:
+            return self.burst_period - t % self.burst_period # Tunggu burst berikutnya
+        if self.kind == "constant":
+            return 1.0 / rate
+        gap = rng.expovariate(rate)
+        if self.kind == "bursty" and t % self.burst_period < self.burst_duration:
+            gap = min(gap, self.burst_duration - t % self.burst_period + 1e-9) # Jangan lewati akhir burst dengan laju burst
+        return gap
+
+
+class LoadStats:
+    COUNTERS = ('scheduled', 'sent', 'requests', 'dropped', 'failed', 'timeouts', 'received', 'bytes')
+    LATENCIES = ('ack', 'rtt', 'e2e')
+
+    def __init__(self, rng):
+        self._rng = rng
+        self.totals = dict.fromkeys(self.COUNTERS, 0)
+        self.samples = {kind: [] for kind in self.LATENCIES}
+        self.seen = dict.fromkeys(self.LATENCIES, 0)
+        self.reset_interval()
+
+    def reset_interval(self):
+        interval = (dict.fromkeys(self.COUNTERS, 0), {kind: [] for kind in self.LATENCIES})
+        self.interval = interval
+        return interval
+
+    def count(self, name, n=1):
+        self.totals[name] += n
+        self.interval[0][name] += n
+
+    def latency(self, kind, seconds):
+        self.interval[1][kind].append(seconds)
+        self.seen[kind] += 1
+        samples = self.samples[kind]
+        if len(samples) < LATENCY_RESERVOIR:
+            samples.append(seconds)
+        else:
+            index = self._rng.randrange(self.seen[kind])
+            if index < LATENCY_RESERVOIR:
+                samples[index] = seconds
+
+
+async def run_responder(requests, publisher):
+    # Responder sederhana di proses yang sama untuk broker lokal (pengganti subscriber.py)
+    async with requests:
+        async for msg in requests:
+            request_data = decode_payload(msg.payload, msg.properties)
+            properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+            properties.CorrelationData = msg.properties.CorrelationData
+            response = {'request_id': request_data.get('request_id'), 'status': 'success', 'timestamp': time.time(),
+                        'data': {'result': {'device_id': request_data.get('device_id'), 'online': True}}}
+            asyncio.ensure_future(publisher.publish(msg.properties.ResponseTopic, response, qos=1, properties=properties))
+
+
+async def run_probe(subscription, stats):
+    async for msg in subscription:
+        try:
+            data = decode_payload(msg.payload, msg.properties)
+            stats.latency('e2e', time.time() - data['timestamp'])
+        except (ValueError, KeyError, TypeError):
+            pass
+        stats.count('received')
+
+
+async def generate(args, host, port):
+    rng = random.Random(args.seed)
+    stats = LoadStats(rng)
+    schedule = Schedule(args.schedule, args.devices * args.rate, args.burst_factor, args.burst_duration, args.burst_period)
+    qos_levels, qos_weights = parse_qos_mix(args.qos_mix)
+    payload_size = parse_size(args.payload_size)
+    topic_template = args.topic.replace("{prefix}", YOUR_UNIQUE_TOPIC_PREFIX)
+    run_id = f"{int(time.time())}{random.randint(0, 999)}"
+
+    publishers = [AsyncPublisher(f"loadgen_{run_id}_{i}", max_inflight=args.max_inflight, use_tls=args.tls) for i in range(args.connections)]
+    helpers = []
+    background = []
+    connect_args = dict(host=host, port=port, username=args.username, password=args.password)
+    await asyncio.gather(*(publisher.connect(**connect_args) for publisher in publishers))
+    if args.responder:
+        responder_subscriber = AsyncSubscriber(f"loadgen_{run_id}_responder", use_tls=args.tls)
+        responder_publisher = AsyncPublisher(f"loadgen_{run_id}_responder_pub", use_tls=args.tls)
+        requests = await responder_subscriber.subscribe(mqtt_asyncio.REQUEST_TOPIC, qos=1) # Di-subscribe saat connect
+        await asyncio.gather(responder_subscriber.connect(**connect_args), responder_publisher.connect(**connect_args))
+        helpers += [responder_subscriber, responder_publisher]
+        background.append(asyncio.ensure_future(run_responder(requests, responder_publisher)))
+    if args.probe:
+        probe = AsyncSubscriber(f"loadgen_{run_id}_probe", use_tls=args.tls)
+        probe_filter = topic_template.replace("{device}", "+").replace("{qos}", "+")
+        subscription = await probe.subscribe(probe_filter, qos=max(qos_levels), maxsize=args.max_outstanding * args.connections)
+        await probe.connect(**connect_args)
+        helpers.append(probe)
+        background.append(asyncio.ensure_future(run_probe(subscription, stats)))
+
+    outstanding = [0] * args.connections
+    sequence = [0] * args.devices
+    tasks = set()
+
+    async def send_one(index, device, qos, size, is_request):
+        publisher = publishers[index]
+        start = time.perf_counter()
+        try:
+            if is_request:
+                await publisher.request({'action': 'get_device_status', 'device_id': f"device_{device}"}, timeout=args.request_timeout)
+                stats.latency('rtt', time.perf_counter() - start)
+                stats.count('requests')
+            else:
+                sequence[device] += 1
+                data = {'device_id': f"device_{device}", 'seq': sequence[device], 'timestamp': time.time(), 'value': rng.random()}
+                properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+                payload = encode_payload(data, properties)
+                if size > len(payload):
+                    data['pad'] = "x" * (size - len(payload) - 10) # 10 = overhead JSON field 'pad'
+                    payload = encode_payload(data, properties)
+                topic = topic_template.format(device=device, qos=qos)
+                await publisher.publish(topic, payload, qos=qos, properties=properties)
+                stats.latency('ack', time.perf_counter() - start)
+                stats.count('sent')
+                stats.count('bytes', len(payload))
+        except asyncio.TimeoutError:
+            stats.count('timeouts')
+        except (ConnectionError, RuntimeError):
+            stats.count('failed')
+        finally:
+            outstanding[index] -= 1
+
+    def fire():
+        stats.count('scheduled')
+        device = rng.randrange(args.devices)
+        index = device % args.connections
+        if outstanding[index] >= args.max_outstanding:
+            stats.count('dropped')
+            return
+        outstanding[index] += 1
+        is_request = rng.random() < args.request_ratio
+        qos = rng.choices(qos_levels, qos_weights)[0]
+        task = asyncio.ensure_future(send_one(index, device, qos, payload_size(rng), is_request))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+    timeline = []
+
+    async def report():
+        last = 0.0
+        while True:
+            await asyncio.sleep(args.report_interval)
+            now = loop.time() - start
+            counters, latencies = stats.interval
+            stats.reset_interval()
+            elapsed = now - last
+            entry = {
+                't': round(now, 3),
+                'target_rate': schedule.mean_rate(last, now),
+                'achieved_rate': (counters['sent'] + counters['requests']) / elapsed,
+                **counters,
+                'outstanding': sum(outstanding),
+                'latency_ms': {kind: percentiles(values) for kind, values in latencies.items() if values}
+            }
+            timeline.append(entry)
+            last = now
+            latency = " ".join(f"{kind} p50/p99={entry['latency_ms'][kind]['p50']:.1f}/{entry['latency_ms'][kind]['p99']:.1f}ms" for kind in entry['latency_ms'])
+            logger.info(f"Loadgen: t={now:.0f}s target={entry['target_rate']:.0f}/s achieved={entry['achieved_rate']:.0f}/s "
+                        f"dropped={counters['dropped']} failed={counters['failed']} timeouts={counters['timeouts']} "
+                        f"outstanding={entry['outstanding']} {latency}")
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    reporter = asyncio.ensure_future(report())
+    next_arrival = 0.0
+    while True:
+        now = loop.time() - start
+        if now >= args.duration:
+            break
+        # Semua kedatangan yang sudah jatuh tempo dikirim sekaligus; resolusi sleep tidak menurunkan laju
+        while next_arrival <= now and next_arrival < args.duration:
+            fire()
+            next_arrival += schedule.next_gap(next_arrival, rng)
+        await asyncio.sleep(max(0.0, min(next_arrival - now, 0.05)))
+
+    if tasks:
+        await asyncio.wait(set(tasks), timeout=DRAIN_TIMEOUT)
+    if args.probe:
+        await asyncio.sleep(PROBE_GRACE)
+    reporter.cancel()
+    for task in background:
+        task.cancel()
+    await asyncio.gather(*(client.disconnect() for client in publishers + helpers))
+
+    totals = dict(stats.totals)
+    elapsed = loop.time() - start
+    totals['target_rate'] = schedule.rate
+    totals['achieved_rate'] = (totals['sent'] + totals['requests']) / args.duration
+    if args.probe:
+        totals['lost'] = max(0, totals['sent'] - totals['received'])
+    totals['latency_ms'] = {kind: percentiles(values) for kind, values in stats.samples.items() if values}
+    totals['elapsed_s'] = elapsed
+    return {'totals': totals, 'timeline': timeline}
+
+
+def run(args):
+    broker = None
+    if args.host is None:
+        broker = LocalBroker()
+        host, port = broker.start()
+    else:
+        host, port = args.host, args.port
+    if args.responder is None:
+        args.responder = broker is not None # Broker eksternal: request dijawab subscriber.py
+    try:
+        results = asyncio.run(generate(args, host, port))
+    finally:
+        if broker is not None:
+            broker.stop()
+    return {
+        'meta': {
+            'timestamp': time.time(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'paho_mqtt': version('paho-mqtt'),
+            'broker': 'local' if broker is not None else f'{host}:{port}',
+            'config': vars(args)
+        },
+        'results': results
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Virtual-device MQTT load generator with sustained and bursty schedules")
+    parser.add_argument("--devices", type=int, default=1000, help="number of virtual devices")
+    parser.add_argument("--connections", type=int, default=10, help="MQTT connections shared by the devices")
+    parser.add_argument("--rate", type=float, default=1.0, help="messages per second per device")
+    parser.add_argument("--duration", type=float, default=30, help="seconds to generate load")
+    parser.add_argument("--schedule", choices=("poisson", "constant", "bursty"), default="poisson")
+    parser.add_argument("--burst-factor", type=float, default=5.0, help="rate multiplier during a burst")
+    parser.add_argument("--burst-duration", type=float, default=1.0, help="seconds per burst")
+    parser.add_argument("--burst-period", type=float, default=10.0, help="seconds between burst starts")
+    parser.add_argument("--qos-mix", default="0=0.7,1=0.25,2=0.05", help="QoS weights, e.g. 0=0.7,1=0.25,2=0.05")
+    parser.add_argument("--payload-size", default="uniform:64:512", help="fixed:N, uniform:MIN:MAX or lognormal:MEDIAN:SIGMA")
+    parser.add_argument("--request-ratio", type=float, default=0.05, help="fraction of arrivals sent as get_device_status requests")
+    parser.add_argument("--request-timeout", type=float, default=10)
+    parser.add_argument("--topic", default=DEFAULT_TOPIC, help="topic template with {prefix}, {device} and {qos}")
+    parser.add_argument("--max-outstanding", type=int, default=1000, help="unfinished sends per connection before arrivals are dropped")
+    parser.add_argument("--max-inflight", type=int, default=mqtt_asyncio.MAX_INFLIGHT, help="unacked QoS 1/2 publishes per connection")
+    parser.add_argument("--probe", action="store_true", help="subscribe to the generated topics and measure end-to-end latency and loss")
+    parser.add_argument("--responder", action=argparse.BooleanOptionalAction, default=None,
+                        help="answer requests in-process (default: only with the local broker)")
+    parser.add_argument("--report-interval", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--host", default=None, help="use an external broker instead of the in-process one")
+    parser.add_argument("--port", type=int, default=1883)
+    parser.add_argument("--tls", action="store_true")
+    parser.add_argument("--username", default=mqtt_asyncio.USERNAME)
+    parser.add_argument("--password", default=mqtt_asyncio.PASSWORD)
+    parser.add_argument("--output", default=None, help="write the JSON report to this file")
+    args = parser.parse_args()
+    setup_logging(stream=sys.stderr) # Laporan per interval di stderr, JSON di stdout
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(report + "\n")
+    sys.stdout.write(report + "\n")
@@ -0,0 +1,362 @@
+import argparse
+import asyncio
+import itertools
+import struct
+import time
+from collections import deque
+from threading import Thread, Event
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties, VariableByteIntegers
+
+from topic_router import topic_matches
+
+# Broker MQTT v5 minimal yang berjalan di dalam proses (asyncio di thread sendiri).
+# Cukup untuk benchmark dan pengujian lokal: CONNECT, PUBLISH QoS 0/1/2, retained,
+# SUBSCRIBE/UNSUBSCRIBE dengan wildcard dan $share, PING, will message,
+# Topic Alias, Subscription Identifier, MessageExpiryInterval dan Receive Maximum dari klien.
+# Tidak ada persistensi, autentikasi, atau retransmisi.
+
+CONNECT, CONNACK, PUBLISH, PUBACK, PUBREC, PUBREL, PUBCOMP = 1, 2, 3, 4, 5, 6, 7
+SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 8, 9, 10, 11, 12, 13, 14
+DEFAULT_TOPIC_ALIAS_MAXIMUM = 64
+DEFAULT_RECEIVE_MAXIMUM = 1024
+
+
+def _read_utf(buffer, offset):
+    (length,) = struct.unpack_from("!H", buffer, offset)
+    offset += 2
+    return bytes(buffer[offset:offset + length]).decode(), offset + length
+
+
+def _read_bytes(buffer, offset):
+    (length,) = struct.unpack_from("!H", buffer, offset)
+    offset += 2
+    return bytes(buffer[offset:offset + length]), offset + length
+
+
+def _read_properties(packet_type, buffer, offset):
+    properties = Properties(packet_type)
+    _, length = properties.unpack(bytes(buffer[offset:]))
+    return properties, offset + length
+
+
+def _packet(packet_type, flags, body):
+    return bytes(((packet_type << 4) | flags,)) + VariableByteIntegers.encode(len(body)) + body
+
+
+def _with_subscription_ids(properties, subscription_ids):
+    # Properties PUBLISH yang sudah di-pack, ditambah SubscriptionIdentifier dari langganan yang cocok
+    properties.SubscriptionIdentifier = subscription_ids
+    packed = properties.pack()
+    del properties.SubscriptionIdentifier
+    return packed
+
+
+def _utf(value):
+    data = value.encode()
+    return struct.pack("!H", len(data)) + data
+
+
+class _Session:
+    def __init__(self, broker, reader, writer):
+        self.broker = broker
+        self.reader = reader
+        self.writer = writer
+        self.client_id = None
+        self.subscriptions = {} # filter -> qos
+        self.subscription_ids = {} # filter -> SubscriptionIdentifier
+        self.topic_aliases = {}
+        self.receive_maximum = 65535
+        self.inflight = set()
+        self.backlog = deque()
+        self.incoming_qos2 = set()
+        self.will = None
+        self._packet_ids = itertools.cycle(range(1, 65536))
+
+    def send(self, data):
+        self.writer.write(data)
+
+    def next_packet_id(self):
+        while True:
+            packet_id = next(self._packet_ids)
+            if packet_id not in self.inflight:
+                return packet_id
+
+    def deliver(self, topic, payload, qos, retain, properties):
+        if qos > 0 and len(self.inflight) >= self.receive_maximum:
+            self.backlog.append((topic, payload, qos, retain, properties))
+            return
+        self._send_publish(topic, payload, qos, retain, properties)
+
+    def _send_publish(self, topic, payload, qos, retain, properties):
+        body = _utf(topic)
+        if qos > 0:
+            packet_id = self.next_packet_id()
+            self.inflight.add(packet_id)
+            body += struct.pack("!H", packet_id)
+        body += properties + payload
+        self.send(_packet(PUBLISH, (qos << 1) | int(retain), body))
+
+    def release(self, packet_id):
+        self.inflight.discard(packet_id)
+        while self.backlog and len(self.inflight) < self.receive_maximum:
+            self._send_publish(*self.backlog.popleft())
+
+
+class LocalBroker:
+    def __init__(self, host="127.0.0.1", port=0, topic_alias_maximum=DEFAULT_TOPIC_ALIAS_MAXIMUM,
+                 receive_maximum=DEFAULT_RECEIVE_MAXIMUM):
+        self.host = host
+        self.port = port
+        self.topic_alias_maximum = topic_alias_maximum
+        self.receive_maximum = receive_maximum
+        self.sessions = set()
+        self.retained = {} # topic -> (payload, qos, properties, expires_at)
+        self.shared_groups = {} # (group, filter) -> {'members': [(session, qos)], 'next': int}
+        self.stats = {'connections': 0, 'publish_in': 0, 'publish_out': 0}
+        self._loop = None
+        self._server = None
+        self._thread = None
+        self._started = Event()
+
+    # --- lifecycle ---
+    def start(self):
+        self._thread = Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self.host, self.port
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(self._handle_client, self.host, self.port))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        self._server.close()
+        self._loop.run_until_complete(self._server.wait_closed())
+        self._loop.close()
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._close_all)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+    def _close_all(self):
+        for session in list(self.sessions):
+            session.writer.close()
+
+    # --- koneksi ---
+    async def _read_packet(self, reader):
+        header = await reader.readexactly(1)
+        multiplier, length = 1, 0
+        while True:
+            byte = (await reader.readexactly(1))[0]
+            length += (byte & 0x7F) * multiplier
+            if not byte & 0x80:
+                break
+            multiplier *= 128
+        body = await reader.readexactly(length) if length else b""
+        return header[0] >> 4, header[0] & 0x0F, memoryview(body)
+
+    async def _handle_client(self, reader, writer):
+        session = _Session(self, reader, writer)
+        clean = False
+        try:
+            packet_type, _, body = await self._read_packet(reader)
+            if packet_type != CONNECT:
+                return
+            self._handle_connect(session, body)
+            self.sessions.add(session)
+            self.stats['connections'] += 1
+            while True:
+                packet_type, flags, body = await self._read_packet(reader)
+                if packet_type == DISCONNECT:
+                    clean = not (len(body) and body[0] == 0x04) # 0x04 = Disconnect with Will Message
+                    break
+                self._dispatch(session, packet_type, flags, body)
+                if writer.transport.get_write_buffer_size() > 1024 * 1024:
+                    await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.sessions.discard(session)
+            self._remove_shared(session)
+            if session.will is not None and not clean:
+                self._route(*session.will)
+            writer.close()
+
+    def _handle_connect(self, session, body):
+        _, offset = _read_utf(body, 0)
+        offset += 1 # protocol level
+        flags = body[offset]
+        offset += 3 # flags + keepalive
+        properties, offset = _read_properties(PacketTypes.CONNECT, body, offset)
+        session.receive_maximum = getattr(properties, 'ReceiveMaximum', 65535)
+        session.client_id, offset = _read_utf(body, offset)
+        if flags & 0x04:
+            will_properties, offset = _read_properties(PacketTypes.WILLMESSAGE, body, offset)
+            will_topic, offset = _read_utf(body, offset)
+            will_payload, offset = _read_bytes(body, offset)
+            publish_properties = Properties(PacketTypes.PUBLISH)
+            for name in ('ContentType', 'ResponseTopic', 'CorrelationData', 'MessageExpiryInterval', 'PayloadFormatIndicator'):
+                if hasattr(will_properties, name):
+                    setattr(publish_properties, name, getattr(will_properties, name))
+            session.will = (will_topic, will_payload, (flags >> 3) & 0x03, bool(flags & 0x20), publish_properties)
+        connack_properties = Properties(PacketTypes.CONNACK)
+        connack_properties.TopicAliasMaximum = self.topic_alias_maximum
+        connack_properties.ReceiveMaximum = self.receive_maximum
+        session.send(_packet(CONNACK, 0, b"\x00\x00" + connack_properties.pack()))
+
+    def _dispatch(self, session, packet_type, flags, body):
+        if packet_type == PUBLISH:
+            self._handle_publish(session, flags, body)
+        elif packet_type in (PUBACK, PUBCOMP):
+            session.release(struct.unpack_from("!H", body)[0])
+        elif packet_type == PUBREC:
+            session.send(_packet(PUBREL, 0x02, bytes(body[:2]) + b"\x00"))
+        elif packet_type == PUBREL:
+            packet_id = struct.unpack_from("!H", body)[0]
+            session.incoming_qos2.discard(packet_id)
+            session.send(_packet(PUBCOMP, 0, bytes(body[:2]) + b"\x00"))
+        elif packet_type == SUBSCRIBE:
+            self._handle_subscribe(session, body)
+        elif packet_type == UNSUBSCRIBE:
+            self._handle_unsubscribe(session, body)
+        elif packet_type == PINGREQ:
+            session.send(_packet(PINGRESP, 0, b""))
+
+    def _handle_publish(self, session, flags, body):
+        qos = (flags >> 1) & 0x03
+        retain = bool(flags & 0x01)
+        topic, offset = _read_utf(body, 0)
+        packet_id = None
+        if qos:
+            (packet_id,) = struct.unpack_from("!H", body, offset)
+            offset += 2
+        properties, offset = _read_properties(PacketTypes.PUBLISH, body, offset)
+        payload = bytes(body[offset:])
+        alias = getattr(properties, 'TopicAlias', None)
+        if alias is not None:
+            if topic:
+                session.topic_aliases[alias] = topic
+            else:
+                topic = session.topic_aliases.get(alias)
+            del properties.TopicAlias
+        self.stats['publish_in'] += 1
+        if qos == 1:
+            session.send(_packet(PUBACK, 0, struct.pack("!HB", packet_id, 0)))
+        elif qos == 2:
+            session.send(_packet(PUBREC, 0, struct.pack("!HB", packet_id, 0)))
+            if packet_id in session.incoming_qos2:
+                return # Duplikat QoS 2, sudah diteruskan
+            session.incoming_qos2.add(packet_id)
+        if topic is None:
+            return
+        if retain:
+            if payload:
+                interval = getattr(properties, 'MessageExpiryInterval', None)
+                expires_at = time.monotonic() + interval if interval is not None else None
+                self.retained[topic] = (payload, qos, properties, expires_at)
+            else:
+                self.retained.pop(topic, None)
+        self._route(topic, payload, qos, retain, properties)
+
+    def _route(self, topic, payload, qos, retain, properties):
+        packed = properties.pack()
+        for session in list(self.sessions):
+            granted = None
+            subscription_ids = []
+            for topic_filter, sub_qos in session.subscriptions.items():
+                if topic_matches(topic_filter, topic):
+                    granted = sub_qos if granted is None else max(granted, sub_qos)
+                    if topic_filter in session.subscription_ids:
+                        subscription_ids.append(session.subscription_ids[topic_filter])
+            if granted is not None:
+                # Retain flag hanya dipertahankan untuk pesan retained yang dikirim saat subscribe
+                session_packed = _with_subscription_ids(properties, subscription_ids) if subscription_ids else packed
+                session.deliver(topic, payload, min(qos, granted), False, session_packed)
+                self.stats['publish_out'] += 1
+        for (group, topic_filter), shared in self.shared_groups.items():
+            if shared['members'] and topic_matches(topic_filter, topic):
+                index = shared['next'] % len(shared['members'])
+                shared['next'] = index + 1
+                member, sub_qos = shared['members'][index]
+                member.deliver(topic, payload, min(qos, sub_qos), False, packed)
+                self.stats['publish_out'] += 1
+
+    def _handle_subscribe(self, session, body):
+        (packet_id,) = struct.unpack_from("!H", body)
+        subscribe_properties, offset = _read_properties(PacketTypes.SUBSCRIBE, body, 2)
+        subscription_id = getattr(subscribe_properties, 'SubscriptionIdentifier', [None])[0]
+        reason_codes = []
+        new_filters = []
+        while offset < len(body):
+            topic_filter, offset = _read_utf(body, offset)
+            options = body[offset]
+            offset += 1
+            qos = options & 0x03
+            if topic_filter.startswith("$share/"):
+                _, group, shared_filter = topic_filter.split("/", 2)
+                shared = self.shared_groups.setdefault((group, shared_filter), {'members': [], 'next': 0})
+                shared['members'] = [m for m in shared['members'] if m[0] is not session] + [(session, qos)]
+            else:
+                session.subscriptions[topic_filter] = qos
+                if subscription_id is not None:
+                    session.subscription_ids[topic_filter] = subscription_id
+                else:
+                    session.subscription_ids.pop(topic_filter, None)
+                new_filters.append((topic_filter, qos))
+            reason_codes.append(qos)
+        session.send(_packet(SUBACK, 0, struct.pack("!H", packet_id) + b"\x00" + bytes(reason_codes)))
+        now = time.monotonic()
+        for topic, (payload, qos, properties, expires_at) in list(self.retained.items()):
+            if expires_at is not None and expires_at <= now:
+                del self.retained[topic]
+                continue
+            for topic_filter, sub_qos in new_filters:
+                if topic_matches(topic_filter, topic):
+                    if expires_at is not None:
+                        properties.MessageExpiryInterval = max(0, int(expires_at - now))
+                    packed = _with_subscription_ids(properties, [subscription_id]) if subscription_id is not None else properties.pack()
+                    session.deliver(topic, payload, min(qos, sub_qos), True, packed)
+                    break
+
+    def _handle_unsubscribe(self, session, body):
+        (packet_id,) = struct.unpack_from("!H", body)
+        _, offset = _read_properties(PacketTypes.UNSUBSCRIBE, body, 2)
+        reason_codes = []
+        while offset < len(body):
+            topic_filter, offset = _read_utf(body, offset)
+            if topic_filter.startswith("$share/"):
+                _, group, shared_filter = topic_filter.split("/", 2)
+                shared = self.shared_groups.get((group, shared_filter))
+                if shared:
+                    shared['members'] = [m for m in shared['members'] if m[0] is not session]
+                reason_codes.append(0x00 if shared else 0x11)
+            else:
+                session.subscription_ids.pop(topic_filter, None)
+                reason_codes.append(0x00 if session.subscriptions.pop(topic_filter, None) is not None else 0x11)
+        session.send(_packet(UNSUBACK, 0, struct.pack("!H", packet_id) + b"\x00" + bytes(reason_codes)))
+
+    def _remove_shared(self, session):
+        for shared in self.shared_groups.values():
+            shared['members'] = [m for m in shared['members'] if m[0] is not session]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local in-process MQTT v5 broker for tests and benchmarks")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=1883)
+    args = parser.parse_args()
+    broker = LocalBroker(args.host, args.port)
+    host, port = broker.start()
+    print(f"Local broker: Listening on {host}:{port}, press Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        broker.stop()
+        print("Local broker: Stopped.")
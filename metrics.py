@@ -0,0 +1,242 @@
+import json
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread, Event
+
+# Instrumentasi ringan: histogram dengan bucket tetap (kelipatan 2 dari 1 us
+# sampai ~67 detik) dan counter, dikelompokkan per nama dan label. Satu
+# observe() hanya bisect + increment tanpa lock: di bawah GIL increment yang
+# hilang saat dua thread menulis metrik yang sama sangat jarang, dan itu harga
+# yang diterima agar overhead per pesan tetap di bawah satu mikrodetik.
+
+DEFAULT_BUCKETS = tuple(1e-6 * 2 ** i for i in range(27))
+MAX_TOPIC_LABELS = 1000 # Di atas ini topik baru dicatat sebagai topic="other"
+OTHER_TOPIC = "other"
+
+
+class Histogram:
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1) # bucket terakhir = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        counts = list(self.counts)
+        return {'buckets': counts, 'sum': self.sum, 'count': sum(counts)}
+
+    def percentile(self, percent):
+        # Perkiraan dari batas atas bucket
+        counts = list(self.counts)
+        total = sum(counts)
+        if not total:
+            return None
+        target = percent / 100.0 * total
+        running = 0
+        for index, count in enumerate(counts):
+            running += count
+            if running >= target:
+                return self.bounds[index] if index < len(self.bounds) else float('inf')
+        return float('inf')
+
+
+class Counter:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(key, extra=()):
+    items = list(key) + list(extra)
+    if not items:
+        return ""
+    escaped = (f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"' for name, value in items)
+    return "{" + ",".join(escaped) + "}"
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="mqtt"):
+        self.prefix = prefix
+        self._histograms = {} # (name, label_key) -> Histogram
+        self._counters = {} # (name, label_key) -> Counter
+        self._gauges = {} # (name, label_key) -> callable
+        self._topics = set()
+        self._stages = {} # (stage, topic) -> Histogram, jalur cepat untuk stage()
+        self._lock = Lock()
+
+    def topic_label(self, topic):
+        # Batasi kardinalitas label topik agar memori tetap rata
+        if topic in self._topics:
+            return topic
+        with self._lock:
+            if len(self._topics) < MAX_TOPIC_LABELS:
+                self._topics.add(topic)
+                return topic
+        return OTHER_TOPIC
+
+    def histogram(self, name, **labels):
+        key = (name, _label_key(labels))
+        histogram = self._histograms.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._histograms.setdefault(key, Histogram())
+        return histogram
+
+    def counter(self, name, **labels):
+        key = (name, _label_key(labels))
+        counter = self._counters.get(key)
+        if counter is None:
+            with self._lock:
+                counter = self._counters.setdefault(key, Counter())
+        return counter
+
+    def gauge(self, name, fn, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = fn
+
+    def stage(self, stage, topic):
+        # Histogram latency per tahap (enqueue, dequeue, decode, process, ack) dan per topik
+        histogram = self._stages.get((stage, topic))
+        if histogram is None:
+            histogram = self.histogram("stage_seconds", stage=stage, topic=self.topic_label(topic))
+            if len(self._stages) < 4 * MAX_TOPIC_LABELS:
+                self._stages[(stage, topic)] = histogram
+        return histogram
+
+    def snapshot(self):
+        with self._lock:
+            histograms = list(self._histograms.items())
+            counters = list(self._counters.items())
+            gauges = list(self._gauges.items())
+        result = {'timestamp': time.time(), 'histograms': [], 'counters': [], 'gauges': []}
+        for (name, key), histogram in histograms:
+            entry = histogram.snapshot()
+            entry.update(name=name, labels=dict(key))
+            result['histograms'].append(entry)
+        for (name, key), counter in counters:
+            result['counters'].append({'name': name, 'labels': dict(key), 'value': counter.value})
+        for (name, key), fn in gauges:
+            try:
+                value = fn()
+            except Exception:
+                continue
+            result['gauges'].append({'name': name, 'labels': dict(key), 'value': value})
+        result['bucket_bounds'] = list(DEFAULT_BUCKETS)
+        return result
+
+    def render_prometheus(self, snapshot=None):
+        snapshot = snapshot or self.snapshot()
+        lines = []
+        seen_types = set()
+
+        def type_line(name, kind):
+            if name not in seen_types:
+                seen_types.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        bounds = snapshot['bucket_bounds']
+        for entry in snapshot['histograms']:
+            name = f"{self.prefix}_{entry['name']}"
+            key = tuple(sorted(entry['labels'].items()))
+            type_line(name, "histogram")
+            running = 0
+            for index, count in enumerate(entry['buckets']):
+                running += count
+                le = f"{bounds[index]:.9g}" if index < len(bounds) else "+Inf"
+                lines.append(f"{name}_bucket{_format_labels(key, [('le', le)])} {running}")
+            lines.append(f"{name}_sum{_format_labels(key)} {entry['sum']}")
+            lines.append(f"{name}_count{_format_labels(key)} {entry['count']}")
+        for entry in snapshot['counters']:
+            name = f"{self.prefix}_{entry['name']}_total"
+            type_line(name, "counter")
+            lines.append(f"{name}{_format_labels(tuple(sorted(entry['labels'].items())))} {entry['value']}")
+        for entry in snapshot['gauges']:
+            name = f"{self.prefix}_{entry['name']}"
+            type_line(name, "gauge")
+            lines.append(f"{name}{_format_labels(tuple(sorted(entry['labels'].items())))} {entry['value']}")
+        return "\n".join(lines) + "\n"
+
+    def start_http_server(self, port, host="127.0.0.1", snapshot_fn=None):
+        # snapshot_fn: sumber snapshot lain, misalnya gabungan dari beberapa worker process
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render_prometheus(snapshot_fn() if snapshot_fn else None).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def publish_snapshot(self, client, topic, qos=0):
+        return client.publish(topic, json.dumps(self.snapshot()), qos=qos)
+
+    def start_mqtt_publisher(self, client, topic, interval=10.0, qos=0):
+        stop = Event()
+
+        def run():
+            while not stop.wait(interval):
+                if client.is_connected():
+                    self.publish_snapshot(client, topic, qos)
+
+        Thread(target=run, daemon=True).start()
+        return stop
+
+
+def merge_snapshots(snapshots):
+    # Gabungkan snapshot dari beberapa proses: bucket histogram, counter dan gauge dijumlahkan per nama+label
+    histograms, counters, gauges = {}, {}, {}
+    for snapshot in snapshots:
+        for entry in snapshot['histograms']:
+            key = (entry['name'], _label_key(entry['labels']))
+            merged = histograms.get(key)
+            if merged is None:
+                histograms[key] = dict(entry, buckets=list(entry['buckets']))
+            else:
+                merged['buckets'] = [a + b for a, b in zip(merged['buckets'], entry['buckets'])]
+                merged['sum'] += entry['sum']
+                merged['count'] += entry['count']
+        for target, entries in ((counters, snapshot['counters']), (gauges, snapshot['gauges'])):
+            for entry in entries:
+                key = (entry['name'], _label_key(entry['labels']))
+                if key in target:
+                    target[key]['value'] += entry['value']
+                else:
+                    target[key] = dict(entry)
+    return {
+        'timestamp': time.time(),
+        'histograms': list(histograms.values()),
+        'counters': list(counters.values()),
+        'gauges': list(gauges.values()),
+        'bucket_bounds': list(DEFAULT_BUCKETS)
+    }
+
+
+registry = MetricsRegistry()
@@ -0,0 +1,435 @@
+import asyncio
+import os
+import random
+import ssl
+import threading
+import time
+import uuid
+from functools import partial
+
+import paho.mqtt.client as mqtt
+
+from codec import encode_payload, decode_payload
+from coalescer import is_envelope, split_envelope
+from connection import ConnectionReadiness, CONNECT_TIMEOUT, create_tls_context
+from mqtt_logging import get_logger, rate_limited, setup_logging
+from topic_router import TopicRouter
+
+# Publisher dan subscriber berbasis asyncio: client paho digerakkan oleh event loop lewat
+# callback socket (on_socket_open/close/register_write), bukan oleh thread loop_start().
+# Semua callback paho berjalan di thread event loop, sehingga tidak perlu lock atau Event.
+
+# --- Configuration ---
+BROKER_HOST = os.environ.get("MQTT_BROKER_HOST", "broker.emqx.io")
+BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", "8883"))
+USE_TLS = os.environ.get("MQTT_USE_TLS", "1") != "0"
+USERNAME = "fidelanata"
+PASSWORD = "insisez"
+YOUR_UNIQUE_TOPIC_PREFIX = "insisdemomqtt"
+REQUEST_TOPIC = f"{YOUR_UNIQUE_TOPIC_PREFIX}/request"
+MISC_INTERVAL = 1.0 # Detik antar loop_misc (keepalive/PINGREQ)
+MAX_INFLIGHT = 100 # Publish QoS 1/2 yang menunggu ack sekaligus, per koneksi
+SUBSCRIPTION_BUFFER = 1000 # Pesan per subscription sebelum pembacaan socket dihentikan sementara
+REQUEST_TIMEOUT = 20
+
+logger = get_logger("mqtt_asyncio")
+warning_log = rate_limited(logger)
+
+
+def _client_id(base):
+    return f"{base}_{int(time.time())}{random.randint(0, 999)}"
+
+
+class _AsyncClient:
+    def __init__(self, client_id, max_inflight=MAX_INFLIGHT, use_tls=None):
+        self.client_id = client_id
+        self._loop = None
+        self._loop_thread = None
+        self._misc_task = None
+        self._reconnect_task = None
+        self._closing = False
+        self._paused = False
+        self._acks = {} # mid -> (asyncio.Future, qos) untuk publish yang menunggu on_publish
+        self._inflight = asyncio.Semaphore(max_inflight)
+        tls_context = create_tls_context() if (USE_TLS if use_tls is None else use_tls) else None
+        self._readiness = ConnectionReadiness(tls_context)
+        self.stats = {'published': 0, 'received': 0, 'reconnects': 0, 'read_pauses': 0}
+
+        self.client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
+        self.client.max_inflight_messages_set(max_inflight)
+        if tls_context is not None:
+            self.client.tls_set_context(tls_context)
+        self.client.on_socket_open = self._on_socket_open
+        self.client.on_socket_close = self._on_socket_close
+        self.client.on_socket_register_write = self._on_socket_register_write
+        self.client.on_socket_unregister_write = self._on_socket_unregister_write
+        self.client.on_connect = self._on_connect
+        self.client.on_disconnect = self._on_disconnect
+        self.client.on_subscribe = self._on_subscribe
+        self.client.on_publish = self._on_publish
+        self.client.on_message = self._on_message
+
+    # --- Integrasi socket dengan event loop ---
+    def _call(self, callback, *args):
+        # connect()/reconnect() berjalan di executor, callback socket-nya dijadwalkan ke event loop
+        if threading.get_ident() == self._loop_thread:
+            callback(*args)
+        else:
+            self._loop.call_soon_threadsafe(callback, *args)
+
+    def _on_socket_open(self, client, userdata, sock):
+        self._call(self._socket_opened, sock)
+
+    def _socket_opened(self, sock):
+        if not self._paused:
+            self._loop.add_reader(sock, self._on_readable)
+        if self._misc_task is None:
+            self._misc_task = self._loop.create_task(self._misc_loop())
+
+    def _on_socket_close(self, client, userdata, sock):
+        # fd diambil sekarang: jika dijadwalkan dari executor, socket sudah ditutup saat callback berjalan
+        self._call(self._socket_closed, sock.fileno())
+
+    def _socket_closed(self, fd):
+        self._loop.remove_reader(fd)
+        self._loop.remove_writer(fd)
+        if self._misc_task is not None:
+            self._misc_task.cancel()
+            self._misc_task = None
+
+    def _on_socket_register_write(self, client, userdata, sock):
+        self._call(self._loop.add_writer, sock, client.loop_write)
+
+    def _on_socket_unregister_write(self, client, userdata, sock):
+        self._call(self._loop.remove_writer, sock)
+
+    def _on_readable(self):
+        self.client.loop_read()
+        sock = self.client.socket()
+        # Record TLS yang sudah didekripsi tidak membuat socket readable lagi
+        if isinstance(sock, ssl.SSLSocket) and sock.pending() and not self._paused:
+            self._loop.call_soon(self._on_readable)
+
+    async def _misc_loop(self):
+        while True:
+            await asyncio.sleep(MISC_INTERVAL)
+            if self.client.loop_misc() != mqtt.MQTT_ERR_SUCCESS:
+                return
+
+    def pause_reading(self):
+        # Socket tidak dibaca: broker menahan pesan berikutnya (TCP), keepalive tetap dikirim
+        if not self._paused:
+            self._paused = True
+            self.stats['read_pauses'] += 1
+            sock = self.client.socket()
+            if sock is not None:
+                self._loop.remove_reader(sock)
+
+    def resume_reading(self):
+        if self._paused:
+            self._paused = False
+            sock = self.client.socket()
+            if sock is not None:
+                self._loop.add_reader(sock, self._on_readable)
+                self._loop.call_soon(self._on_readable)
+
+    # --- Koneksi ---
+    async def connect(self, host=None, port=None, keepalive=60, username=USERNAME, password=PASSWORD, timeout=CONNECT_TIMEOUT):
+        # Selesai setelah CONNACK dan SUBACK; ConnectionRefusedError jika broker menolak
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._closing = False
+        if username:
+            self.client.username_pw_set(username, password)
+        await self._loop.run_in_executor(None, partial(self.client.connect, host or BROKER_HOST, port or BROKER_PORT, keepalive))
+        await self.wait_until_ready(timeout)
+
+    async def wait_until_ready(self, timeout=CONNECT_TIMEOUT):
+        await asyncio.wait_for(asyncio.wrap_future(self._readiness.future()), timeout)
+
+    async def disconnect(self):
+        self._closing = True
+        if self._reconnect_task is not None:
+            self._reconnect_task.cancel()
+        self.client.disconnect()
+        # DISCONNECT ditulis oleh loop_write di event loop, setelah itu paho menutup socket
+        deadline = self._loop.time() + 1.0
+        while self.client.socket() is not None and self._loop.time() < deadline:
+            await asyncio.sleep(0.01)
+        self._fail_acks(lambda qos: True)
+
+    def _fail_acks(self, select):
+        for mid, (future, qos) in list(self._acks.items()):
+            if select(qos):
+                del self._acks[mid]
+                if not future.done():
+                    future.set_exception(ConnectionError("Connection to broker lost"))
+
+    def _subscriptions(self):
+        return []
+
+    def _on_connect(self, client, userdata, flags, reason_code, properties=None):
+        if reason_code != 0:
+            logger.error(f"Async client ({self.client_id}): Failed to connect, result code: {reason_code}")
+            self._readiness.refused(reason_code)
+            return
+        logger.info(f"Async client ({self.client_id}): Connected with result code: {reason_code}")
+        subscriptions = self._subscriptions()
+        mids = []
+        if subscriptions:
+            _, mid = client.subscribe(subscriptions)
+            mids.append(mid)
+        self._readiness.connected(client, mids)
+
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
+        self._readiness.subscribed(mid, reason_codes)
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
+        self._readiness.disconnected()
+        self._fail_acks(lambda qos: qos == 0) # QoS 1/2 dikirim ulang paho setelah reconnect
+        if reason_code != 0 and not self._closing and self._reconnect_task is None:
+            self._reconnect_task = self._loop.create_task(self._reconnect())
+
+    async def _reconnect(self):
+        # Exponential backoff dengan jitter (connection.py); reconnect() blocking dijalankan di executor
+        try:
+            while not self._closing:
+                delay = self._readiness.next_reconnect_delay()
+                warning_log.warning("reconnect", "Async client (%s): Connection lost, reconnecting in %.2fs", self.client_id, delay)
+                await asyncio.sleep(delay)
+                try:
+                    await self._loop.run_in_executor(None, self.client.reconnect)
+                    self.stats['reconnects'] += 1
+                    return
+                except OSError as e:
+                    warning_log.warning("reconnect_failed", "Async client (%s): Reconnect failed: %s", self.client_id, e)
+        finally:
+            self._reconnect_task = None
+
+    # --- Publish ---
+    async def publish(self, topic, payload, qos=0, retain=False, properties=None):
+        # Selesai saat pesan terkirim (QoS 0) atau di-ack broker (QoS 1/2); mengembalikan MQTTMessageInfo
+        if not isinstance(payload, (bytes, bytearray, str)):
+            properties = properties if properties is not None else mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+            payload = encode_payload(payload, properties)
+        if qos > 0:
+            await self._inflight.acquire()
+        try:
+            info = self.client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+            # QoS 1/2 tanpa koneksi diantrekan paho dan dikirim setelah reconnect
+            if info.rc == mqtt.MQTT_ERR_NO_CONN and qos == 0:
+                raise ConnectionError("Not connected to broker")
+            if info.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                raise RuntimeError(f"Publish failed, rc: {info.rc}")
+            future = self._loop.create_future()
+            self._acks[info.mid] = (future, qos)
+            await future
+            self.stats['published'] += 1
+            return info
+        finally:
+            if qos > 0:
+                self._inflight.release()
+
+    def _on_publish(self, client, userdata, mid, reason_code, properties=None):
+        future, _ = self._acks.pop(mid, (None, None))
+        if future is None or future.done():
+            return
+        if reason_code.is_failure:
+            future.set_exception(RuntimeError(f"Broker rejected publish: {reason_code}"))
+        else:
+            future.set_result(mid)
+
+    def _on_message(self, client, userdata, msg):
+        self.stats['received'] += 1
+
+    def snapshot(self):
+        return dict(self.stats, inflight=len(self._acks), paused=self._paused, connected=self._readiness.is_ready())
+
+
+class AsyncPublisher(_AsyncClient):
+    # publish() dan request() dari banyak coroutine sekaligus; setiap request hanya Future
+    # di dict, bukan thread, dan dijawab di on_message berdasarkan CorrelationData
+    def __init__(self, client_id=None, **kwargs):
+        super().__init__(client_id or _client_id("python_async_publisher"), **kwargs)
+        self.response_topic = f"{YOUR_UNIQUE_TOPIC_PREFIX}/response/{self.client_id}"
+        self._requests = {} # CorrelationData -> asyncio.Future
+
+    def _subscriptions(self):
+        return [(self.response_topic, 1)]
+
+    async def request(self, request_data, timeout=REQUEST_TIMEOUT):
+        correlation_id = str(uuid.uuid4())
+        request_data = dict(request_data, request_id=correlation_id)
+        properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+        properties.ResponseTopic = self.response_topic
+        properties.CorrelationData = correlation_id.encode()
+        future = self._loop.create_future()
+        self._requests[properties.CorrelationData] = future
+
+        async def send_and_wait():
+            await self.publish(REQUEST_TOPIC, request_data, qos=1, properties=properties)
+            return await future
+
+        # Satu deadline untuk PUBACK dan respons: tanpa koneksi, publish() QoS 1 menunggu sampai reconnect
+        try:
+            return await asyncio.wait_for(send_and_wait(), timeout)
+        finally:
+            self._requests.pop(properties.CorrelationData, None)
+
+    def _on_message(self, client, userdata, msg):
+        super()._on_message(client, userdata, msg)
+        correlation_data = getattr(msg.properties, 'CorrelationData', None) if msg.properties else None
+        future = self._requests.get(correlation_data)
+        if future is None or future.done():
+            return
+        try:
+            future.set_result(decode_payload(msg.payload, msg.properties))
+        except ValueError as e:
+            future.set_exception(e)
+
+
+class Subscription:
+    # Async iterator untuk satu topic filter. Buffer dibatasi maxsize: jika penuh, pembacaan
+    # socket dihentikan sampai buffer turun ke setengahnya, sehingga pesan tidak didrop
+    # dan broker/TCP yang menahan sisanya.
+    def __init__(self, owner, topic_filter, qos, maxsize):
+        self.topic_filter = topic_filter
+        self.qos = qos
+        self.maxsize = maxsize
+        self._owner = owner
+        self._queue = asyncio.Queue()
+        self._closed = False
+
+    def _put(self, client, msg):
+        self._queue.put_nowait(msg)
+        if self._queue.qsize() >= self.maxsize:
+            self._owner.pause_reading()
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self._closed and self._queue.empty():
+            raise StopAsyncIteration
+        msg = await self._queue.get()
+        if msg is None:
+            raise StopAsyncIteration
+        self._owner._maybe_resume()
+        return msg
+
+    async def close(self):
+        if not self._closed:
+            self._closed = True
+            await self._owner.unsubscribe(self)
+            self._queue.put_nowait(None)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+
+class AsyncSubscriber(_AsyncClient):
+    def __init__(self, client_id=None, shared_group=None, **kwargs):
+        super().__init__(client_id or _client_id("python_async_subscriber"), **kwargs)
+        self.shared_group = shared_group
+        self._router = TopicRouter()
+        self._streams = []
+        self._pending_subacks = {} # mid -> asyncio.Future untuk subscribe() setelah connect
+
+    def _broker_filter(self, topic_filter):
+        return f"$share/{self.shared_group}/{topic_filter}" if self.shared_group else topic_filter
+
+    def _subscriptions(self):
+        # Setelah reconnect semua filter di-subscribe ulang dalam satu paket SUBSCRIBE
+        qos_by_filter = {}
+        for stream in self._streams:
+            qos_by_filter[stream.topic_filter] = max(stream.qos, qos_by_filter.get(stream.topic_filter, 0))
+        return [(self._broker_filter(topic_filter), qos) for topic_filter, qos in qos_by_filter.items()]
+
+    async def subscribe(self, topic_filter, qos=1, maxsize=SUBSCRIPTION_BUFFER):
+        # Subscription siap dipakai setelah SUBACK; bisa dipanggil sebelum connect()
+        stream = Subscription(self, topic_filter, qos, maxsize)
+        self._streams.append(stream)
+        self._router.add(topic_filter, stream._put)
+        if self.client.is_connected():
+            future = self._loop.create_future()
+            _, mid = self.client.subscribe(self._broker_filter(topic_filter), qos)
+            self._pending_subacks[mid] = future
+            reason_codes = await future
+            if reason_codes[0].is_failure:
+                await stream.close()
+                raise RuntimeError(f"Broker refused subscription to {topic_filter}: {reason_codes[0]}")
+        return stream
+
+    def _on_subscribe(self, client, userdata, mid, reason_codes, properties=None):
+        future = self._pending_subacks.pop(mid, None)
+        if future is not None and not future.done():
+            future.set_result(reason_codes)
+        super()._on_subscribe(client, userdata, mid, reason_codes, properties)
+
+    def _on_disconnect(self, client, userdata, disconnect_flags, reason_code, properties=None):
+        # Filter baru tetap di-subscribe saat reconnect (lewat _subscriptions), jadi tidak perlu menunggu SUBACK lama
+        for future in self._pending_subacks.values():
+            if not future.done():
+                future.set_result([mqtt.ReasonCode(mqtt.PacketTypes.SUBACK, identifier=0)])
+        self._pending_subacks.clear()
+        super()._on_disconnect(client, userdata, disconnect_flags, reason_code, properties)
+
+    async def unsubscribe(self, stream):
+        if stream in self._streams:
+            self._streams.remove(stream)
+            self._router.remove(stream.topic_filter, stream._put)
+            if not any(other.topic_filter == stream.topic_filter for other in self._streams) and self._readiness.is_ready():
+                self.client.unsubscribe(self._broker_filter(stream.topic_filter))
+            self._maybe_resume()
+
+    def _maybe_resume(self):
+        if self._paused and all(stream.qsize() <= stream.maxsize // 2 for stream in self._streams):
+            self.resume_reading()
+
+    def _on_message(self, client, userdata, msg):
+        super()._on_message(client, userdata, msg)
+        messages = (msg,)
+        if is_envelope(msg.properties):
+            try:
+                messages = split_envelope(msg)
+            except ValueError as e:
+                warning_log.warning("undecodable", "Async subscriber (%s): Invalid batch envelope on topic %s: %s", self.client_id, msg.topic, e)
+                return
+        for handler in self._router.match(msg.topic):
+            for message in messages:
+                handler(client, message)
+
+
+async def _demo(count):
+    subscriber = AsyncSubscriber()
+    publisher = AsyncPublisher()
+    stream = await subscriber.subscribe(f"{YOUR_UNIQUE_TOPIC_PREFIX}/iot/data/#", qos=1)
+    await asyncio.gather(subscriber.connect(), publisher.connect())
+    start = time.perf_counter()
+
+    async def consume():
+        received = 0
+        async for msg in stream:
+            received += 1
+            if received == count:
+                return received
+
+    consumer = asyncio.ensure_future(consume())
+    topic = f"{YOUR_UNIQUE_TOPIC_PREFIX}/iot/data/qos1"
+    await asyncio.gather(*(publisher.publish(topic, {'device_id': f'async_{i % 64}', 'timestamp': time.time(), 'value': float(i)}, qos=1) for i in range(count)))
+    received = await asyncio.wait_for(consumer, 30)
+    elapsed = time.perf_counter() - start
+    logger.info(f"Async demo: published and received {received} QoS 1 messages in {elapsed:.2f}s ({received / elapsed:.0f} msg/s)")
+    await stream.close()
+    await asyncio.gather(subscriber.disconnect(), publisher.disconnect())
+
+
+if __name__ == "__main__":
+    setup_logging()
+    asyncio.run(_demo(int(os.environ.get("MQTT_ASYNC_DEMO_COUNT", "1000"))))
@@ -0,0 +1,142 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import sys
+from queue import SimpleQueue
+from threading import Lock
+
+from rate_limiter import TokenBucket
+
+# Logging untuk publisher/subscriber. Handler di root logger hanya memasukkan
+# record ke antrean (QueueHandler); penulisan ke stdout dikerjakan oleh thread
+# QueueListener, sehingga thread jaringan paho tidak pernah menunggu I/O.
+LOG_LEVEL = os.environ.get("MQTT_LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.environ.get("MQTT_LOG_FORMAT", "text") # "text" atau "json"
+LOG_SAMPLE_RATE = 10 # Log per detik per topik untuk event per pesan; sisanya dihitung sebagai suppressed
+LOG_SAMPLE_BURST = 20
+WARNING_RATE = 1 # Warning per detik per jenis (misalnya badai "queue is full")
+WARNING_BURST = 5
+MAX_SAMPLED_KEYS = 1000 # Di atas ini kunci baru berbagi satu bucket
+
+# Atribut bawaan LogRecord; atribut lain (dari extra=...) ditulis sebagai field terstruktur
+_RECORD_ATTRIBUTES = frozenset(logging.LogRecord("", 0, "", 0, "", (), None).__dict__) | {"message", "asctime"}
+_listener = None
+_setup_lock = Lock()
+
+
+class StructuredFormatter(logging.Formatter):
+    # Teks: "<waktu> <level> <pesan> key=value ...", JSON: satu objek per baris
+    def __init__(self, json_output=False):
+        super().__init__("%(asctime)s %(levelname)s %(message)s")
+        self.json_output = json_output
+
+    def format(self, record):
+        fields = {key: value for key, value in record.__dict__.items() if key not in _RECORD_ATTRIBUTES}
+        if self.json_output:
+            entry = {
+                'time': record.created,
+                'level': record.levelname,
+                'logger': record.name,
+                'message': record.getMessage()
+            }
+            entry.update(fields)
+            if record.exc_info:
+                entry['exception'] = self.formatException(record.exc_info)
+            return json.dumps(entry, default=str)
+        text = super().format(record)
+        if fields:
+            text += " " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return text
+
+
+def setup_logging(level=None, stream=None, json_output=None):
+    # Idempoten: pemanggilan berikutnya hanya mengubah level
+    global _listener
+    level = level or LOG_LEVEL
+    with _setup_lock:
+        root = logging.getLogger()
+        root.setLevel(level)
+        if _listener is not None:
+            return _listener
+        if json_output is None:
+            json_output = LOG_FORMAT == "json"
+        output = logging.StreamHandler(stream or sys.stdout)
+        output.setFormatter(StructuredFormatter(json_output))
+        log_queue = SimpleQueue()
+        root.addHandler(logging.handlers.QueueHandler(log_queue))
+        _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=True)
+        _listener.start()
+        atexit.register(shutdown_logging)
+        return _listener
+
+
+def shutdown_logging():
+    # Tulis sisa record di antrean lalu hentikan thread listener
+    global _listener
+    with _setup_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+class SampledLogger:
+    # Membatasi log per kunci (topik untuk event per pesan, nama event untuk warning)
+    # dengan token bucket. Log yang dilewati dihitung dan jumlahnya disebutkan di
+    # log berikutnya yang lolos untuk kunci yang sama.
+    def __init__(self, logger, rate, burst):
+        self.logger = logger
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._suppressed = {}
+        self._lock = Lock()
+
+    def _admit(self, key):
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            with self._lock:
+                if len(self._buckets) >= MAX_SAMPLED_KEYS and key not in self._buckets:
+                    key = None
+                bucket = self._buckets.setdefault(key, TokenBucket(self.rate, self.burst))
+        if bucket.try_acquire():
+            with self._lock:
+                return True, self._suppressed.pop(key, 0)
+        with self._lock:
+            self._suppressed[key] = self._suppressed.get(key, 0) + 1
+        return False, 0
+
+    def log(self, level, key, msg, *args, **kwargs):
+        # Cek level dulu agar event per pesan yang tidak aktif hampir tanpa biaya
+        if not self.logger.isEnabledFor(level):
+            return
+        allowed, suppressed = self._admit(key)
+        if not allowed:
+            return
+        if suppressed:
+            extra = dict(kwargs.pop('extra', None) or {})
+            extra['suppressed'] = suppressed
+            kwargs['extra'] = extra
+        self.logger.log(level, msg, *args, **kwargs)
+
+    def debug(self, key, msg, *args, **kwargs):
+        self.log(logging.DEBUG, key, msg, *args, **kwargs)
+
+    def info(self, key, msg, *args, **kwargs):
+        self.log(logging.INFO, key, msg, *args, **kwargs)
+
+    def warning(self, key, msg, *args, **kwargs):
+        self.log(logging.WARNING, key, msg, *args, **kwargs)
+
+
+def get_logger(name):
+    return logging.getLogger(name)
+
+
+def sampled(logger, rate=LOG_SAMPLE_RATE, burst=LOG_SAMPLE_BURST):
+    return SampledLogger(logger, rate, burst)
+
+
+def rate_limited(logger, rate=WARNING_RATE, burst=WARNING_BURST):
+    return SampledLogger(logger, rate, burst)
@@ -0,0 +1,196 @@
+import sqlite3
+import time
+from threading import Lock, Thread, Event
+
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+REASON_QUOTA_EXCEEDED = 0x97 # Broker menolak sementara; pesan tetap di outbox untuk replay
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    topic TEXT NOT NULL,
+    payload BLOB NOT NULL,
+    qos INTEGER NOT NULL,
+    retain INTEGER NOT NULL,
+    properties BLOB,
+    created REAL NOT NULL
+)
+"""
+
+
+class Outbox:
+    # Outbox persisten untuk publish QoS 1/2 di SQLite (mode WAL). Pesan dicatat
+    # sebelum dipublish dan dihapus setelah PUBACK/PUBCOMP, sehingga pesan yang
+    # belum di-ack saat proses mati bisa dikirim ulang oleh proses berikutnya.
+    # Insert dan delete dikumpulkan lalu di-commit sekaligus: setiap commit_batch
+    # perubahan atau setiap commit_interval detik. Pesan yang tercatat kurang dari
+    # commit_interval sebelum proses mati bisa hilang; commit_interval=0 meng-commit
+    # setiap insert sebelum publish.
+    def __init__(self, path, commit_batch=100, commit_interval=0.05):
+        self.path = path
+        self.commit_batch = commit_batch
+        self.commit_interval = commit_interval
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL") # Di mode WAL tetap konsisten setelah crash, fsync hanya saat checkpoint
+        self._db.execute(_SCHEMA)
+        self._lock = Lock() # Melindungi koneksi SQLite dan state di bawah
+        self._in_transaction = False
+        self._uncommitted = 0
+        self._done = [] # id yang sudah di-ack, dihapus saat commit berikutnya
+        self._active = set() # id yang sedang dikirim oleh proses ini (paho yang mengirim ulang saat reconnect)
+        self._inflight = {} # mid -> id
+        self._early_acks = {} # mid -> (waktu ack, reason code) untuk ack yang tiba sebelum sent()
+        self._pending = self._db.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+        self.stats = {'recorded': 0, 'acked': 0, 'deferred': 0, 'replayed': 0, 'expired': 0, 'commits': 0}
+        self._stop = Event()
+        self._flusher = Thread(target=self._flush_loop, daemon=True)
+        self._flusher.start()
+
+    def __len__(self):
+        return self._pending
+
+    def _begin(self):
+        if not self._in_transaction:
+            self._db.execute("BEGIN")
+            self._in_transaction = True
+
+    def _commit(self):
+        if self._done:
+            self._begin()
+            self._db.executemany("DELETE FROM outbox WHERE id = ?", ((row_id,) for row_id in self._done))
+            self._done = []
+        if self._in_transaction:
+            self._db.execute("COMMIT")
+            self._in_transaction = False
+            self._uncommitted = 0
+            self.stats['commits'] += 1
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.commit_interval or 0.05):
+            self.flush()
+
+    def flush(self):
+        with self._lock:
+            self._commit()
+
+    def add(self, topic, payload, qos, retain=False, properties=None):
+        # Catat pesan sebelum publish; mengembalikan id baris untuk sent()
+        packed = properties.pack() if properties is not None else None
+        with self._lock:
+            self._begin()
+            row_id = self._db.execute(
+                "INSERT INTO outbox (topic, payload, qos, retain, properties, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (topic, payload if isinstance(payload, bytes) else str(payload).encode(), qos, int(retain), packed, time.time())
+            ).lastrowid
+            self._active.add(row_id)
+            self._pending += 1
+            self._uncommitted += 1
+            self.stats['recorded'] += 1
+            if not self.commit_interval or self._uncommitted >= self.commit_batch:
+                self._commit()
+        return row_id
+
+    def claim(self, row_id):
+        # Baris dari proses sebelumnya yang akan di-replay; False jika sedang dikirim
+        with self._lock:
+            if row_id in self._active:
+                return False
+            self._active.add(row_id)
+            return True
+
+    def sent(self, mid, row_id, sent_at):
+        # Hubungkan mid dari paho dengan baris outbox; ack yang mendahului baris ini langsung diproses.
+        # True jika ack itu quota exceeded (baris menunggu replay, lihat acked)
+        with self._lock:
+            early = self._early_acks.pop(mid, None)
+            if early is None or early[0] < sent_at:
+                self._inflight[mid] = row_id
+                return False
+            return self._complete(row_id, early[1])
+
+    def release(self, row_id, keep=False):
+        # Publish gagal sebelum sampai ke paho. Pesan baru dihapus (pemanggil yang menangani
+        # kegagalannya); pesan replay (keep=True) tetap di outbox untuk replay berikutnya.
+        with self._lock:
+            self._active.discard(row_id)
+            if not keep:
+                self._done.append(row_id)
+                self._pending -= 1
+
+    def acked(self, mid, reason_code=0):
+        # Dipanggil dari on_publish (thread jaringan paho): hanya mencatat, delete dilakukan saat commit.
+        # True jika broker membalas quota exceeded: baris tetap di outbox dan pemanggil menjadwalkan replay
+        now = time.perf_counter()
+        reason_code = getattr(reason_code, 'value', reason_code) or 0
+        with self._lock:
+            row_id = self._inflight.pop(mid, None)
+            if row_id is None:
+                if len(self._early_acks) >= 1024:
+                    self._early_acks.clear()
+                self._early_acks[mid] = (now, reason_code)
+                return False
+            return self._complete(row_id, reason_code)
+
+    def _complete(self, row_id, reason_code):
+        self._active.discard(row_id)
+        if reason_code == REASON_QUOTA_EXCEEDED:
+            self.stats['deferred'] += 1
+            return True # Tetap di outbox, dikirim lagi pada replay berikutnya
+        self._done.append(row_id)
+        self._pending -= 1
+        self.stats['acked'] += 1
+        return False
+
+    def count_replayed(self, count):
+        with self._lock:
+            self.stats['replayed'] += count
+
+    def replayable(self, after_id=0, limit=100):
+        # Baris yang belum di-ack dan tidak sedang dikirim oleh proses ini, urut sesuai waktu pencatatan.
+        # Properties di-unpack dan MessageExpiryInterval dikurangi waktu yang sudah lewat;
+        # pesan yang sudah kedaluwarsa langsung dihapus.
+        with self._lock:
+            self._commit()
+            rows = self._db.execute(
+                "SELECT id, topic, payload, qos, retain, properties, created FROM outbox WHERE id > ? ORDER BY id LIMIT ?",
+                (after_id, limit)
+            ).fetchall()
+            active = set(self._active)
+        result = []
+        expired = []
+        now = time.time()
+        for row_id, topic, payload, qos, retain, packed, created in rows:
+            if row_id in active:
+                continue
+            properties = None
+            if packed:
+                properties = Properties(PacketTypes.PUBLISH)
+                properties.unpack(packed)
+                interval = getattr(properties, 'MessageExpiryInterval', None)
+                if interval is not None:
+                    remaining = int(interval - (now - created))
+                    if remaining <= 0:
+                        expired.append(row_id)
+                        continue
+                    properties.MessageExpiryInterval = remaining
+            result.append((row_id, topic, payload, qos, bool(retain), properties))
+        if expired:
+            with self._lock:
+                self._done.extend(expired)
+                self._pending -= len(expired)
+                self.stats['expired'] += len(expired)
+        return rows[-1][0] if rows else None, result
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, pending=self._pending, in_flight=len(self._inflight))
+
+    def close(self):
+        self._stop.set()
+        self._flusher.join()
+        with self._lock:
+            self._commit()
+            self._db.close()
@@ -1,17 +1,34 @@
 import paho.mqtt.client as mqtt
+import logging
+import os
 import time
-import ssl
 import random
-import json
-from queue import Queue
-from threading import Lock, Event
+import copy
+import heapq
+from collections import deque
+from queue import Queue, Empty, Full
+from threading import Lock, Thread, Condition, Timer
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
 import uuid
+from rate_limiter import RateLimiter, TokenBucket
+from inflight_window import InflightWindow
+from outbox import Outbox
+from coalescer import Coalescer
+from topic_alias import TopicAliasManager
+from connection import ConnectionReadiness, CONNECT_TIMEOUT, create_tls_context, schedule_reconnect
+from codec import encode_payload, decode_payload
+from deadline_queue import EXPIRY_USER_PROPERTY
+from metrics import registry as metrics
+from mqtt_logging import get_logger, sampled, rate_limited, setup_logging
 
 # --- Configuration ---
-BROKER_HOST = "broker.emqx.io"
-BROKER_PORT = 8883
+# Broker bisa diganti lewat environment variable, misalnya untuk broker lokal (local_broker.py)
+BROKER_HOST = os.environ.get("MQTT_BROKER_HOST", "broker.emqx.io")
+BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", "8883"))
+USE_TLS = os.environ.get("MQTT_USE_TLS", "1") != "0"
 CLIENT_ID_BASE = "python_publisher_emqx"
-CLIENT_ID = f"{CLIENT_ID_BASE}_{int(time.time())}{random.randint(0, 999)}"
+# Client ID tetap (MQTT_CLIENT_ID) diperlukan agar sesi di broker bisa dilanjutkan setelah restart
+CLIENT_ID = os.environ.get("MQTT_CLIENT_ID") or f"{CLIENT_ID_BASE}_{int(time.time())}{random.randint(0, 999)}"
 # Authentication (uncomment for brokers requiring credentials)
 USERNAME = "fidelanata"
 PASSWORD = "insisez"
@@ -26,140 +43,626 @@ LAST_WILL_MESSAGE = f"Client {CLIENT_ID} disconnected unexpectedly!"
 REQUEST_TOPIC = f"{YOUR_UNIQUE_TOPIC_PREFIX}/request"
 RESPONSE_TOPIC = f"{YOUR_UNIQUE_TOPIC_PREFIX}/response/{CLIENT_ID}"
 
+# Logging (level lewat MQTT_LOG_LEVEL; event per pesan ada di level DEBUG dan disampling)
+logger = get_logger("publisher")
+message_log = sampled(logger)
+warning_log = rate_limited(logger)
+
+# Payload Codec Configuration
+PAYLOAD_CONTENT_TYPE = None # None = pilih otomatis (biner untuk pembacaan sensor jika round-trip persis, selain itu JSON)
+
 # Flow Control Configuration
 MAX_QUEUE_SIZE = 1000
-RATE_LIMIT = 100
-last_publish_time = 0
-publish_lock = Lock()
+RATE_LIMIT = 100 # Batas keras pesan QoS 0 per detik (global, semua topik); QoS 1/2 diatur jendela in-flight adaptif
+BURST_SIZE = 10 # Jumlah pesan yang boleh dikirim sekaligus sebelum rate limit berlaku
+TOPIC_RATE_LIMIT = None # Pesan per detik per topik, semua QoS (None = tanpa batas per topik)
+TOPIC_BURST_SIZE = 10
+rate_limiter = RateLimiter(RATE_LIMIT, BURST_SIZE, topic_rate=TOPIC_RATE_LIMIT, topic_burst=TOPIC_BURST_SIZE)
+# Jendela adaptif untuk QoS 1/2: membesar selama ack cepat, mengecil saat latency ack naik
+# atau broker membalas quota exceeded (0x97), dan dibatasi ReceiveMaximum dari broker
+INITIAL_INFLIGHT_WINDOW = 10
+MAX_INFLIGHT_WINDOW = 1000
+WINDOW_ACQUIRE_TIMEOUT = 30 # Detik menunggu slot sebelum publish dianggap gagal
+inflight_window = InflightWindow(initial=INITIAL_INFLIGHT_WINDOW, maximum=MAX_INFLIGHT_WINDOW)
 message_queue = Queue(maxsize=MAX_QUEUE_SIZE)
+
+# Topic Alias MQTT v5 untuk publish QoS 0: topik yang sering dipakai dikirim sebagai alias 2 byte
+TOPIC_ALIAS_MAXIMUM = 64 # Alias per koneksi (dibatasi TopicAliasMaximum broker); 0 = tanpa alias
+TOPIC_ALIAS_MIN_USES = 2 # Topik mendapat alias setelah dipakai sebanyak ini (topik sekali pakai tidak menggusur yang sering)
+
+# Coalescing (opt-in, lewat send_message_coalesced): pesan dict kecil per topik dikumpulkan lalu
+# dikirim sebagai satu envelope (lihat coalescer.py); subscriber memecahnya lagi secara otomatis.
+# COALESCE_ENABLED membuat worker process PublisherPool memakai send_message_coalesced untuk
+# pesan yang bisa di-batch (dict tanpa retain, expiry, atau properties sendiri).
+COALESCE_ENABLED = False
+COALESCE_MAX_MESSAGES = 100 # Kirim batch setelah sebanyak ini pesan...
+COALESCE_MAX_BYTES = 16 * 1024 # ...atau setelah envelope sebesar ini (bytes)...
+COALESCE_LINGER = 0.02 # ...atau setelah pesan pertama menunggu sekian detik (tambahan latency maksimum)
+
+# Outbox Persisten (opsional): pesan QoS 1/2 dicatat di SQLite sebelum dipublish, dihapus
+# setelah PUBACK/PUBCOMP, dan yang belum di-ack dikirim ulang setelah restart atau reconnect.
+# Request dan respons (ResponseTopic/CorrelationData) tidak dicatat: setelah restart tidak ada
+# yang menunggu CorrelationData-nya, dan action yang tidak idempoten akan dijalankan ulang.
+OUTBOX_PATH = os.environ.get("MQTT_OUTBOX_PATH") # Misalnya "publisher_outbox.db"; None = tanpa outbox
+OUTBOX_COMMIT_BATCH = 100 # Insert/delete per commit
+OUTBOX_COMMIT_INTERVAL = 0.05 # Detik maksimum sebelum perubahan di-commit (0 = commit setiap pesan sebelum publish)
+OUTBOX_REPLAY_RATE = 1000 # Pesan per detik saat replay (None = hanya dibatasi jendela in-flight)
+OUTBOX_REPLAY_BATCH = 500 # Baris yang dibaca dari outbox per query saat replay
+OUTBOX_RETRY_DELAY = 1.0 # Detik sebelum pesan yang dibalas quota exceeded di-replay, tanpa menunggu reconnect
+replay_lock = Lock() # Melindungi replay_thread/replay_again/replay_timer di userdata
+SESSION_EXPIRY_INTERVAL = 3600 # Detik broker menyimpan sesi setelah koneksi putus (hanya jika outbox aktif)
+outbox = Outbox(OUTBOX_PATH, OUTBOX_COMMIT_BATCH, OUTBOX_COMMIT_INTERVAL) if OUTBOX_PATH else None
+
+# Publish Pipeline Configuration (opt-in, dipakai oleh publish_async)
+PIPELINE_BATCH_SIZE = 50 # Maksimum pesan yang diserialisasi dan dikirim per batch
+QUEUE_POLICY_BLOCK = "block" # Tunggu sampai ada ruang di antrean
+QUEUE_POLICY_DROP_OLDEST = "drop_oldest" # Buang pesan tertua untuk memberi ruang
+QUEUE_POLICY_REJECT = "reject" # Tolak pesan baru
+QUEUE_FULL_POLICY = QUEUE_POLICY_BLOCK
+pipeline_thread = None
+pipeline_lock = Lock()
 pending_requests = {}
 request_lock = Lock()
 
+# Request-Response Configuration
+REQUEST_RTT_SAMPLES = 10000 # Jumlah sampel RTT terakhir untuk perhitungan persentil
+request_condition = Condition(request_lock)
+request_deadlines = [] # Heap (deadline, correlation_id), diproses oleh satu thread timeout
+request_timeout_thread = None
+request_stats = {'sent': 0, 'completed': 0, 'timed_out': 0, 'failed': 0}
+request_rtts = deque(maxlen=REQUEST_RTT_SAMPLES)
+
+# Metrics Configuration
+METRICS_HTTP_PORT = None # Port endpoint Prometheus (/metrics), None = tidak dijalankan
+METRICS_TOPIC = f"{YOUR_UNIQUE_TOPIC_PREFIX}/metrics/{CLIENT_ID}"
+METRICS_PUBLISH_INTERVAL = 10 # Detik antar snapshot metrics ke METRICS_TOPIC (None = tidak dipublish)
+metrics.gauge("publish_queue_depth", message_queue.qsize, client="publisher")
+metrics.gauge("requests_in_flight", lambda: len(pending_requests), client="publisher")
+metrics.gauge("publish_awaiting_ack", inflight_window.in_flight, client="publisher")
+metrics.gauge("publish_window", lambda: int(inflight_window.window), client="publisher")
+if outbox is not None:
+    metrics.gauge("outbox_pending", outbox.__len__, client="publisher")
+
+# userdata setiap client berisi state per koneksi: client_id, jendela in-flight,
+# topik respons, template properties request, outbox, dan kesiapan koneksi (lihat create_publisher_client)
 def on_connect(client, userdata, flags, reason_code, properties=None):
+    client_id = userdata['client_id']
     if reason_code == 0:
-        print(f"Publisher ({CLIENT_ID}): Connected to MQTT broker ({BROKER_HOST}) with result code: {reason_code}")
-        client.subscribe(RESPONSE_TOPIC, qos=1)
+        logger.info(f"Publisher ({client_id}): Connected to MQTT broker ({BROKER_HOST}) with result code: {reason_code}")
+        userdata['window'].set_receive_maximum(getattr(properties, 'ReceiveMaximum', None) if properties else None)
+        if userdata['topic_aliases'] is not None:
+            userdata['topic_aliases'].reset(getattr(properties, 'TopicAliasMaximum', 0) if properties else 0)
+        _, mid = client.subscribe(userdata['response_topic'], qos=1)
+        # Siap setelah SUBACK topik respons, sehingga respons request pertama tidak terlewat
+        userdata['readiness'].connected(client, [mid])
+        if userdata['outbox'] is not None:
+            _start_outbox_replay(client)
     else:
-        print(f"Publisher ({CLIENT_ID}): Failed to connect, result code: {reason_code}")
+        logger.error(f"Publisher ({client_id}): Failed to connect, result code: {reason_code}")
+        userdata['readiness'].refused(reason_code)
+
+def on_subscribe(client, userdata, mid, reason_codes, properties=None):
+    userdata['readiness'].subscribed(mid, reason_codes)
+
+def on_disconnect(client, userdata, disconnect_flags, reason_code, properties=None):
+    userdata['readiness'].disconnected()
+    if userdata['topic_aliases'] is not None:
+        userdata['topic_aliases'].reset() # Alias tidak berlaku di koneksi berikutnya
+    if reason_code != 0:
+        delay = schedule_reconnect(client, userdata['readiness'])
+        logger.warning(f"Publisher ({userdata['client_id']}): Unexpected disconnection (reason: {reason_code}), reconnecting in {delay:.2f}s.")
+
+def on_connect_fail(client, userdata):
+    delay = schedule_reconnect(client, userdata['readiness'])
+    warning_log.warning("connect_failed", "Publisher (%s): Connection attempt failed, retrying in %.2fs", userdata['client_id'], delay)
 
 def on_publish(client, userdata, mid, reason_code=0, properties=None):
-    print(f"Publisher ({CLIENT_ID}): Message with MID {mid} published.")
+    acked = userdata['window'].acked(mid, reason_code)
+    if userdata['outbox'] is not None and userdata['outbox'].acked(mid, reason_code):
+        _schedule_outbox_retry(client)
+    if acked is not None:
+        metrics.stage("ack", acked[0]).observe(acked[1])
+    if reason_code is not None and getattr(reason_code, 'is_failure', False):
+        warning_log.warning("publish_rejected", "Publisher (%s): Broker rejected MID %s: %s", userdata['client_id'], mid, reason_code, extra={'mid': mid})
+    message_log.debug("published", "Publisher (%s): Message with MID %s published.", userdata['client_id'], mid, extra={'mid': mid})
 
 def on_message(client, userdata, msg):
     try:
         properties = msg.properties
-        correlation_data = properties.CorrelationData.decode() if properties and properties.CorrelationData else None
+        correlation_data = getattr(properties, 'CorrelationData', None) if properties else None
         if not correlation_data:
             return
-        
+
         with request_lock:
-            if correlation_data in pending_requests:
-                response_data = json.loads(msg.payload.decode())
-                pending_requests[correlation_data]['response'] = response_data
-                pending_requests[correlation_data]['event'].set()
+            pending = pending_requests.pop(correlation_data.decode(), None)
+            if pending is None:
+                return
+            request_stats['completed'] += 1
+            rtt = time.monotonic() - pending['sent_at']
+            request_rtts.append(rtt)
+        metrics.histogram("request_rtt_seconds").observe(rtt)
+
+        try:
+            pending['future'].set_result(decode_payload(msg.payload, msg.properties))
+        except Exception as e:
+            pending['future'].set_exception(e)
     except Exception as e:
-        print(f"Error processing response: {e}")
-
-def send_message_with_flow_control(topic, payload, qos=0, retain=False, expiry=None, properties=None):
-    global last_publish_time
-    with publish_lock:
-        current_time = time.time()
-        if current_time - last_publish_time < 1.0/RATE_LIMIT:
-            time.sleep(1.0/RATE_LIMIT - (current_time - last_publish_time))
-        
+        warning_log.log(logging.ERROR, "response_error", "Error processing response: %s", e)
+
+def encode_message(payload, properties=None, expiry=None):
+    # Dict di-encode dengan codec dan codec-nya diumumkan lewat ContentType/PayloadFormatIndicator.
+    # Properties milik pemanggil disalin dulu: sering dipakai ulang untuk banyak pesan
+    if expiry is None and not isinstance(payload, dict):
+        return payload, properties
+    properties = copy.copy(properties) if properties is not None else mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    if expiry is not None:
+        properties.MessageExpiryInterval = int(expiry) # Broker membuang pesan setelah interval ini
+    if isinstance(payload, dict):
+        if payload.get('expiry') is not None:
+            # Salin deadline aplikasi ke user property agar subscriber bisa membuang pesan tanpa decode
+            properties.UserProperty = (EXPIRY_USER_PROPERTY, repr(float(payload['expiry'])))
+        payload = encode_payload(payload, properties, PAYLOAD_CONTENT_TYPE)
+    return payload, properties
+
+def send_message_with_flow_control(topic, payload, qos=0, retain=False, expiry=None, properties=None, client=None):
+    acquire_rate(topic, qos)
+
+    try:
+        start = time.perf_counter()
+        payload, properties = encode_message(payload, properties, expiry)
+        metrics.stage("encode", topic).observe(time.perf_counter() - start)
+        return _publish(topic, payload, qos, retain, properties, client)
+    except Exception as e:
+        warning_log.log(logging.ERROR, "send_error", "Error sending message: %s", e, extra={'topic': topic})
+        return None
+
+def acquire_rate(topic, qos):
+    # Tunggu token di luar lock, sehingga pemanggil konkuren tidak saling antre di mutex.
+    # RATE_LIMIT hanya untuk QoS 0; laju QoS 1/2 diatur inflight_window di _publish, jadi
+    # hanya bucket per topik (TOPIC_RATE_LIMIT) yang berlaku untuk QoS 1/2.
+    return rate_limiter.acquire(topic, use_global=qos == 0)
+
+def is_request_response(properties):
+    return properties is not None and (hasattr(properties, 'ResponseTopic') or hasattr(properties, 'CorrelationData'))
+
+def _publish(topic, payload, qos, retain, properties, client=None, row_id=None):
+    # QoS 1/2 harus mendapat slot di jendela in-flight koneksi ini; QoS 0 tidak menunggu ack.
+    # Dengan outbox, pesan QoS 1/2 dicatat sebelum publish (row_id sudah ada untuk pesan replay).
+    client = client or publisher_client
+    userdata = client.user_data_get()
+    window = userdata['window']
+    outbox = userdata['outbox'] if qos > 0 and not is_request_response(properties) else None
+    replay = row_id is not None
+    if qos > 0 and not window.acquire(WINDOW_ACQUIRE_TIMEOUT):
+        raise TimeoutError(f"No in-flight slot within {WINDOW_ACQUIRE_TIMEOUT}s (window {int(window.window)})")
+    if outbox is not None and not replay:
+        row_id = outbox.add(topic, payload, qos, retain, properties)
+    start = time.perf_counter()
+    try:
+        if qos == 0 and userdata['topic_aliases'] is not None:
+            info = _publish_with_alias(client, userdata['topic_aliases'], topic, payload, retain, properties)
+        else:
+            info = client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
+    except Exception:
+        if qos > 0:
+            window.cancel()
+        if outbox is not None:
+            outbox.release(row_id, keep=replay)
+        raise
+    metrics.stage("publish", topic).observe(time.perf_counter() - start)
+    if qos > 0:
+        # MQTT_ERR_NO_CONN: paho menyimpan pesan dan mengirimnya setelah reconnect, jadi slot tetap terpakai
+        if info.rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+            latency = window.sent(info.mid, topic, start) # Tidak None jika ack mendahului baris ini
+            if latency is not None:
+                metrics.stage("ack", topic).observe(latency)
+            if outbox is not None and outbox.sent(info.mid, row_id, start):
+                _schedule_outbox_retry(client)
+        else:
+            window.cancel()
+            if outbox is not None:
+                outbox.release(row_id, keep=replay)
+    return info
+
+def can_coalesce(payload, retain=False, expiry=None, properties=None):
+    return isinstance(payload, dict) and not retain and expiry is None and properties is None
+
+def send_message_coalesced(topic, payload, qos=0, client=None):
+    # Berbeda dengan send_message_with_flow_control, hasilnya Future berisi MQTTMessageInfo
+    # envelope (selesai saat batch dikirim); rate limit berlaku per envelope, bukan per pesan.
+    if not isinstance(payload, dict):
+        raise TypeError("Only dict payloads can be coalesced")
+    return _coalescer_for(client or publisher_client).add(topic, payload, qos)
+
+def _coalescer_for(client):
+    userdata = client.user_data_get()
+    with pipeline_lock:
+        if userdata.get('coalescer') is None:
+            def send_envelope(topic, envelope, qos, properties):
+                acquire_rate(topic, qos)
+                return _publish(topic, envelope, qos, False, properties, client)
+            userdata['coalescer'] = Coalescer(send_envelope, COALESCE_MAX_MESSAGES, COALESCE_MAX_BYTES, COALESCE_LINGER, PAYLOAD_CONTENT_TYPE)
+        return userdata['coalescer']
+
+def flush_coalesced(client=None):
+    # Kirim semua batch yang masih menunggu linger, misalnya sebelum disconnect
+    coalescer = (client or publisher_client).user_data_get().get('coalescer')
+    if coalescer is not None:
+        coalescer.flush()
+
+def get_coalescer_stats(client=None):
+    coalescer = (client or publisher_client).user_data_get().get('coalescer')
+    return coalescer.snapshot() if coalescer is not None else None
+
+def _publish_with_alias(client, aliases, topic, payload, retain, properties):
+    # Hanya QoS 0: pesan QoS 1/2 yang belum di-ack dikirim ulang paho apa adanya setelah
+    # reconnect, sedangkan alias dari koneksi lama tidak berlaku di koneksi baru.
+    # Lock dipegang sampai paket masuk antrean paho, sehingga urutan paket alias terjaga.
+    with aliases.lock:
+        wire_topic, properties = aliases.apply(topic, properties)
+        return client.publish(wire_topic, payload, qos=0, retain=retain, properties=properties)
+
+def replay_outbox(client=None):
+    # Kirim ulang pesan outbox yang belum di-ack: sisa proses sebelumnya, atau yang dibalas
+    # quota exceeded. Pesan yang masih dipegang paho di proses ini dikirim ulang oleh paho sendiri.
+    client = client or publisher_client
+    outbox = client.user_data_get()['outbox']
+    limiter = TokenBucket(OUTBOX_REPLAY_RATE, OUTBOX_REPLAY_BATCH) if OUTBOX_REPLAY_RATE else None
+    client_id = client.user_data_get()['client_id']
+    after_id = 0
+    replayed = 0
+    while client.is_connected():
+        after_id, rows = outbox.replayable(after_id, OUTBOX_REPLAY_BATCH)
+        if after_id is None:
+            break
+        for row_id, topic, payload, qos, retain, properties in rows:
+            if not outbox.claim(row_id):
+                continue
+            if is_request_response(properties):
+                outbox.release(row_id) # Dicatat oleh versi lama; tidak ada lagi yang menunggu responsnya
+                continue
+            if limiter is not None:
+                limiter.acquire()
+            try:
+                _publish(topic, payload, qos, retain, properties, client, row_id=row_id)
+            except Exception as e:
+                outbox.release(row_id, keep=True)
+                warning_log.warning("replay_error", "Publisher (%s): Outbox replay stopped: %s", client_id, e)
+                return replayed
+            replayed += 1
+    outbox.count_replayed(replayed)
+    if replayed:
+        logger.info(f"Publisher ({client_id}): Replayed {replayed} message(s) from outbox, {len(outbox)} pending.")
+    return replayed
+
+def _outbox_replay_worker(client):
+    # Replay diulang jika diminta lagi selama berjalan: baris yang dibalas quota exceeded di
+    # tengah replay bisa punya id lebih kecil dari posisi replay saat itu
+    userdata = client.user_data_get()
+    while True:
+        replay_outbox(client)
+        with replay_lock:
+            if not userdata.get('replay_again') or not client.is_connected():
+                userdata['replay_thread'] = None
+                return
+            userdata['replay_again'] = False
+
+def _start_outbox_replay(client):
+    # Dipanggil dari on_connect (thread jaringan paho) dan timer retry, jadi replay berjalan di thread sendiri
+    userdata = client.user_data_get()
+    with replay_lock:
+        if userdata.get('replay_thread') is not None:
+            userdata['replay_again'] = True
+            return
+        userdata['replay_again'] = False
+        userdata['replay_thread'] = Thread(target=_outbox_replay_worker, args=(client,), daemon=True)
+        userdata['replay_thread'].start()
+
+def _schedule_outbox_retry(client):
+    # Pesan yang dibalas quota exceeded di koneksi yang sehat di-replay setelah OUTBOX_RETRY_DELAY;
+    # satu timer per koneksi, dan _publish saat replay tetap menunggu slot di jendela in-flight
+    userdata = client.user_data_get()
+    with replay_lock:
+        timer = userdata.get('replay_timer')
+        if timer is not None and timer.is_alive():
+            return
+        timer = Timer(OUTBOX_RETRY_DELAY, _start_outbox_replay, args=(client,))
+        timer.daemon = True
+        userdata['replay_timer'] = timer
+        timer.start()
+
+def publish_async(topic, payload, qos=0, retain=False, expiry=None, properties=None, policy=None):
+    # Masukkan pesan ke message_queue dan langsung kembali; serialisasi, rate limit
+    # dan publish dikerjakan oleh pipeline worker. Future berisi MQTTMessageInfo.
+    start_publish_pipeline()
+    future = Future()
+    item = (future, topic, payload, qos, retain, expiry, properties)
+    policy = policy or QUEUE_FULL_POLICY
+
+    if policy == QUEUE_POLICY_BLOCK:
+        message_queue.put(item)
+    elif policy == QUEUE_POLICY_DROP_OLDEST:
+        while True:
+            try:
+                message_queue.put_nowait(item)
+                break
+            except Full:
+                try:
+                    dropped = message_queue.get_nowait()
+                except Empty:
+                    continue
+                if dropped is None:
+                    # Sentinel dari stop_publish_pipeline tidak boleh dibuang: worker sedang
+                    # mengosongkan antrean, jadi pesan ini dan sentinel dimasukkan lagi (menunggu
+                    # ruang) dan pesan tetap dikirim sebelum worker berhenti
+                    message_queue.put(item)
+                    message_queue.put(None)
+                    message_queue.task_done()
+                    break
+                message_queue.task_done()
+                metrics.counter("publish_dropped", reason="drop_oldest").inc()
+                if dropped[0].set_running_or_notify_cancel():
+                    dropped[0].set_exception(Full(f"Dropped to make room in publish queue (topic {dropped[1]})"))
+    elif policy == QUEUE_POLICY_REJECT:
+        try:
+            message_queue.put_nowait(item)
+        except Full:
+            metrics.counter("publish_dropped", reason="rejected").inc()
+            future.set_running_or_notify_cancel()
+            future.set_exception(Full(f"Publish queue is full, rejected message for topic {topic}"))
+    else:
+        raise ValueError(f"Unknown queue policy: {policy}")
+    return future
+
+def _publish_batch(batch):
+    for future, topic, payload, qos, retain, expiry, properties in batch:
+        if not future.set_running_or_notify_cancel():
+            continue
         try:
-            if isinstance(payload, dict):
-                payload = json.dumps(payload)
-            
-            result = publisher_client.publish(topic, payload, qos=qos, retain=retain, properties=properties)
-            last_publish_time = time.time()
-            return result
+            start = time.perf_counter()
+            payload, properties = encode_message(payload, properties, expiry)
+            metrics.stage("encode", topic).observe(time.perf_counter() - start)
+            acquire_rate(topic, qos)
+            future.set_result(_publish(topic, payload, qos, retain, properties))
         except Exception as e:
-            print(f"Error sending message: {e}")
-            return None
+            future.set_exception(e)
+
+def publish_pipeline_worker():
+    running = True
+    while running:
+        item = message_queue.get()
+        batch = []
+        while item is not None:
+            batch.append(item)
+            if len(batch) >= PIPELINE_BATCH_SIZE:
+                break
+            try:
+                item = message_queue.get_nowait()
+            except Empty:
+                break
+        if item is None:
+            running = False # Sentinel dari stop_publish_pipeline
+        _publish_batch(batch)
+        for _ in range(len(batch) + (0 if running else 1)):
+            message_queue.task_done()
+
+def start_publish_pipeline():
+    global pipeline_thread
+    with pipeline_lock:
+        if pipeline_thread is None or not pipeline_thread.is_alive():
+            pipeline_thread = Thread(target=publish_pipeline_worker, daemon=True)
+            pipeline_thread.start()
+
+def stop_publish_pipeline(timeout=None):
+    # Antrean dikosongkan dulu (pesan yang sudah masuk tetap dikirim), lalu worker berhenti
+    global pipeline_thread
+    with pipeline_lock:
+        if pipeline_thread is None:
+            return
+        message_queue.put(None)
+        pipeline_thread.join(timeout)
+        pipeline_thread = None
+
+def request_timeout_worker():
+    # Satu thread untuk semua request: tidur sampai deadline terdekat di heap
+    while True:
+        expired = []
+        with request_condition:
+            while not request_deadlines:
+                request_condition.wait()
+            deadline, correlation_id = request_deadlines[0]
+            now = time.monotonic()
+            if deadline > now:
+                request_condition.wait(deadline - now)
+                continue
+            while request_deadlines and request_deadlines[0][0] <= now:
+                _, correlation_id = heapq.heappop(request_deadlines)
+                pending = pending_requests.pop(correlation_id, None) # None jika sudah dijawab
+                if pending is not None:
+                    request_stats['timed_out'] += 1
+                    metrics.counter("request_timeouts").inc()
+                    expired.append(pending['future'])
+        for future in expired:
+            future.set_exception(FutureTimeoutError("No response received within timeout"))
 
-def send_request(request_data, timeout=20):
+def _start_request_timeout_worker():
+    global request_timeout_thread
+    if request_timeout_thread is None:
+        request_timeout_thread = Thread(target=request_timeout_worker, daemon=True)
+        request_timeout_thread.start()
+
+def send_request_async(request_data, timeout=20, client=None):
+    # Kirim request tanpa memblokir; Future selesai dari on_message atau gagal dengan TimeoutError.
+    # Bisa di-await dari asyncio dengan asyncio.wrap_future(future).
+    client = client or publisher_client
     correlation_id = str(uuid.uuid4())
     request_data['request_id'] = correlation_id
-    
-    event = Event()
-    with request_lock:
-        pending_requests[correlation_id] = {
-            'event': event,
-            'response': None
-        }
-    
-    properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
-    properties.ResponseTopic = RESPONSE_TOPIC
+    future = Future()
+    future.set_running_or_notify_cancel()
+
+    with request_condition:
+        if request_timeout_thread is None:
+            _start_request_timeout_worker()
+        deadline = time.monotonic() + timeout
+        pending_requests[correlation_id] = {'future': future, 'sent_at': time.monotonic()}
+        heapq.heappush(request_deadlines, (deadline, correlation_id))
+        if request_deadlines[0][1] == correlation_id:
+            request_condition.notify()
+        request_stats['sent'] += 1
+
+    # Template per koneksi (ResponseTopic milik client ini) dibuat sekali; setiap request hanya menyalin
+    properties = copy.copy(client.user_data_get()['request_template'])
     properties.CorrelationData = correlation_id.encode()
-    
+
     result = send_message_with_flow_control(
         REQUEST_TOPIC,
         request_data,
         qos=1,
-        properties=properties
+        properties=properties,
+        client=client
     )
-    
-    if not result or result.rc != mqtt.MQTT_ERR_SUCCESS:
+
+    # MQTT_ERR_NO_CONN: paho menyimpan request QoS 1 dan mengirimnya setelah reconnect, jadi
+    # request tetap pending sampai dijawab atau deadline-nya lewat (action mungkin tetap dijalankan)
+    if not result or result.rc not in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
         with request_lock:
-            del pending_requests[correlation_id]
+            pending = pending_requests.pop(correlation_id, None)
+            if pending is not None:
+                request_stats['failed'] += 1
+        if pending is not None:
+            future.set_exception(RuntimeError(f"Failed to publish request, rc: {result.rc if result else None}"))
+    return future
+
+def send_request_many(requests, timeout=20, client=None):
+    return [send_request_async(request_data, timeout, client) for request_data in requests]
+
+def send_request(request_data, timeout=20, client=None):
+    try:
+        return send_request_async(request_data, timeout, client).result()
+    except Exception:
         return None
-    
-    if event.wait(timeout):
-        with request_lock:
-            response = pending_requests[correlation_id]['response']
-            del pending_requests[correlation_id]
-            return response
-    else:
-        with request_lock:
-            del pending_requests[correlation_id]
+
+def _percentile(sorted_values, percent):
+    if not sorted_values:
         return None
+    index = min(len(sorted_values) - 1, int(round(percent / 100.0 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def get_window_stats(client=None):
+    return (client or publisher_client).user_data_get()['window'].snapshot()
+
+def wait_until_ready(timeout=CONNECT_TIMEOUT, client=None):
+    # True setelah CONNACK dan SUBACK topik respons; pengganti sleep/polling is_connected()
+    return (client or publisher_client).user_data_get()['readiness'].wait(timeout)
+
+def ready_future(client=None):
+    # Future untuk koneksi saat ini, bisa di-await dengan asyncio.wrap_future
+    return (client or publisher_client).user_data_get()['readiness'].future()
+
+def get_topic_alias_stats(client=None):
+    aliases = (client or publisher_client).user_data_get()['topic_aliases']
+    return aliases.snapshot() if aliases is not None else None
+
+def get_outbox_stats(client=None):
+    outbox = (client or publisher_client).user_data_get()['outbox']
+    return outbox.snapshot() if outbox is not None else None
+
+def get_request_stats():
+    with request_lock:
+        stats = dict(request_stats)
+        stats['in_flight'] = len(pending_requests)
+        rtts = sorted(request_rtts)
+    for percent in (50, 90, 99):
+        value = _percentile(rtts, percent)
+        stats[f'rtt_p{percent}_ms'] = value * 1000 if value is not None else None
+    return stats
+
+def connect_publisher(client, host=None, port=None, keepalive=60):
+    # Dengan outbox, sesi dilanjutkan (clean_start=False) dan disimpan broker selama
+    # SESSION_EXPIRY_INTERVAL, sehingga pesan QoS 1/2 yang sedang in-flight tidak hilang saat reconnect
+    host = host or BROKER_HOST
+    port = port or BROKER_PORT
+    if client.user_data_get()['outbox'] is None:
+        return client.connect(host, port, keepalive=keepalive)
+    properties = mqtt.Properties(mqtt.PacketTypes.CONNECT)
+    properties.SessionExpiryInterval = SESSION_EXPIRY_INTERVAL
+    return client.connect(host, port, keepalive=keepalive, clean_start=False, properties=properties)
+
+def create_publisher_client(client_id, window=None, outbox=None):
+    # Satu koneksi ke broker: client paho dengan jendela in-flight, topik respons, dan LWT sendiri.
+    # Dipakai untuk publisher_client dan untuk setiap koneksi di PublisherPool (publisher_pool.py).
+    # outbox (opsional) tidak boleh dipakai bersama oleh beberapa koneksi.
+    response_topic = f"{YOUR_UNIQUE_TOPIC_PREFIX}/response/{client_id}"
+    request_template = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    request_template.ResponseTopic = response_topic
+    tls_context = create_tls_context() if USE_TLS else None
+    userdata = {
+        'client_id': client_id,
+        'window': window or InflightWindow(initial=INITIAL_INFLIGHT_WINDOW, maximum=MAX_INFLIGHT_WINDOW),
+        'response_topic': response_topic,
+        'request_template': request_template,
+        'outbox': outbox,
+        'readiness': ConnectionReadiness(tls_context),
+        'topic_aliases': TopicAliasManager(TOPIC_ALIAS_MAXIMUM, TOPIC_ALIAS_MIN_USES) if TOPIC_ALIAS_MAXIMUM else None
+    }
+
+    if userdata['topic_aliases'] is not None:
+        # Byte bersih yang dihemat (properti alias di paket pertama ikut dikurangi), sama dengan get_topic_alias_stats()
+        aliases = userdata['topic_aliases']
+        metrics.gauge("topic_alias_bytes_saved", lambda: aliases.stats['bytes_saved'], client=client_id)
+
+    # Initialize MQTT Client with MQTT 5.0 and updated callback API
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5, callback_api_version=mqtt.CallbackAPIVersion.VERSION2, userdata=userdata)
+    client.max_inflight_messages_set(0) # Batas in-flight diatur oleh jendela koneksi, bukan antrean internal paho
+
+    # Configure TLS for MQTTS (sesi TLS dipakai ulang saat reconnect)
+    if tls_context is not None:
+        client.tls_set_context(tls_context)
+
+    # Configure LWT
+    client.will_set(
+        f"{YOUR_UNIQUE_TOPIC_PREFIX}/iot/client/{client_id}/status",
+        payload=f"Client {client_id} disconnected unexpectedly!",
+        qos=1,
+        retain=False
+    )
+
+    # Connect Callbacks
+    client.on_connect = on_connect
+    client.on_publish = on_publish
+    client.on_message = on_message
+    client.on_subscribe = on_subscribe
+    client.on_disconnect = on_disconnect
+    client.on_connect_fail = on_connect_fail
+    return client
 
-# Initialize MQTT Client with MQTT 5.0 and updated callback API
-publisher_client = mqtt.Client(client_id=CLIENT_ID, protocol=mqtt.MQTTv5, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-
-# Configure TLS for MQTTS
-publisher_client.tls_set(
-    ca_certs=None,
-    certfile=None,
-    keyfile=None,
-    cert_reqs=None,
-    tls_version=ssl.PROTOCOL_TLS_CLIENT
-)
-
-# Configure LWT
-publisher_client.will_set(
-    LAST_WILL_TOPIC,
-    payload=LAST_WILL_MESSAGE,
-    qos=1,
-    retain=False
-)
-
-# Connect Callbacks
-publisher_client.on_connect = on_connect
-publisher_client.on_publish = on_publish
-publisher_client.on_message = on_message
+publisher_client = create_publisher_client(CLIENT_ID, inflight_window, outbox)
 
 if __name__ == "__main__":
-    print(f"Publisher ({CLIENT_ID}): Connecting to {BROKER_HOST}:{BROKER_PORT}...")
+    setup_logging()
+    logger.info(f"Publisher ({CLIENT_ID}): Connecting to {BROKER_HOST}:{BROKER_PORT}...")
     try:
         publisher_client.username_pw_set(USERNAME, PASSWORD)
-        publisher_client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
+        connect_publisher(publisher_client)
     except Exception as e:
-        print(f"Publisher ({CLIENT_ID}): Connection failed - {e}")
+        logger.error(f"Publisher ({CLIENT_ID}): Connection failed - {e}")
         exit()
 
     publisher_client.loop_start()
-    time.sleep(2) # Beri waktu untuk koneksi
+    ready = wait_until_ready(CONNECT_TIMEOUT) # Selesai setelah satu round trip, bukan sleep tetap
+    if METRICS_HTTP_PORT:
+        metrics.start_http_server(METRICS_HTTP_PORT)
+    if METRICS_PUBLISH_INTERVAL:
+        metrics.start_mqtt_publisher(publisher_client, METRICS_TOPIC, METRICS_PUBLISH_INTERVAL)
 
-    if not publisher_client.is_connected():
-        print(f"Publisher ({CLIENT_ID}): Failed to connect to broker. Exiting.")
+    if not ready:
+        logger.error(f"Publisher ({CLIENT_ID}): Failed to connect to broker. Exiting.")
         publisher_client.loop_stop()
         exit()
 
     # Publish Messages with different QoS (contoh publish jika dijalankan langsung)
     try:
-        print("Publisher main block: Example publish sequence started.")
+        logger.info("Publisher main block: Example publish sequence started.")
         payload_qos0 = {"message": f"QoS 0 message from {CLIENT_ID} at {time.time()}"}
         result_qos0 = send_message_with_flow_control(TOPIC_QOS0, payload_qos0, qos=0)
         # print(f"Publisher: Sent to '{TOPIC_QOS0}' (QoS 0) - Status: {result_qos0.rc if result_qos0 else 'Fail'}")
@@ -176,12 +679,16 @@ if __name__ == "__main__":
         result_retained = send_message_with_flow_control(TOPIC_RETAINED, payload_retained, qos=1, retain=True)
         # print(f"Publisher: Sent to '{TOPIC_RETAINED}' (QoS 1, Retain=True) - Status: {result_retained.rc if result_retained else 'Fail'}")
         
-        print("Publisher main block: Example publish sequence finished.")
+        logger.info("Publisher main block: Example publish sequence finished.")
 
     except Exception as e:
-        print(f"Publisher ({CLIENT_ID}): Error during publish - {e}")
+        logger.error(f"Publisher ({CLIENT_ID}): Error during publish - {e}")
     finally:
-        print(f"Publisher ({CLIENT_ID}): Disconnecting from main block.")
+        logger.info(f"Publisher ({CLIENT_ID}): Disconnecting from main block.")
+        stop_publish_pipeline(timeout=5)
+        flush_coalesced()
         publisher_client.loop_stop()
         publisher_client.disconnect()
-        print(f"Publisher ({CLIENT_ID}): Done (from main block).")
\ No newline at end of file
+        if outbox is not None:
+            outbox.close() # Pesan yang belum di-ack tetap di outbox dan dikirim ulang saat start berikutnya
+        logger.info(f"Publisher ({CLIENT_ID}): Done (from main block).")
\ No newline at end of file
@@ -0,0 +1,216 @@
+import hashlib
+import itertools
+import multiprocessing
+import time
+from bisect import bisect
+from queue import Empty
+from threading import Lock
+
+import paho.mqtt.client as mqtt
+
+import publisher
+from rate_limiter import RateLimiter
+
+# Pool beberapa koneksi publisher. Topik dipetakan ke koneksi dengan consistent
+# hashing, sehingga semua pesan untuk satu topik lewat satu socket dan urutannya
+# tetap terjaga; menambah atau mengurangi koneksi hanya memindahkan sebagian kecil topik.
+POOL_SIZE = 4
+VIRTUAL_NODES = 100 # Titik per koneksi di ring hash, agar sebaran topik merata
+ROUTE_CACHE_SIZE = 4096 # Topik yang hasil lookup ring-nya di-cache
+STATS_INTERVAL = 1.0 # Detik antar laporan statistik dari worker process
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    def __init__(self, nodes, virtual_nodes=VIRTUAL_NODES):
+        points = sorted((_hash(f"{node}#{i}"), index) for index, node in enumerate(nodes) for i in range(virtual_nodes))
+        self._hashes = [point for point, _ in points]
+        self._indexes = [index for _, index in points]
+
+    def lookup(self, key):
+        position = bisect(self._hashes, _hash(key)) % len(self._hashes)
+        return self._indexes[position]
+
+
+def _connection_process(client_id, host, port, username, password, inbox, stats_queue, coalesce=False, rate_limit=None):
+    # Worker process: koneksi sendiri, sehingga encoding payload dan TLS berjalan di core lain.
+    # coalesce dan rate_limit dikirim dari proses induk, karena proses spawn tidak melihat nilai
+    # yang diubah saat runtime. rate_limit adalah bagian worker ini dari RATE_LIMIT (QoS 0), sehingga
+    # total pool sama dengan mode thread, yang semua koneksinya berbagi satu publisher.rate_limiter.
+    # Batas per topik tidak dibagi: satu topik selalu lewat worker yang sama.
+    publisher.rate_limiter = RateLimiter(rate_limit, publisher.BURST_SIZE, topic_rate=publisher.TOPIC_RATE_LIMIT, topic_burst=publisher.TOPIC_BURST_SIZE)
+    client = publisher.create_publisher_client(client_id)
+    if username:
+        client.username_pw_set(username, password)
+    client.connect(host, port, keepalive=60)
+    client.loop_start()
+    publisher.wait_until_ready(client=client)
+    sent = 0
+    last_report = time.monotonic()
+    try:
+        while True:
+            try:
+                item = inbox.get(timeout=STATS_INTERVAL)
+            except Empty:
+                item = ()
+            if item is None:
+                break
+            if item:
+                topic, payload, qos, retain, expiry, properties = item
+                if coalesce and publisher.can_coalesce(payload, retain, expiry, properties):
+                    publisher.send_message_coalesced(topic, payload, qos, client=client)
+                    sent += 1
+                else:
+                    result = publisher.send_message_with_flow_control(topic, payload, qos, retain, expiry, properties, client=client)
+                    if result is not None and result.rc in (mqtt.MQTT_ERR_SUCCESS, mqtt.MQTT_ERR_NO_CONN):
+                        sent += 1
+            now = time.monotonic()
+            if now - last_report >= STATS_INTERVAL:
+                stats_queue.put((client_id, sent, publisher.get_window_stats(client)))
+                last_report = now
+        # Kirim batch yang tersisa dan tunggu ack untuk pesan yang masih in-flight sebelum memutus koneksi
+        publisher.flush_coalesced(client)
+        window = client.user_data_get()['window']
+        deadline = time.monotonic() + 5
+        while window.in_flight() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        stats_queue.put((client_id, sent, publisher.get_window_stats(client)))
+    finally:
+        client.loop_stop()
+        client.disconnect()
+
+
+class PublisherPool:
+    # API sama dengan publisher.py: send_message_with_flow_control, send_request(_async/_many).
+    # processes=True menjalankan setiap koneksi publish di worker process; publish menjadi
+    # fire-and-forget (mengembalikan True jika pesan masuk antrean worker) dan request tetap
+    # lewat satu koneksi di proses ini, karena Future-nya harus diselesaikan di sini.
+    def __init__(self, size=POOL_SIZE, client_id_base=None, processes=False, virtual_nodes=VIRTUAL_NODES):
+        if size < 1:
+            raise ValueError("size must be at least 1")
+        base = client_id_base or publisher.CLIENT_ID
+        self.client_ids = [f"{base}_{i}" for i in range(size)]
+        self.ring = HashRing(self.client_ids, virtual_nodes)
+        self.processes = processes
+        self._routes = {}
+        self._next_request = itertools.count()
+        self._lock = Lock()
+        self._workers = []
+        self._inboxes = []
+        self._stats_queue = None
+        self._process_stats = {}
+        if processes:
+            self.clients = []
+            self.request_clients = [publisher.create_publisher_client(f"{base}_requests")]
+        else:
+            self.clients = [publisher.create_publisher_client(client_id) for client_id in self.client_ids]
+            self.request_clients = self.clients
+
+    def connect(self, host=None, port=None, username=None, password=None, keepalive=60):
+        host = host or publisher.BROKER_HOST
+        port = port or publisher.BROKER_PORT
+        if self.processes:
+            # spawn, bukan fork: proses induk bisa sudah punya thread loop paho yang berjalan
+            context = multiprocessing.get_context("spawn")
+            self._stats_queue = context.Queue()
+            rate_limit = publisher.RATE_LIMIT / len(self.client_ids) if publisher.RATE_LIMIT else None
+            for client_id in self.client_ids:
+                inbox = context.Queue(maxsize=publisher.MAX_QUEUE_SIZE)
+                worker = context.Process(
+                    target=_connection_process,
+                    args=(client_id, host, port, username, password, inbox, self._stats_queue, publisher.COALESCE_ENABLED, rate_limit),
+                    daemon=True
+                )
+                worker.start()
+                self._inboxes.append(inbox)
+                self._workers.append(worker)
+        for client in self.request_clients:
+            if username:
+                client.username_pw_set(username, password)
+            client.connect(host, port, keepalive=keepalive)
+            client.loop_start()
+
+    def wait_connected(self, timeout=10):
+        # Siap = CONNACK + SUBACK topik respons untuk setiap koneksi di proses ini
+        end = time.monotonic() + timeout
+        return all(publisher.wait_until_ready(max(0, end - time.monotonic()), client) for client in self.request_clients)
+
+    def index_for(self, topic):
+        index = self._routes.get(topic)
+        if index is None:
+            index = self.ring.lookup(topic)
+            if len(self._routes) < ROUTE_CACHE_SIZE:
+                self._routes[topic] = index
+        return index
+
+    def client_for(self, topic):
+        return self.clients[self.index_for(topic)]
+
+    def send_message_with_flow_control(self, topic, payload, qos=0, retain=False, expiry=None, properties=None):
+        if self.processes:
+            self._inboxes[self.index_for(topic)].put((topic, payload, qos, retain, expiry, properties))
+            return True
+        return publisher.send_message_with_flow_control(topic, payload, qos, retain, expiry, properties, client=self.client_for(topic))
+
+    def send_message_coalesced(self, topic, payload, qos=0):
+        # Mode thread saja: Future envelope tidak bisa dikirim balik dari worker process
+        if self.processes:
+            raise RuntimeError("send_message_coalesced is not available with processes=True; set publisher.COALESCE_ENABLED")
+        return publisher.send_message_coalesced(topic, payload, qos, client=self.client_for(topic))
+
+    def _request_client(self):
+        # Request tidak punya urutan antar satu sama lain, jadi dibagi round-robin
+        return self.request_clients[next(self._next_request) % len(self.request_clients)]
+
+    def send_request_async(self, request_data, timeout=20):
+        return publisher.send_request_async(request_data, timeout, client=self._request_client())
+
+    def send_request_many(self, requests, timeout=20):
+        return [self.send_request_async(request_data, timeout) for request_data in requests]
+
+    def send_request(self, request_data, timeout=20):
+        try:
+            return self.send_request_async(request_data, timeout).result()
+        except Exception:
+            return None
+
+    def _drain_process_stats(self):
+        while True:
+            try:
+                client_id, sent, window = self._stats_queue.get_nowait()
+            except Empty:
+                break
+            self._process_stats[client_id] = dict(window, sent=sent)
+
+    def get_stats(self):
+        # Statistik jendela in-flight per koneksi plus total, dan statistik request bersama
+        if self.processes:
+            with self._lock:
+                self._drain_process_stats()
+                connections = dict(self._process_stats)
+        else:
+            connections = {client.user_data_get()['client_id']: publisher.get_window_stats(client) for client in self.clients}
+        totals = {}
+        for stats in connections.values():
+            for key in ('acked', 'decreases', 'quota_exceeded', 'rejected', 'waits', 'window', 'in_flight', 'sent'):
+                if key in stats:
+                    totals[key] = totals.get(key, 0) + stats[key]
+        return {'connections': connections, 'total': totals, 'requests': publisher.get_request_stats()}
+
+    def close(self, timeout=10):
+        for inbox in self._inboxes:
+            inbox.put(None)
+        for worker in self._workers:
+            worker.join(timeout)
+        if self._stats_queue is not None:
+            with self._lock:
+                self._drain_process_stats()
+        for client in self.request_clients:
+            publisher.flush_coalesced(client)
+            client.loop_stop()
+            client.disconnect()
+        self._workers.clear()
+        self._inboxes.clear()
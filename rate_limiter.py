@@ -0,0 +1,129 @@
+import asyncio
+import time
+from threading import Lock
+
+
+class TokenBucket:
+    # Token bucket: `rate` token per detik, tersimpan paling banyak `burst` token.
+    # Pemanggil memesan token di bawah lock singkat dan menunggu di luar lock,
+    # sehingga pemanggil konkuren diberi jarak sesuai `rate` alih-alih antre di mutex.
+    def __init__(self, rate, burst=1):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        if burst < 1:
+            raise ValueError("burst must be at least 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._tokens = float(burst)
+        self._last = time.monotonic()
+        self._lock = Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._last
+        if elapsed > 0:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+            self._last = now
+
+    def try_acquire(self, tokens=1):
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return True
+            return False
+
+    def reserve(self, tokens=1):
+        # Ambil token sekarang (saldo boleh negatif) dan kembalikan berapa lama
+        # pemanggil harus menunggu sebelum boleh memakainya.
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= tokens
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def refund(self, tokens=1):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + tokens)
+
+    def acquire(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, tokens=1):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+class RateLimiter:
+    # Bucket global ditambah bucket per topik (opsional). Publish harus mendapat token
+    # dari keduanya; lama tunggu adalah yang terpanjang dari kedua pemesanan.
+    def __init__(self, rate, burst=1, topic_rate=None, topic_burst=None, topic_rates=None):
+        self.global_bucket = TokenBucket(rate, burst) if rate else None
+        self.topic_rate = topic_rate
+        self.topic_burst = topic_burst if topic_burst is not None else burst
+        self.topic_rates = dict(topic_rates or {})  # topik -> (rate, burst)
+        self._topic_buckets = {}
+        self._topic_lock = Lock()
+
+    def topic_bucket(self, topic):
+        bucket = self._topic_buckets.get(topic)
+        if bucket is not None:
+            return bucket
+        rate, burst = self.topic_rates.get(topic, (self.topic_rate, self.topic_burst))
+        if not rate:
+            return None
+        with self._topic_lock:
+            bucket = self._topic_buckets.get(topic)
+            if bucket is None:
+                bucket = TokenBucket(rate, burst)
+                self._topic_buckets[topic] = bucket
+        return bucket
+
+    def set_topic_rate(self, topic, rate, burst=None):
+        with self._topic_lock:
+            self.topic_rates[topic] = (rate, burst if burst is not None else self.topic_burst)
+            self._topic_buckets.pop(topic, None)
+
+    def _buckets(self, topic, use_global=True):
+        buckets = []
+        if topic is not None:
+            bucket = self.topic_bucket(topic)
+            if bucket is not None:
+                buckets.append(bucket)
+        if use_global and self.global_bucket is not None:
+            buckets.append(self.global_bucket)
+        return buckets
+
+    def try_acquire(self, topic=None, tokens=1, use_global=True):
+        taken = []
+        for bucket in self._buckets(topic, use_global):
+            if not bucket.try_acquire(tokens):
+                for other in taken:
+                    other.refund(tokens)
+                return False
+            taken.append(bucket)
+        return True
+
+    def reserve(self, topic=None, tokens=1, use_global=True):
+        # use_global=False: hanya bucket per topik (misalnya publish QoS 1/2 yang lajunya diatur jendela in-flight)
+        wait = 0.0
+        for bucket in self._buckets(topic, use_global):
+            wait = max(wait, bucket.reserve(tokens))
+        return wait
+
+    def acquire(self, topic=None, tokens=1, use_global=True):
+        wait = self.reserve(topic, tokens, use_global)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, topic=None, tokens=1, use_global=True):
+        wait = self.reserve(topic, tokens, use_global)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
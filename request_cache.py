@@ -0,0 +1,68 @@
+import json
+import time
+from collections import OrderedDict
+from threading import Lock
+
+# Cache hasil handler untuk action idempoten, dengan kunci isi request tanpa request_id.
+# Request identik yang datang saat hasilnya masih dihitung tidak menjalankan handler
+# lagi: pemanggilnya menunggu sebagai waiter dan dijawab begitu hasil pertama selesai.
+HIT = "hit"
+WAIT = "wait"
+MISS = "miss"
+
+
+def request_key(request_data):
+    # Urutan field dan request_id tidak mempengaruhi kunci
+    body = {key: value for key, value in request_data.items() if key != 'request_id'}
+    return json.dumps(body, sort_keys=True, separators=(",", ":"), default=str)
+
+
+class RequestCache:
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._lock = Lock()
+        self._results = OrderedDict() # kunci -> (hasil, waktu kedaluwarsa monotonic)
+        self._inflight = {} # kunci -> [waiter]
+        self.stats = {'hits': 0, 'misses': 0, 'coalesced': 0, 'expired': 0, 'evictions': 0}
+
+    def lookup(self, key, waiter):
+        # (HIT, hasil) | (WAIT, None): waiter dicatat | (MISS, None): pemanggil wajib complete()/fail()
+        with self._lock:
+            cached = self._results.get(key)
+            if cached is not None:
+                result, expires = cached
+                if expires > time.monotonic():
+                    self._results.move_to_end(key)
+                    self.stats['hits'] += 1
+                    return HIT, result
+                del self._results[key]
+                self.stats['expired'] += 1
+            waiters = self._inflight.get(key)
+            if waiters is not None:
+                waiters.append(waiter)
+                self.stats['coalesced'] += 1
+                return WAIT, None
+            self._inflight[key] = []
+            self.stats['misses'] += 1
+            return MISS, None
+
+    def complete(self, key, result, ttl):
+        # Simpan hasil selama ttl detik; mengembalikan waiter yang harus dijawab dengan hasil ini
+        with self._lock:
+            waiters = self._inflight.pop(key, [])
+            if ttl > 0:
+                self._results[key] = (result, time.monotonic() + ttl)
+                self._results.move_to_end(key)
+                if len(self._results) > self.maxsize:
+                    self._results.popitem(last=False)
+                    self.stats['evictions'] += 1
+            return waiters
+
+    def fail(self, key):
+        # Error tidak di-cache; waiter dijawab dengan error yang sama
+        with self._lock:
+            return self._inflight.pop(key, [])
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, size=len(self._results), inflight=len(self._inflight))
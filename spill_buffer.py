@@ -0,0 +1,169 @@
+import mmap
+import os
+import struct
+import time
+from threading import RLock
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+# Format record: [length:I][qos:B][retain:B][received:d][topic_len:H][payload_len:I] topic payload properties
+# Panjang nol menandai akhir bagian segmen yang terpakai; bit CONSUMED diset setelah
+# record dibaca kembali, sehingga setelah restart pembacaan dilanjutkan sesudahnya.
+# msg.timestamp hanya berlaku di dalam proses (time.monotonic), jadi record menyimpan
+# waktu terima wall-clock dan decode_message menghitung ulang timestamp-nya; umur pesan,
+# dan dengan itu sisa MessageExpiryInterval, tetap benar setelah restart.
+LENGTH = struct.Struct("!I")
+CONSUMED = 0x80000000
+HEADER = struct.Struct("!BBdHI")
+SEGMENT_PREFIX = "spill-"
+SEGMENT_SUFFIX = ".seg"
+
+
+def encode_message(msg):
+    topic = msg.topic.encode()
+    properties = msg.properties.pack() if getattr(msg, "properties", None) is not None else b""
+    received = time.time() - (time.monotonic() - msg.timestamp)
+    header = HEADER.pack(msg.qos, int(msg.retain), received, len(topic), len(msg.payload))
+    return b"".join((header, topic, msg.payload, properties))
+
+
+def decode_message(record):
+    qos, retain, received, topic_len, payload_len = HEADER.unpack_from(record)
+    offset = HEADER.size
+    topic = bytes(record[offset:offset + topic_len])
+    offset += topic_len
+    msg = mqtt.MQTTMessage(topic=topic)
+    msg.payload = bytes(record[offset:offset + payload_len])
+    offset += payload_len
+    msg.qos = qos
+    msg.retain = bool(retain)
+    # Tidak pernah di masa depan, misalnya setelah jam sistem dimundurkan
+    msg.timestamp = time.monotonic() - max(0.0, time.time() - received)
+    msg.properties = Properties(PacketTypes.PUBLISH)
+    if offset < len(record):
+        msg.properties.unpack(bytes(record[offset:]))
+    return msg
+
+
+class _Segment:
+    def __init__(self, path, size=None):
+        self.path = path
+        if size is not None:
+            with open(path, "wb") as f:
+                f.truncate(size)
+        self._file = open(path, "r+b")
+        self.map = mmap.mmap(self._file.fileno(), 0)
+        self.size = len(self.map)
+        self.write_offset = 0
+
+    def close(self, delete=False):
+        self.map.close()
+        self._file.close()
+        if delete:
+            os.remove(self.path)
+
+
+class SpillBuffer:
+    # Tingkat luapan untuk subscriber: log append-only berupa file segmen yang di-mmap,
+    # dibaca kembali dengan urutan FIFO. Penulisan hanya menyentuh mapping; flush()
+    # (msync) diserahkan ke pemanggil agar bisa dikelompokkan.
+    def __init__(self, directory, segment_size=16 * 1024 * 1024):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.lock = RLock()
+        self._segments = []  # segmen yang belum habis dibaca, urut dari yang tertua
+        self._read_offset = 0
+        self._next_seq = 0
+        self._pending = 0
+        os.makedirs(directory, exist_ok=True)
+        self._recover()
+
+    def _segment_path(self, seq):
+        return os.path.join(self.directory, f"{SEGMENT_PREFIX}{seq:08d}{SEGMENT_SUFFIX}")
+
+    def _recover(self):
+        # Segmen sisa proses sebelumnya dibaca ulang, sehingga pesan yang sudah di-spill tidak hilang
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith(SEGMENT_PREFIX) and n.endswith(SEGMENT_SUFFIX))
+        for name in names:
+            segment = _Segment(os.path.join(self.directory, name))
+            offset = 0
+            while offset + LENGTH.size <= segment.size:
+                (length,) = LENGTH.unpack_from(segment.map, offset)
+                consumed = length & CONSUMED
+                length &= ~CONSUMED
+                if length == 0 or offset + LENGTH.size + length > segment.size:
+                    break
+                offset += LENGTH.size + length
+                if consumed:
+                    if not self._segments:
+                        self._read_offset = offset
+                else:
+                    self._pending += 1
+            segment.write_offset = offset
+            self._segments.append(segment)
+            self._next_seq = int(name[len(SEGMENT_PREFIX):-len(SEGMENT_SUFFIX)]) + 1
+
+    def __len__(self):
+        return self._pending
+
+    def _roll(self, needed):
+        if self._segments:
+            self._segments[-1].map.flush()
+        segment = _Segment(self._segment_path(self._next_seq), max(self.segment_size, needed))
+        self._next_seq += 1
+        self._segments.append(segment)
+        return segment
+
+    def append(self, msg):
+        record = encode_message(msg)
+        needed = LENGTH.size + len(record)
+        with self.lock:
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or segment.write_offset + needed > segment.size:
+                segment = self._roll(needed)
+            offset = segment.write_offset
+            segment.map[offset + LENGTH.size:offset + needed] = record
+            if offset + needed + LENGTH.size <= segment.size:
+                LENGTH.pack_into(segment.map, offset + needed, 0)
+            LENGTH.pack_into(segment.map, offset, len(record))
+            segment.write_offset += needed
+            self._pending += 1
+
+    def pop(self):
+        with self.lock:
+            while self._segments:
+                segment = self._segments[0]
+                offset = self._read_offset
+                if offset < segment.write_offset:
+                    (length,) = LENGTH.unpack_from(segment.map, offset)
+                    start = offset + LENGTH.size
+                    msg = decode_message(segment.map[start:start + length])
+                    LENGTH.pack_into(segment.map, offset, length | CONSUMED)
+                    self._read_offset = start + length
+                    self._pending -= 1
+                    return msg
+                if len(self._segments) == 1:
+                    if offset:
+                        # Segmen aktif sudah habis dibaca: mulai lagi dari awal agar tidak tumbuh terus
+                        segment.write_offset = 0
+                        self._read_offset = 0
+                        LENGTH.pack_into(segment.map, 0, 0)
+                    return None
+                segment.close(delete=True)
+                self._segments.pop(0)
+                self._read_offset = 0
+            return None
+
+    def flush(self):
+        with self.lock:
+            if self._segments:
+                self._segments[-1].map.flush()
+
+    def close(self):
+        with self.lock:
+            for segment in self._segments:
+                segment.map.flush()
+                segment.close()
+            self._segments = []
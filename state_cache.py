@@ -0,0 +1,152 @@
+import json
+import os
+import time
+from threading import Lock
+
+from topic_router import validate_filter
+
+# Last-value cache: nilai terakhir per topik, diindeks per device id dan dalam trie
+# topik sehingga query dengan filter '+'/'#' hanya menelusuri cabang yang cocok.
+# Isinya bisa disimpan ke file JSON dan dimuat lagi saat start (warm restart).
+
+
+class _Node:
+    __slots__ = ("children", "entry")
+
+    def __init__(self):
+        self.children = {}
+        self.entry = None
+
+
+class StateCache:
+    def __init__(self):
+        self._lock = Lock()
+        self._root = _Node()
+        self._entries = {} # topik -> {'topic', 'device_id', 'data', 'retain', 'updated'}
+        self._devices = {} # device id -> {topik: entry}
+        self.dirty = False # Ada perubahan sejak save() terakhir
+        self.stats = {'updates': 0, 'removals': 0, 'hits': 0, 'misses': 0}
+
+    def update(self, topic, data, device_id=None, retain=False, updated=None):
+        entry = {'topic': topic, 'device_id': device_id, 'data': data, 'retain': retain, 'updated': updated or time.time()}
+        with self._lock:
+            old = self._entries.get(topic)
+            if old is not None and old['device_id'] != device_id:
+                self._unindex_device(old)
+            self._entries[topic] = entry
+            node = self._root
+            for level in topic.split("/"):
+                node = node.children.setdefault(level, _Node())
+            node.entry = entry
+            if device_id is not None:
+                self._devices.setdefault(device_id, {})[topic] = entry
+            self.stats['updates'] += 1
+            self.dirty = True
+
+    def remove(self, topic):
+        # Misalnya retained message yang dihapus (payload kosong)
+        with self._lock:
+            entry = self._entries.pop(topic, None)
+            if entry is None:
+                return
+            self._unindex_device(entry)
+            levels = topic.split("/")
+            path = [self._root]
+            for level in levels:
+                path.append(path[-1].children[level])
+            path[-1].entry = None
+            for i in range(len(levels), 0, -1):
+                if path[i].entry is not None or path[i].children:
+                    break
+                del path[i - 1].children[levels[i - 1]]
+            self.stats['removals'] += 1
+            self.dirty = True
+
+    def _unindex_device(self, entry):
+        topics = self._devices.get(entry['device_id'])
+        if topics is not None:
+            topics.pop(entry['topic'], None)
+            if not topics:
+                del self._devices[entry['device_id']]
+
+    def get(self, topic):
+        with self._lock:
+            entry = self._entries.get(topic)
+            self.stats['hits' if entry is not None else 'misses'] += 1
+            return dict(entry) if entry is not None else None
+
+    def get_device(self, device_id):
+        # {topik: entry} untuk satu device, None jika belum pernah terlihat
+        with self._lock:
+            topics = self._devices.get(device_id)
+            self.stats['hits' if topics else 'misses'] += 1
+            return {topic: dict(entry) for topic, entry in topics.items()} if topics else None
+
+    def get_many(self, device_ids):
+        with self._lock:
+            result = {}
+            for device_id in device_ids:
+                topics = self._devices.get(device_id)
+                self.stats['hits' if topics else 'misses'] += 1
+                result[device_id] = {topic: dict(entry) for topic, entry in topics.items()} if topics else None
+            return result
+
+    def query(self, topic_filter):
+        # Semua entry yang topiknya cocok dengan filter (aturan wildcard sama dengan topic_router)
+        levels = validate_filter(topic_filter)
+        with self._lock:
+            matched = []
+            self._collect(self._root, levels, 0, matched)
+            return [dict(entry) for entry in matched]
+
+    def _collect(self, node, levels, depth, matched):
+        if depth == len(levels):
+            if node.entry is not None:
+                matched.append(node.entry)
+            return
+        level = levels[depth]
+        if level == "#":
+            # 'a/#' juga cocok dengan 'a'; '#' di level pertama tidak cocok dengan topik '$...'
+            stack = [node] if depth else [child for name, child in node.children.items() if not name.startswith("$")]
+            while stack:
+                current = stack.pop()
+                if current.entry is not None:
+                    matched.append(current.entry)
+                stack.extend(current.children.values())
+            return
+        if level == "+":
+            for name, child in node.children.items():
+                if depth or not name.startswith("$"):
+                    self._collect(child, levels, depth + 1, matched)
+            return
+        child = node.children.get(level)
+        if child is not None:
+            self._collect(child, levels, depth + 1, matched)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.stats, topics=len(self._entries), devices=len(self._devices))
+
+    def save(self, path):
+        # Tulis ke file sementara lalu os.replace, sehingga snapshot lama tidak pernah setengah tertulis
+        with self._lock:
+            entries = list(self._entries.values())
+            self.dirty = False
+        temp_path = f"{path}.tmp"
+        with open(temp_path, "w") as f:
+            json.dump(entries, f, default=str)
+        os.replace(temp_path, path)
+        return len(entries)
+
+    def load(self, path):
+        if not os.path.exists(path):
+            return 0
+        with open(path) as f:
+            entries = json.load(f)
+        for entry in entries:
+            self.update(entry['topic'], entry['data'], entry.get('device_id'), entry.get('retain', False), entry.get('updated'))
+        self.dirty = False
+        return len(entries)
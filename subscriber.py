@@ -1,14 +1,33 @@
 import paho.mqtt.client as mqtt
+import argparse
+import logging
+import os
 import time
-import ssl
 import random
-import json
-from queue import Queue, Empty # Tambahkan Empty
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue, Empty, Full # Tambahkan Empty
 from threading import Lock, Thread # Tambahkan Thread
+from rate_limiter import TokenBucket
+from spill_buffer import SpillBuffer
+from topic_router import TopicRouter
+from codec import encode_payload, decode_payload
+from deadline_queue import DeadlineQueue, ORDER_FIFO, ORDER_EDF, message_deadline
+from metrics import registry as metrics
+from mqtt_logging import get_logger, sampled, rate_limited, setup_logging
+from coalescer import is_envelope, split_envelope
+from dedup import DedupIndex, ResponseCache
+from state_cache import StateCache
+from request_cache import RequestCache, request_key, HIT, WAIT
+from backpressure import AckTracker, ReadGate, NetworkLoop
+from connection import ConnectionReadiness, CONNECT_TIMEOUT, create_tls_context, schedule_reconnect
 
 # --- Configuration --- (tetap sama)
-BROKER_HOST = "broker.emqx.io"
-BROKER_PORT = 8883
+# Broker bisa diganti lewat environment variable, misalnya untuk broker lokal (local_broker.py)
+BROKER_HOST = os.environ.get("MQTT_BROKER_HOST", "broker.emqx.io")
+BROKER_PORT = int(os.environ.get("MQTT_BROKER_PORT", "8883"))
+USE_TLS = os.environ.get("MQTT_USE_TLS", "1") != "0"
 CLIENT_ID_BASE = "python_subscriber_emqx"
 CLIENT_ID = f"{CLIENT_ID_BASE}_{int(time.time())}{random.randint(0, 999)}"
 # Authentication (uncomment for brokers requiring credentials)
@@ -26,176 +45,836 @@ TOPICS_TO_SUBSCRIBE = [
     (REQUEST_TOPIC, 1),
     (RESPONSE_TOPIC, 1)
 ]
+# Shared subscription MQTT v5: dengan nama grup, setiap topik di-subscribe sebagai
+# $share/<grup>/<topik> dan broker membagi pesan di antara anggota grup
+# (lihat subscriber_supervisor.py). Pesan retained tidak dikirim ke shared subscription.
+SHARED_GROUP = None
+
+# Logging (level lewat MQTT_LOG_LEVEL; log per pesan disampling per topik, warning dibatasi per jenis)
+logger = get_logger("subscriber")
+message_log = sampled(logger)
+warning_log = rate_limited(logger)
 
 # Flow Control Configuration
 MAX_QUEUE_SIZE = 2000
-RATE_LIMIT = 100 # Pesan per detik yang bisa diproses
-last_process_time = 0
-process_lock = Lock()
-message_queue = Queue(maxsize=MAX_QUEUE_SIZE)
+RATE_LIMIT = 100 # Pesan per detik yang bisa diproses, per partisi
+PROCESSING_DELAY = 0.1 # Simulasi waktu pemrosesan per pesan (detik)
+QUEUE_ORDER = ORDER_FIFO # ORDER_EDF = proses pesan dengan deadline paling awal lebih dulu
+expired_messages = 0
+
+def on_messages_expired(messages):
+    # Dipanggil saat pesan kedaluwarsa dibuang dari antrean, tanpa pernah di-decode
+    global expired_messages
+    expired_messages += len(messages)
+    metrics.counter("messages_expired", client="subscriber").inc(len(messages))
+    warning_log.info("expired", "Subscriber (%s): Discarded %d expired messages (total %d)", CLIENT_ID, len(messages), expired_messages)
+    for item in messages:
+        ack_tracker.release(item[0] if isinstance(item, tuple) else item) # Antrean partisi berisi (msg, data)
+
+message_queue = DeadlineQueue(maxsize=MAX_QUEUE_SIZE, order=QUEUE_ORDER, on_expired=on_messages_expired)
+
+# Backpressure Configuration (broker menahan pesan saat subscriber kewalahan, bukan subscriber yang drop)
+BACKPRESSURE_ENABLED = True # Manual ack QoS 1/2 setelah diproses + jeda baca socket di high water
+RECEIVE_MAXIMUM = None # Pesan QoS 1/2 belum di-ack yang boleh dikirim broker; None = dihitung oleh receive_maximum()
+BACKPRESSURE_TARGET_LATENCY = 2.0 # Detik kerja worker yang boleh menunggu di antrean, untuk menghitung ReceiveMaximum
+BACKPRESSURE_HIGH_WATER = int(MAX_QUEUE_SIZE * 0.8) # Berhenti membaca socket di kedalaman message_queue ini (di bawah SPILL_HIGH_WATER)
+BACKPRESSURE_LOW_WATER = MAX_QUEUE_SIZE // 2 # Lanjut membaca setelah antrean turun ke sini
+MAX_READ_PAUSE = 30 # Detik maksimum jeda baca, harus di bawah keepalive (PINGRESP tidak terbaca selama jeda)
+
+def on_read_paused(depth):
+    warning_log.info("read_paused", "Subscriber (%s): Paused socket reads at message queue depth %d", CLIENT_ID, depth)
+
+ack_tracker = AckTracker()
+read_gate = ReadGate(message_queue.qsize, BACKPRESSURE_HIGH_WATER, BACKPRESSURE_LOW_WATER, MAX_READ_PAUSE, on_pause=on_read_paused)
 stop_processing_thread = False # Flag untuk menghentikan thread
 
+# Worker Pool Configuration
+NUM_WORKERS = 4 # Jumlah worker pemroses; tiap worker memiliki satu partisi
+PARTITION_KEY = None # None = partisi berdasarkan topik, atau nama field payload (misal 'device_id')
+PARTITION_QUEUE_SIZE = 500
+partition_queues = []
+partition_limiters = []
+worker_threads = []
+
+# Spill Buffer Configuration (pesan ditulis ke disk alih-alih didrop saat antrean penuh)
+SPILL_ENABLED = True
+SPILL_DIR = "spill"
+SPILL_SEGMENT_SIZE = 16 * 1024 * 1024 # Ukuran satu file segmen (bytes)
+SPILL_HIGH_WATER = int(MAX_QUEUE_SIZE * 0.9) # Mulai spill ke disk di atas kedalaman antrean ini
+SPILL_LOW_WATER = MAX_QUEUE_SIZE // 2 # Kembalikan pesan dari disk saat antrean turun ke sini
+SPILL_FLUSH_INTERVAL = 1.0 # Detik antar msync, bukan satu fsync per pesan
+spill_buffer = None
+
+# Request Handler Configuration (request diproses di thread pool, bukan di thread jaringan paho)
+REQUEST_POOL_SIZE = 8
+REQUEST_BACKLOG_LIMIT = 1000 # Request yang sedang berjalan + menunggu; di atas ini langsung dijawab 'busy'
+DEFAULT_ACTION_CONCURRENCY = 4 # Maksimum request paralel per action
+request_handlers = {} # action -> {'handler', 'limit', 'active', 'backlog'}
+request_handlers_lock = Lock()
+request_executor = ThreadPoolExecutor(max_workers=REQUEST_POOL_SIZE, thread_name_prefix="request")
+requests_outstanding = 0
+REQUEST_CACHE_SIZE = 1024 # Hasil action idempoten (cache_ttl) yang disimpan, LRU
+request_cache = RequestCache(REQUEST_CACHE_SIZE)
+
+# Dedup Configuration (pesan QoS 1/2 yang dikirim ulang dibuang sebelum masuk message_queue)
+DEDUP_ENABLED = True # Request dengan request_id yang sama selalu dicek; pesan hanya jika ada kunci di bawah ini
+DEDUP_ID_FIELDS = () # Misalnya ('message_id',): kunci dari field payload (di-decode di thread jaringan)
+DEDUP_CONTENT_HASH = False # True = pesan tanpa field id dikunci hash topik + payload (bacaan identik yang sah juga dibuang)
+DEDUP_CAPACITY = 1000000 # Kunci per generasi Bloom filter (memori tetap, 2 generasi)
+DEDUP_WINDOW = 600 # Detik sebelum generasi diganti; duplikat dikenali minimal selama ini atau DEDUP_CAPACITY pesan
+DEDUP_ERROR_RATE = 1e-6 # Peluang pesan baru salah dianggap duplikat
+RESPONSE_CACHE_SIZE = 10000 # Respons terakhir per request_id untuk menjawab request duplikat
+dedup_index = None # Dibuat oleh message_dedup_index() saat pesan pertama yang punya kunci dedup
+dedup_lock = Lock()
+duplicate_messages = 0
+response_cache = ResponseCache(RESPONSE_CACHE_SIZE)
+
+# State Cache Configuration (nilai terakhir per topik/device untuk menjawab request secara lokal)
+STATE_CACHE_FILTERS = [ # Device id dari field STATE_DEVICE_ID_FIELD, atau level '+' pertama di filter
+    f"{YOUR_UNIQUE_TOPIC_PREFIX}/iot/status/retained",
+    f"{YOUR_UNIQUE_TOPIC_PREFIX}/iot/client/+/#"
+]
+STATE_DEVICE_ID_FIELD = 'device_id'
+STATE_SNAPSHOT_PATH = os.environ.get("MQTT_STATE_SNAPSHOT") # Misalnya state.json, None = tanpa snapshot
+STATE_SNAPSHOT_INTERVAL = 30 # Detik antar snapshot (hanya jika ada perubahan)
+GET_MANY_LIMIT = 1000 # Maksimum device per request get_many
+GET_MANY_CACHE_TTL = 1.0 # Detik hasil get_many yang identik dipakai ulang (None = tanpa cache); state bisa tertinggal selama ini
+# Dengan SHARED_GROUP, STATE_CACHE_FILTERS juga di-subscribe tanpa $share di setiap worker agar
+# setiap worker melihat semua pesan status (termasuk retained); salinan dari langganan ini
+# dikenali lewat SubscriptionIdentifier dan hanya mengisi state_cache
+STATE_SUBSCRIPTION_QOS = 1
+STATE_SUBSCRIPTION_ID = 1
+state_cache = StateCache()
+state_cache_partial = False # True jika cache hanya berisi sebagian pesan status (broker tanpa SubscriptionIdentifier)
+metrics.gauge("state_cache_topics", lambda: len(state_cache), client="subscriber")
+
+# Topic Routing Configuration
+ROUTE_CACHE_SIZE = 1024 # Jumlah topik "panas" yang hasil pencocokannya di-cache
+FILTER_QUEUE_SIZE = 500 # Ukuran antrean untuk filter yang memiliki worker sendiri
+topic_router = TopicRouter(cache_size=ROUTE_CACHE_SIZE)
+state_router = TopicRouter(cache_size=ROUTE_CACHE_SIZE) # STATE_CACHE_FILTERS -> update state_cache
+filter_workers = [] # Filter dengan antrean dan worker sendiri
+
+# Metrics Configuration
+METRICS_HTTP_PORT = None # Port endpoint Prometheus (/metrics), None = tidak dijalankan
+METRICS_TOPIC = f"{YOUR_UNIQUE_TOPIC_PREFIX}/metrics/{CLIENT_ID}"
+METRICS_PUBLISH_INTERVAL = 10 # Detik antar snapshot metrics ke METRICS_TOPIC (None = tidak dipublish)
+metrics.gauge("message_queue_depth", message_queue.qsize, client="subscriber")
+metrics.gauge("partition_queue_depth", lambda: sum(queue.qsize() for queue in partition_queues), client="subscriber")
+metrics.gauge("spill_depth", lambda: len(spill_buffer) if spill_buffer is not None else 0, client="subscriber")
+metrics.gauge("requests_outstanding", lambda: requests_outstanding, client="subscriber")
+metrics.gauge("messages_unacked", lambda: len(ack_tracker), client="subscriber")
+
+def subscription_list():
+    if SHARED_GROUP:
+        return [(f"$share/{SHARED_GROUP}/{topic}", qos) for topic, qos in TOPICS_TO_SUBSCRIBE]
+    return list(TOPICS_TO_SUBSCRIBE)
+
+def state_subscription():
+    # Langganan non-shared untuk state_cache, hanya diperlukan jika topik lain di-subscribe dengan $share
+    properties = mqtt.Properties(mqtt.PacketTypes.SUBSCRIBE)
+    properties.SubscriptionIdentifier = STATE_SUBSCRIPTION_ID
+    return [(topic_filter, STATE_SUBSCRIPTION_QOS) for topic_filter in STATE_CACHE_FILTERS], properties
+
+def is_state_copy(msg):
+    return SHARED_GROUP is not None and STATE_SUBSCRIPTION_ID in (getattr(msg.properties, 'SubscriptionIdentifier', None) or ())
+
+# userdata client berisi ConnectionReadiness dan topik per mid SUBSCRIBE (lihat create_subscriber_client)
 def on_connect(client, userdata, flags, reason_code, properties=None):
+    global state_cache_partial
     if reason_code == 0:
-        print(f"Subscriber ({CLIENT_ID}): Connected to MQTT broker ({BROKER_HOST}) with result code: {reason_code}")
-        for topic, qos in TOPICS_TO_SUBSCRIBE:
-            print(f"Subscriber: Subscribing to topic '{topic}' with QoS {qos}")
-            client.subscribe(topic, qos=qos)
+        logger.info(f"Subscriber ({CLIENT_ID}): Connected to MQTT broker ({BROKER_HOST}) with result code: {reason_code}")
+        # Semua topik dalam satu paket SUBSCRIBE, satu SUBACK untuk semuanya
+        subscriptions = subscription_list()
+        logger.info(f"Subscriber: Subscribing to {len(subscriptions)} topics: {', '.join(f'{topic} (QoS {qos})' for topic, qos in subscriptions)}")
+        _, mid = client.subscribe(subscriptions)
+        userdata['subscriptions'] = {mid: subscriptions}
+        if SHARED_GROUP and STATE_CACHE_FILTERS:
+            # SubscriptionIdentifier berbeda per paket SUBSCRIBE, jadi langganan state dikirim terpisah
+            state_cache_partial = not getattr(properties, 'SubscriptionIdentifierAvailable', 1)
+            if state_cache_partial:
+                logger.warning(f"Subscriber ({CLIENT_ID}): Broker does not support subscription identifiers, state cache only sees this worker's share of messages")
+            else:
+                state_subscriptions, state_properties = state_subscription()
+                logger.info(f"Subscriber: Subscribing to state topics without $share: {', '.join(topic for topic, _ in state_subscriptions)}")
+                _, state_mid = client.subscribe(state_subscriptions, properties=state_properties)
+                userdata['subscriptions'][state_mid] = state_subscriptions
+        userdata['readiness'].connected(client, list(userdata['subscriptions']))
     else:
-        print(f"Subscriber ({CLIENT_ID}): Failed to connect, result code: {reason_code}")
-
-def process_message(msg):
-    global last_process_time
-    with process_lock: # Lock untuk sinkronisasi rate limit, jika diperlukan antar thread (meski di sini hanya 1 worker)
-        current_time = time.time()
-        # Pastikan tidak melebihi RATE_LIMIT
-        time_since_last_process = current_time - last_process_time
-        required_delay = 1.0 / RATE_LIMIT
-        if time_since_last_process < required_delay:
-            time.sleep(required_delay - time_since_last_process)
-
-        payload_str = msg.payload.decode(errors='ignore')
-        try:
-            data = json.loads(payload_str)
+        logger.error(f"Subscriber ({CLIENT_ID}): Failed to connect, result code: {reason_code}")
+        userdata['readiness'].refused(reason_code)
 
-            # Cek application-level expiry (jika ada field 'expiry' dalam payload JSON)
-            application_level_expiry_ts = data.get('expiry') # Ambil nilai 'expiry' dari payload JSON
-            processing_delay = 0.1 # Default delay pendek
+def process_message(msg, data=None, limiter=None):
+    # Rate limit per partisi; pesan di partisi lain tetap diproses paralel
+    if limiter is not None:
+        limiter.acquire()
 
-            if application_level_expiry_ts is not None:
-                processing_delay = 2.0 # Delay lebih lama jika ada field 'expiry' di payload
-                print(f"Subscriber: Message from {msg.topic} has application-level expiry field. Timestamp: {data.get('timestamp')}, App Expiry: {application_level_expiry_ts}, Current Time: {time.time()}")
-                if time.time() > application_level_expiry_ts:
-                    print(f"Subscriber: APPLICATION-LEVEL EXPIRY! Message from {msg.topic} expired: {data}")
-                    last_process_time = time.time()
-                    return # Jangan proses lebih lanjut
+    try:
+        start = time.perf_counter()
+        if data is None:
+            data = decode_payload(msg.payload, msg.properties)
+            metrics.stage("decode", msg.topic).observe(time.perf_counter() - start)
 
-            time.sleep(processing_delay) # Terapkan delay pemrosesan
+        # Cek application-level expiry (jika ada field 'expiry' dalam payload JSON).
+        # Pesan yang deadline-nya diketahui dari properti MQTT sudah dibuang di antrean;
+        # cek ini menangani publisher yang hanya mengisi field 'expiry' di payload.
+        application_level_expiry_ts = data.get('expiry') # Ambil nilai 'expiry' dari payload JSON
 
-            # Jika sampai sini, berarti pesan belum kedaluwarsa (baik MQTT-level maupun application-level)
-            print(f"Subscriber: Processing message from topic '{msg.topic}': {data}")
-            last_process_time = time.time()
+        if application_level_expiry_ts is not None and time.time() > application_level_expiry_ts:
+            metrics.counter("messages_expired", client="subscriber").inc()
+            warning_log.warning("application_expiry", "Subscriber: APPLICATION-LEVEL EXPIRY! Message from %s expired: %s", msg.topic, data, extra={'topic': msg.topic})
+            return # Jangan proses lebih lanjut
 
-        except json.JSONDecodeError:
-            print(f"Subscriber: Non-JSON message received on topic {msg.topic}: {payload_str}")
-            last_process_time = time.time()
-        except Exception as e:
-            print(f"Subscriber: Error processing message from topic {msg.topic}: {e}, Payload: {payload_str}")
-            last_process_time = time.time()
+        time.sleep(PROCESSING_DELAY) # Terapkan delay pemrosesan
+
+        # Jika sampai sini, berarti pesan belum kedaluwarsa (baik MQTT-level maupun application-level)
+        message_log.info(msg.topic, "Subscriber: Processing message from topic '%s': %s", msg.topic, data)
+        metrics.stage("process", msg.topic).observe(time.perf_counter() - start)
+
+    except ValueError:
+        metrics.counter("messages_undecodable", client="subscriber").inc()
+        warning_log.warning("undecodable", "Subscriber: Undecodable message received on topic %s: %s", msg.topic, msg.payload[:200], extra={'topic': msg.topic})
+    except Exception as e:
+        warning_log.log(logging.ERROR, "process_error", "Subscriber: Error processing message from topic %s: %s, Payload: %s", msg.topic, e, msg.payload[:200], extra={'topic': msg.topic})
+
+
+def register_action(action, max_concurrency=DEFAULT_ACTION_CONCURRENCY, inline=False, cache_ttl=None):
+    # Daftarkan handler untuk field 'action' pada request; handler menerima dict request
+    # dan mengembalikan dict hasil (atau raise exception untuk respons error).
+    # inline=True: handler dijalankan langsung di thread jaringan, tanpa antre di thread pool;
+    # hanya untuk handler yang cepat dan tidak pernah blocking (misalnya baca state_cache).
+    # cache_ttl: detik hasil handler dipakai ulang untuk request dengan isi yang sama
+    # (tanpa request_id); hanya untuk action idempoten yang tidak mengubah state
+    def decorator(handler):
+        request_handlers[action] = {
+            'handler': handler,
+            'limit': max_concurrency,
+            'inline': inline,
+            'cache_ttl': cache_ttl,
+            'active': 0,
+            'backlog': deque()
+        }
+        return handler
+    return decorator
+
+@register_action('get_device_status', inline=True)
+def action_get_device_status(request_data):
+    # state: {topik: {'data', 'updated', ...}} terakhir dari state_cache, None jika device belum terlihat
+    # (tidak disertakan jika state_cache hanya berisi sebagian pesan status)
+    device_id = request_data.get('device_id')
+    result = {
+        'device_id': device_id,
+        'location': request_data.get('location'),
+        'online': True
+    }
+    if not state_cache_partial:
+        result['state'] = state_cache.get_device(device_id)
+    return result
+
+@register_action('get_many', inline=True, cache_ttl=GET_MANY_CACHE_TTL)
+def action_get_many(request_data):
+    # Banyak device dalam satu respons: {'device_ids': [...]} dan/atau {'topic_filter': 'a/+/status'}
+    if state_cache_partial:
+        raise ValueError("State cache is incomplete on this worker (broker without subscription identifiers)")
+    device_ids = request_data.get('device_ids') or []
+    if not isinstance(device_ids, list):
+        raise ValueError("'device_ids' must be a list")
+    if len(device_ids) > GET_MANY_LIMIT:
+        raise ValueError(f"At most {GET_MANY_LIMIT} device_ids per request")
+    result = {'devices': state_cache.get_many(device_ids)}
+    topic_filter = request_data.get('topic_filter')
+    if topic_filter is not None:
+        entries = state_cache.query(topic_filter)
+        if len(entries) > GET_MANY_LIMIT:
+            raise ValueError(f"Topic filter matches more than {GET_MANY_LIMIT} topics")
+        result['topics'] = {entry['topic']: entry for entry in entries}
+    return result
 
+@register_action('set_target_temperature', max_concurrency=1)
+def action_set_target_temperature(request_data):
+    value = request_data.get('value')
+    if not isinstance(value, (int, float)):
+        raise ValueError("'value' must be a number")
+    return {
+        'device_id': request_data.get('device_id'),
+        'target_temperature': value
+    }
+
+def publish_response(client, response_topic, correlation_data, response_data):
+    response_properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    response_properties.CorrelationData = correlation_data # Echo back correlation data
+
+    client.publish(
+        response_topic,
+        encode_payload(response_data, response_properties),
+        qos=1,
+        properties=response_properties
+    )
+
+def publish_error_response(client, response_topic, correlation_data, request_id, error):
+    response_data = {
+        'request_id': request_id,
+        'status': 'error',
+        'timestamp': time.time(),
+        'error': error
+    }
+    publish_response(client, response_topic, correlation_data, response_data)
+    warning_log.info("error_response", "Subscriber: Sent error response to %s for request_id %s: %s", response_topic, request_id, error)
+    return response_data
+
+def answer_request(client, response_topic, correlation_data, request_data, result, error=None):
+    # Respons untuk satu pemanggil, dengan request_id dan CorrelationData miliknya sendiri
+    request_id = request_data['request_id']
+    response_data = None
+    try:
+        if error is None:
+            try:
+                response_data = {
+                    'request_id': request_id, # Gunakan request_id dari payload
+                    'status': 'success',
+                    'timestamp': time.time(),
+                    'data': {
+                        'message': 'Request processed successfully by subscriber',
+                        'request_data': request_data,
+                        'result': result
+                    }
+                }
+                publish_response(client, response_topic, correlation_data, response_data)
+                message_log.debug("response", "Subscriber: Sent response to %s for request_id %s", response_topic, request_id)
+                return
+            except Exception as e:
+                error = str(e)
+        response_data = publish_error_response(client, response_topic, correlation_data, request_id, error)
+    finally:
+        response_cache.complete(request_id, response_data)
+
+def execute_request(client, entry, response_topic, correlation_data, request_data):
+    error = None
+    try:
+        result = entry['handler'](request_data)
+    except Exception as e:
+        result, error = None, str(e)
+    waiters = []
+    if entry['cache_ttl'] is not None:
+        # Request identik yang datang selama handler berjalan dijawab dengan hasil yang sama
+        key = request_key(request_data)
+        waiters = request_cache.complete(key, result, entry['cache_ttl']) if error is None else request_cache.fail(key)
+    for waiter in [(client, response_topic, correlation_data, request_data)] + waiters:
+        answer_request(*waiter, result, error)
+
+def run_request(client, entry, response_topic, correlation_data, request_data):
+    global requests_outstanding
+    try:
+        execute_request(client, entry, response_topic, correlation_data, request_data)
+    finally:
+        with request_handlers_lock:
+            requests_outstanding -= 1
+            if entry['backlog']:
+                request_executor.submit(run_request, *entry['backlog'].popleft())
+            else:
+                entry['active'] -= 1
 
 def handle_request(client, msg):
+    # Dipanggil di thread jaringan paho: hanya parsing dan antre, handler berjalan di request_executor
+    # (kecuali action inline yang langsung dijawab dari state_cache)
+    global requests_outstanding
     try:
         properties = msg.properties
         response_topic = properties.ResponseTopic if properties and hasattr(properties, 'ResponseTopic') else None
         correlation_data = properties.CorrelationData if properties and hasattr(properties, 'CorrelationData') else None
 
         if not response_topic or not correlation_data:
-            print("Subscriber: Missing ResponseTopic or CorrelationData in request")
+            warning_log.warning("invalid_request", "Subscriber: Missing ResponseTopic or CorrelationData in request")
             return
 
-        request_data = json.loads(msg.payload.decode())
+        request_data = decode_payload(msg.payload, properties)
         request_id_from_payload = request_data.get('request_id') # request_id dari payload
 
         if not request_id_from_payload:
-            print("Subscriber: Missing request_id in request payload")
+            warning_log.warning("invalid_request", "Subscriber: Missing request_id in request payload")
             return
 
-        response_data = {
-            'request_id': request_id_from_payload, # Gunakan request_id dari payload
-            'status': 'success',
-            'timestamp': time.time(),
-            'data': {
-                'message': 'Request processed successfully by subscriber',
-                'request_data': request_data
-            }
-        }
+        action = request_data.get('action')
+        entry = request_handlers.get(action)
+        if entry is None:
+            publish_error_response(client, response_topic, correlation_data, request_id_from_payload, f"Unknown action: {action}")
+            return
+
+        if DEDUP_ENABLED:
+            # Request duplikat tidak menjalankan handler lagi: jawab dengan respons yang tersimpan,
+            # atau abaikan jika request aslinya masih diproses (responsnya akan tetap dikirim)
+            cached = response_cache.begin(request_id_from_payload)
+            if cached is not None:
+                metrics.counter("requests_duplicate", client="subscriber").inc()
+                if cached is not ResponseCache.PENDING:
+                    publish_response(client, response_topic, correlation_data, cached)
+                message_log.debug("duplicate_request", "Subscriber: Duplicate request_id %s answered from cache", request_id_from_payload)
+                return
+
+        waiter = (client, response_topic, correlation_data, request_data)
+        if entry['cache_ttl'] is not None:
+            status, result = request_cache.lookup(request_key(request_data), waiter)
+            if status == HIT:
+                metrics.counter("requests_cached", reason="hit").inc()
+                answer_request(*waiter, result)
+                return
+            if status == WAIT:
+                metrics.counter("requests_cached", reason="coalesced").inc()
+                return # Dijawab oleh execute_request yang sedang menghitung hasil yang sama
 
-        response_properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
-        response_properties.CorrelationData = correlation_data # Echo back correlation data
+        if entry['inline']:
+            execute_request(client, entry, response_topic, correlation_data, request_data)
+            return
 
-        client.publish(
-            response_topic,
-            json.dumps(response_data),
-            qos=1,
-            properties=response_properties
-        )
-        print(f"Subscriber: Sent response to {response_topic} for request_id {request_id_from_payload}")
+        job = (client, entry, response_topic, correlation_data, request_data)
+        with request_handlers_lock:
+            if requests_outstanding >= REQUEST_BACKLOG_LIMIT:
+                busy = True
+            else:
+                busy = False
+                requests_outstanding += 1
+                if entry['active'] < entry['limit']:
+                    entry['active'] += 1
+                    request_executor.submit(run_request, *job)
+                else:
+                    entry['backlog'].append(job)
+        if busy:
+            waiters = request_cache.fail(request_key(request_data)) if entry['cache_ttl'] is not None else []
+            for waiter_client, waiter_topic, waiter_correlation, waiter_request in [waiter] + waiters:
+                response_cache.discard(waiter_request['request_id'])
+                metrics.counter("requests_rejected", reason="busy").inc()
+                publish_error_response(waiter_client, waiter_topic, waiter_correlation, waiter_request['request_id'], "Subscriber is busy, try again later")
     except Exception as e:
-        print(f"Subscriber: Error handling request: {e}")
+        warning_log.log(logging.ERROR, "request_error", "Subscriber: Error handling request: %s", e)
 
-def on_message(client, userdata, msg):
-    # Pesan MQTT yang kedaluwarsa (MessageExpiryInterval) seharusnya sudah dibuang oleh broker
-    # dan tidak akan sampai ke callback on_message ini.
-    print(f"Subscriber ({CLIENT_ID}): Message received! Topic: '{msg.topic}', QoS: {msg.qos}, Retain: {msg.retain}")
+def dedup_key(msg):
+    # None = pesan tidak dicek (tidak ada field id dan DEDUP_CONTENT_HASH tidak aktif)
+    if DEDUP_ID_FIELDS:
+        try:
+            data = decode_payload(msg.payload, msg.properties)
+        except ValueError:
+            data = None
+        if isinstance(data, dict):
+            for field in DEDUP_ID_FIELDS:
+                if data.get(field) is not None:
+                    return f"{field}:{data[field]}".encode()
+    if DEDUP_CONTENT_HASH:
+        return msg.topic.encode() + b"\0" + msg.payload
+    return None
+
+def message_dedup_index():
+    # Bloom filter (sekitar 3,6 MB per generasi untuk 1 juta kunci) baru dialokasikan jika ada
+    # sumber kunci (DEDUP_ID_FIELDS/DEDUP_CONTENT_HASH), tidak di setiap proses yang mengimpor modul ini
+    global dedup_index
+    if dedup_index is None:
+        with dedup_lock:
+            if dedup_index is None:
+                dedup_index = DedupIndex(DEDUP_CAPACITY, DEDUP_WINDOW, DEDUP_ERROR_RATE)
+    return dedup_index
+
+def is_duplicate(msg):
+    # QoS 0 tidak pernah dikirim ulang oleh broker, dan pesan retained yang dikirim ulang saat
+    # subscribe adalah state terkini, bukan duplikat; jadi hanya QoS 1/2 non-retained yang dicek
+    global duplicate_messages
+    if not DEDUP_ENABLED or msg.qos == 0 or msg.retain:
+        return False
+    key = dedup_key(msg)
+    if key is None or not message_dedup_index().check_and_add(key):
+        return False
+    duplicate_messages += 1
+    metrics.counter("messages_duplicate", client="subscriber").inc()
+    warning_log.info("duplicate", "Subscriber (%s): Dropped duplicate message on topic %s (total %d)", CLIENT_ID, msg.topic, duplicate_messages, extra={'topic': msg.topic})
+    return True
 
-    if msg.topic == REQUEST_TOPIC:
-        handle_request(client, msg)
+def enqueue_message(client, msg):
+    if is_duplicate(msg):
         return
 
+    if spill_buffer is not None:
+        with spill_buffer.lock:
+            # Selama masih ada pesan di disk, pesan baru juga ditulis ke disk agar urutannya terjaga
+            if len(spill_buffer) or message_queue.qsize() >= SPILL_HIGH_WATER:
+                spill_buffer.append(msg)
+                metrics.counter("messages_spilled", client="subscriber").inc()
+                return
+
     if not message_queue.full():
+        ack_tracker.retain(msg) # Di-ack setelah diproses worker; pesan yang di-spill ke disk di-ack langsung
         message_queue.put(msg)
         # print(f"Subscriber ({CLIENT_ID}): Queued message from '{msg.topic}', queue size: {message_queue.qsize()}")
     else:
-        print(f"Subscriber ({CLIENT_ID}): Message queue is full, dropping message from topic {msg.topic}")
+        metrics.counter("messages_dropped", client="subscriber", reason="queue_full").inc()
+        warning_log.warning("queue_full", "Subscriber (%s): Message queue is full, dropping message from topic %s", CLIENT_ID, msg.topic)
+
+def bind_filter(topic_filter, handler, own_worker=False, queue_size=FILTER_QUEUE_SIZE):
+    # handler(client, msg) dipanggil untuk setiap pesan yang cocok dengan topic_filter.
+    # Dengan own_worker=True, pesan dimasukkan ke antrean filter ini dan handler berjalan di thread sendiri.
+    if own_worker:
+        worker = {'filter': topic_filter, 'handler': handler, 'queue': Queue(maxsize=queue_size)}
+        filter_workers.append(worker)
+
+        def enqueue_for_filter(client, msg):
+            ack_tracker.retain(msg)
+            try:
+                worker['queue'].put_nowait((client, msg))
+            except Full:
+                ack_tracker.release(msg)
+                metrics.counter("messages_dropped", client="subscriber", reason="filter_queue_full").inc()
+                warning_log.warning(topic_filter, "Subscriber (%s): Queue for filter '%s' is full, dropping message from topic %s", CLIENT_ID, topic_filter, msg.topic)
+        topic_router.add(topic_filter, enqueue_for_filter)
+    else:
+        topic_router.add(topic_filter, handler)
+
+def on_message(client, userdata, msg):
+    # Pesan MQTT yang kedaluwarsa (MessageExpiryInterval) seharusnya sudah dibuang oleh broker
+    # dan tidak akan sampai ke callback on_message ini.
+    message_log.debug(msg.topic, "Subscriber (%s): Message received! Topic: '%s', QoS: %s, Retain: %s", CLIENT_ID, msg.topic, msg.qos, msg.retain)
+
+    start = time.perf_counter()
+    if BACKPRESSURE_ENABLED and msg.qos > 0:
+        # Pesan di dalam envelope memakai mid dan timestamp yang sama, jadi ikut dilacak
+        ack_tracker.hold(client, msg)
+    try:
+        messages = (msg,)
+        if is_envelope(msg.properties):
+            # Envelope batch dari publisher (coalescing): setiap pesan di dalamnya diantrekan sendiri
+            try:
+                messages = split_envelope(msg)
+            except ValueError as e:
+                metrics.counter("messages_undecodable", client="subscriber").inc()
+                warning_log.warning("undecodable", "Subscriber: Invalid batch envelope on topic %s: %s", msg.topic, e, extra={'topic': msg.topic})
+                return
+            metrics.counter("batched_messages", client="subscriber").inc(len(messages))
+        # Dengan SHARED_GROUP, state_cache diisi dari salinan langganan state non-shared;
+        # salinan itu tidak diproses lagi karena pesan yang sama dibagikan ke worker lewat $share
+        state_copy = is_state_copy(msg)
+        handlers = topic_router.match(msg.topic) if not state_copy else []
+        state_handlers = state_router.match(msg.topic) if state_copy or not SHARED_GROUP or state_cache_partial else []
+        for message in messages:
+            for handler in state_handlers:
+                handler(client, message)
+            if state_copy:
+                continue
+            if not handlers:
+                enqueue_message(client, message)
+            else:
+                for handler in handlers:
+                    handler(client, message)
+    finally:
+        ack_tracker.release(msg) # Ack langsung jika tidak ada antrean yang memegang pesan ini
+    metrics.stage("enqueue", msg.topic).observe(time.perf_counter() - start)
+
+def state_filter_handler(topic_filter):
+    levels = topic_filter.split("/")
+    device_level = levels.index("+") if "+" in levels else None
+
+    def update_state(client, msg):
+        # Dipanggil di thread jaringan: decode dan simpan nilai terakhir, tanpa antrean
+        if not msg.payload:
+            state_cache.remove(msg.topic) # Retained message dihapus
+            return
+        try:
+            data = decode_payload(msg.payload, msg.properties)
+        except ValueError:
+            data = msg.payload.decode('utf-8', 'replace') # Misalnya pesan LWT berupa teks
+        device_id = data.get(STATE_DEVICE_ID_FIELD) if isinstance(data, dict) else None
+        if device_id is None and device_level is not None:
+            device_id = msg.topic.split("/")[device_level]
+        state_cache.update(msg.topic, data, device_id, msg.retain)
+    return update_state
+
+def state_snapshot_worker():
+    logger.info(f"Subscriber ({CLIENT_ID}): State snapshot thread started.")
+    last_save = time.monotonic()
+    while not stop_processing_thread:
+        time.sleep(0.5)
+        if state_cache.dirty and time.monotonic() - last_save >= STATE_SNAPSHOT_INTERVAL:
+            try:
+                state_cache.save(STATE_SNAPSHOT_PATH)
+            except OSError as e:
+                warning_log.warning("state_snapshot", "Subscriber (%s): Failed to save state snapshot: %s", CLIENT_ID, e)
+            last_save = time.monotonic()
+    logger.info(f"Subscriber ({CLIENT_ID}): State snapshot thread stopped.")
 
 # --- Thread untuk memproses antrean ---
-def message_processor_worker():
-    print(f"Subscriber ({CLIENT_ID}): Message processor thread started.")
+def partition_for(msg):
+    # Pesan dengan kunci yang sama selalu masuk partisi yang sama, sehingga urutannya terjaga
+    data = None
+    key = msg.topic
+    if PARTITION_KEY is not None:
+        try:
+            start = time.perf_counter()
+            data = decode_payload(msg.payload, msg.properties)
+            metrics.stage("decode", msg.topic).observe(time.perf_counter() - start)
+            if isinstance(data, dict) and data.get(PARTITION_KEY) is not None:
+                key = str(data[PARTITION_KEY])
+        except ValueError:
+            pass # Payload non-JSON dipartisi berdasarkan topik
+    return zlib.crc32(key.encode()) % len(partition_queues), data
+
+def message_dispatcher_worker():
+    logger.info(f"Subscriber ({CLIENT_ID}): Message dispatcher thread started.")
     while not stop_processing_thread:
         try:
-            msg = message_queue.get(timeout=1) # Tunggu pesan dengan timeout
-            process_message(msg)
+            msg = message_queue.get(timeout=1)
+        except Empty:
+            continue
+        try:
+            index, data = partition_for(msg)
+            partition_queues[index].put((msg, data))
+        except Exception as e:
+            ack_tracker.release(msg)
+            warning_log.log(logging.ERROR, "dispatcher_error", "Subscriber (%s): Error in message_dispatcher_worker: %s", CLIENT_ID, e)
+        finally:
             message_queue.task_done()
+    logger.info(f"Subscriber ({CLIENT_ID}): Message dispatcher thread stopped.")
+
+def spill_drain_worker():
+    logger.info(f"Subscriber ({CLIENT_ID}): Spill drain thread started.")
+    last_flush = time.monotonic()
+    while not stop_processing_thread:
+        moved = 0
+        if len(spill_buffer) and message_queue.qsize() <= SPILL_LOW_WATER:
+            with spill_buffer.lock:
+                # Pop dan put dalam satu lock, sehingga on_message tidak bisa menyalip pesan dari disk
+                while message_queue.qsize() < SPILL_HIGH_WATER:
+                    msg = spill_buffer.pop()
+                    if msg is None:
+                        break
+                    message_queue.put_nowait(msg)
+                    moved += 1
+        now = time.monotonic()
+        if now - last_flush >= SPILL_FLUSH_INTERVAL:
+            spill_buffer.flush()
+            last_flush = now
+        if not moved:
+            time.sleep(0.05)
+    logger.info(f"Subscriber ({CLIENT_ID}): Spill drain thread stopped.")
+
+def message_processor_worker(index):
+    logger.info(f"Subscriber ({CLIENT_ID}): Message processor thread {index} started.")
+    queue = partition_queues[index]
+    limiter = partition_limiters[index]
+    while not stop_processing_thread:
+        try:
+            msg, data = queue.get(timeout=1) # Tunggu pesan dengan timeout
+            # msg.timestamp (time.monotonic saat diterima paho) = waktu tunggu total di antrean
+            metrics.stage("dequeue", msg.topic).observe(time.monotonic() - msg.timestamp)
+            try:
+                process_message(msg, data, limiter)
+            finally:
+                ack_tracker.release(msg)
+            queue.task_done()
         except Empty:
             continue # Kembali ke awal loop jika antrean kosong
         except Exception as e:
-            print(f"Subscriber ({CLIENT_ID}): Error in message_processor_worker: {e}")
-    print(f"Subscriber ({CLIENT_ID}): Message processor thread stopped.")
+            warning_log.log(logging.ERROR, "processor_error", "Subscriber (%s): Error in message_processor_worker %d: %s", CLIENT_ID, index, e)
+    logger.info(f"Subscriber ({CLIENT_ID}): Message processor thread {index} stopped.")
+
+def filter_worker(worker):
+    topic_filter = worker['filter']
+    logger.info(f"Subscriber ({CLIENT_ID}): Worker for filter '{topic_filter}' started.")
+    while not stop_processing_thread:
+        try:
+            client, msg = worker['queue'].get(timeout=1)
+        except Empty:
+            continue
+        try:
+            metrics.stage("dequeue", msg.topic).observe(time.monotonic() - msg.timestamp)
+            worker['handler'](client, msg)
+        except Exception as e:
+            warning_log.log(logging.ERROR, topic_filter, "Subscriber (%s): Error in worker for filter '%s': %s", CLIENT_ID, topic_filter, e)
+        finally:
+            ack_tracker.release(msg)
+            worker['queue'].task_done()
+    logger.info(f"Subscriber ({CLIENT_ID}): Worker for filter '{topic_filter}' stopped.")
+
+def start_workers(num_workers=None):
+    global stop_processing_thread, spill_buffer
+    stop_processing_thread = False
+    num_workers = num_workers or NUM_WORKERS
+    partition_queues[:] = [
+        DeadlineQueue(maxsize=PARTITION_QUEUE_SIZE, order=QUEUE_ORDER, deadline_fn=lambda item: message_deadline(item[0]), on_expired=on_messages_expired)
+        for _ in range(num_workers)
+    ]
+    partition_limiters[:] = [TokenBucket(RATE_LIMIT) for _ in range(num_workers)]
+    worker_threads[:] = [Thread(target=message_dispatcher_worker, daemon=True)]
+    worker_threads.extend(Thread(target=message_processor_worker, args=(i,), daemon=True) for i in range(num_workers))
+    worker_threads.extend(Thread(target=filter_worker, args=(worker,), daemon=True) for worker in filter_workers)
+    if SPILL_ENABLED:
+        spill_buffer = SpillBuffer(SPILL_DIR, SPILL_SEGMENT_SIZE)
+        if len(spill_buffer):
+            logger.info(f"Subscriber ({CLIENT_ID}): Recovered {len(spill_buffer)} spilled messages from {SPILL_DIR}")
+        worker_threads.append(Thread(target=spill_drain_worker, daemon=True))
+    if STATE_SNAPSHOT_PATH:
+        try:
+            loaded = state_cache.load(STATE_SNAPSHOT_PATH)
+            if loaded:
+                logger.info(f"Subscriber ({CLIENT_ID}): Loaded {loaded} cached states from {STATE_SNAPSHOT_PATH}")
+        except (OSError, ValueError) as e:
+            logger.warning(f"Subscriber ({CLIENT_ID}): Ignoring unreadable state snapshot {STATE_SNAPSHOT_PATH}: {e}")
+        worker_threads.append(Thread(target=state_snapshot_worker, daemon=True))
+    for thread in worker_threads:
+        thread.start()
+
+def stop_workers(timeout=5):
+    global stop_processing_thread, spill_buffer
+    stop_processing_thread = True # Signal thread untuk berhenti
+    for thread in worker_threads:
+        if thread.is_alive():
+            thread.join(timeout=timeout) # Tunggu thread selesai
+    worker_threads.clear()
+    if spill_buffer is not None:
+        # Pesan yang masih di disk akan dibaca ulang saat subscriber dijalankan lagi
+        buffer, spill_buffer = spill_buffer, None
+        with buffer.lock:
+            buffer.close()
+    if STATE_SNAPSHOT_PATH and state_cache.dirty:
+        state_cache.save(STATE_SNAPSHOT_PATH)
 
 
 def on_subscribe(client, userdata, mid, reason_codes, properties=None):
     granted_qos_str = [str(rc.value) for rc in reason_codes] # Ubah reason_codes menjadi list string angka
-    print(f"Subscriber ({CLIENT_ID}): Subscribed with MID {mid}, Granted QoS: {granted_qos_str}")
+    logger.info(f"Subscriber ({CLIENT_ID}): Subscribed with MID {mid}, Granted QoS: {granted_qos_str}")
+    failed = [topic for (topic, _), rc in zip(userdata['subscriptions'].get(mid, ()), reason_codes) if rc.is_failure]
+    if failed:
+        logger.warning(f"Subscriber ({CLIENT_ID}): Broker refused subscription to {failed}")
+    userdata['readiness'].subscribed(mid, reason_codes)
 
 
-def on_disconnect(client, userdata, reason_code, properties=None):
+def on_disconnect(client, userdata, disconnect_flags, reason_code, properties=None):
+    userdata['readiness'].disconnected()
+    ack_tracker.clear() # Pesan yang belum di-ack dikirim ulang broker jika sesinya masih ada
     if reason_code != 0:
-        print(f"Subscriber ({CLIENT_ID}): Unexpected disconnection (reason: {reason_code}).")
+        # Reconnect dengan jeda acak yang bertambah eksponensial; yang pertama hampir langsung
+        delay = schedule_reconnect(client, userdata['readiness'])
+        logger.warning(f"Subscriber ({CLIENT_ID}): Unexpected disconnection (reason: {reason_code}), reconnecting in {delay:.2f}s.")
     else:
-        print(f"Subscriber ({CLIENT_ID}): Disconnected normally.")
-
-# Initialize MQTT Client
-subscriber_client = mqtt.Client(client_id=CLIENT_ID, protocol=mqtt.MQTTv5, callback_api_version=mqtt.CallbackAPIVersion.VERSION2)
-subscriber_client.tls_set(cert_reqs=None, tls_version=ssl.PROTOCOL_TLS_CLIENT)
-
-subscriber_client.on_connect = on_connect
-subscriber_client.on_message = on_message
-subscriber_client.on_subscribe = on_subscribe
-subscriber_client.on_disconnect = on_disconnect
-
-print(f"Subscriber ({CLIENT_ID}): Connecting to {BROKER_HOST}:{BROKER_PORT}...")
-try:
-    subscriber_client.username_pw_set(USERNAME, PASSWORD) 
-    subscriber_client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
-except Exception as e:
-    print(f"Subscriber ({CLIENT_ID}): Connection failed - {e}")
-    exit()
-
-# --- Mulai thread pemroses pesan ---
-processor_thread = Thread(target=message_processor_worker, daemon=True)
-processor_thread.start()
-
-try:
-    print(f"Subscriber ({CLIENT_ID}): Starting MQTT loop, press Ctrl+C to stop.")
-    subscriber_client.loop_forever()
-except KeyboardInterrupt:
-    print(f"Subscriber ({CLIENT_ID}): Interrupt received, disconnecting...")
-except Exception as e:
-    print(f"Subscriber ({CLIENT_ID}): Error in loop - {e}")
-finally:
-    stop_processing_thread = True # Signal thread untuk berhenti
-    if processor_thread.is_alive():
-        processor_thread.join(timeout=5) # Tunggu thread selesai
-    subscriber_client.disconnect()
-    print(f"Subscriber ({CLIENT_ID}): Done.")
\ No newline at end of file
+        logger.info(f"Subscriber ({CLIENT_ID}): Disconnected normally.")
+
+
+def on_connect_fail(client, userdata):
+    delay = schedule_reconnect(client, userdata['readiness'])
+    warning_log.warning("connect_failed", "Subscriber (%s): Connection attempt failed, retrying in %.2fs", CLIENT_ID, delay)
+
+
+def wait_until_ready(timeout=CONNECT_TIMEOUT, client=None):
+    # True setelah CONNACK dan SUBACK untuk semua TOPICS_TO_SUBSCRIBE
+    return (client or subscriber_client).user_data_get()['readiness'].wait(timeout)
+
+def get_request_cache_stats():
+    return request_cache.snapshot()
+
+def get_backpressure_stats():
+    return {'acks': ack_tracker.snapshot(), 'reads': read_gate.snapshot()}
+
+def get_state_cache_stats():
+    return state_cache.snapshot()
+
+def get_dedup_stats():
+    messages = dedup_index.snapshot() if dedup_index is not None else {}
+    return {'messages': dict(messages, dropped=duplicate_messages), 'requests': response_cache.snapshot()}
+
+# --- Routing topik ke handler ---
+def process_status_message(client, msg):
+    process_message(msg)
+
+bind_filter(REQUEST_TOPIC, handle_request)
+bind_filter(f"{YOUR_UNIQUE_TOPIC_PREFIX}/iot/client/#", process_status_message, own_worker=True)
+for topic_filter, _ in TOPICS_TO_SUBSCRIBE:
+    if topic_filter not in topic_router.filters():
+        bind_filter(topic_filter, enqueue_message)
+for topic_filter in STATE_CACHE_FILTERS: # Router terpisah, agar pesan tetap juga diantrekan
+    state_router.add(topic_filter, state_filter_handler(topic_filter))
+
+def create_subscriber_client(client_id):
+    # Initialize MQTT Client
+    tls_context = create_tls_context() if USE_TLS else None
+    client = mqtt.Client(client_id=client_id, protocol=mqtt.MQTTv5, callback_api_version=mqtt.CallbackAPIVersion.VERSION2,
+                         userdata={'readiness': ConnectionReadiness(tls_context), 'subscriptions': {}}, manual_ack=BACKPRESSURE_ENABLED)
+    if tls_context is not None:
+        client.tls_set_context(tls_context) # Sesi TLS dipakai ulang saat reconnect
+
+    client.on_connect = on_connect
+    client.on_message = on_message
+    client.on_subscribe = on_subscribe
+    client.on_disconnect = on_disconnect
+    client.on_connect_fail = on_connect_fail
+    return client
+
+def receive_maximum():
+    # Laju proses = NUM_WORKERS pesan per PROCESSING_DELAY (dibatasi RATE_LIMIT per worker),
+    # dikali BACKPRESSURE_TARGET_LATENCY; dibaca saat connect agar perubahan konfigurasi ikut terhitung
+    if RECEIVE_MAXIMUM is not None:
+        return RECEIVE_MAXIMUM
+    per_worker = min(RATE_LIMIT, 1 / PROCESSING_DELAY) if PROCESSING_DELAY > 0 else RATE_LIMIT
+    return max(1, min(65535, int(NUM_WORKERS * per_worker * BACKPRESSURE_TARGET_LATENCY)))
+
+def connect_subscriber(client, host=None, port=None, keepalive=60):
+    # ReceiveMaximum membatasi pesan QoS 1/2 yang dikirim broker sebelum subscriber meng-ack-nya
+    properties = None
+    if BACKPRESSURE_ENABLED:
+        properties = mqtt.Properties(mqtt.PacketTypes.CONNECT)
+        properties.ReceiveMaximum = receive_maximum()
+    return client.connect(host or BROKER_HOST, port or BROKER_PORT, keepalive=keepalive, properties=properties)
+
+def start_network_loop(client):
+    # Dengan BACKPRESSURE_ENABLED, NetworkLoop menggantikan loop_start() agar pembacaan socket
+    # bisa dihentikan lewat read_gate tanpa menahan PUBACK, respons dan keepalive
+    userdata = client.user_data_get()
+    if BACKPRESSURE_ENABLED:
+        userdata['network_loop'] = NetworkLoop(client, read_gate, userdata['readiness'])
+        userdata['network_loop'].start()
+    else:
+        client.loop_start()
+
+def stop_network_loop(client, timeout=5):
+    # Disconnect dan hentikan loop yang dimulai start_network_loop
+    network_loop = client.user_data_get().pop('network_loop', None)
+    if network_loop is not None:
+        network_loop.stop(timeout)
+    else:
+        client.loop_stop()
+        client.disconnect()
+
+subscriber_client = create_subscriber_client(CLIENT_ID)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="MQTT subscriber")
+    parser.add_argument("--workers", type=int, default=0, help="jalankan N worker process dengan shared subscription (0 = satu proses)")
+    parser.add_argument("--group", default=None, help="nama grup shared subscription (default: subscriber)")
+    args = parser.parse_args()
+    setup_logging()
+    if args.workers > 0:
+        from subscriber_supervisor import run_supervisor
+        run_supervisor(args.workers, args.group or "subscriber")
+        exit()
+    SHARED_GROUP = args.group
+    logger.info(f"Subscriber ({CLIENT_ID}): Connecting to {BROKER_HOST}:{BROKER_PORT}...")
+    try:
+        subscriber_client.username_pw_set(USERNAME, PASSWORD)
+        connect_subscriber(subscriber_client)
+    except Exception as e:
+        logger.error(f"Subscriber ({CLIENT_ID}): Connection failed - {e}")
+        exit()
+
+    # --- Mulai thread pemroses pesan ---
+    start_workers()
+    if METRICS_HTTP_PORT:
+        metrics.start_http_server(METRICS_HTTP_PORT)
+    if METRICS_PUBLISH_INTERVAL:
+        metrics.start_mqtt_publisher(subscriber_client, METRICS_TOPIC, METRICS_PUBLISH_INTERVAL)
+
+    try:
+        logger.info(f"Subscriber ({CLIENT_ID}): Starting MQTT loop, press Ctrl+C to stop.")
+        start_network_loop(subscriber_client)
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        logger.info(f"Subscriber ({CLIENT_ID}): Interrupt received, disconnecting...")
+    except Exception as e:
+        logger.error(f"Subscriber ({CLIENT_ID}): Error in loop - {e}")
+    finally:
+        stop_workers(timeout=5)
+        stop_network_loop(subscriber_client)
+        logger.info(f"Subscriber ({CLIENT_ID}): Done.")
@@ -0,0 +1,158 @@
+import multiprocessing
+import os
+import time
+from queue import Empty
+
+import subscriber
+from metrics import registry as metrics, merge_snapshots
+from mqtt_logging import get_logger, setup_logging, shutdown_logging
+
+# Supervisor untuk subscriber multi-proses. Setiap worker process adalah subscriber
+# lengkap (router, antrean, worker pool, request handler) dengan client ID sendiri
+# yang subscribe ke TOPICS_TO_SUBSCRIBE sebagai $share/<grup>/<topik>, sehingga broker
+# membagi pesan dan request di antara worker. Supervisor menjalankan ulang worker
+# yang mati dan menggabungkan metrics mereka.
+METRICS_REPORT_INTERVAL = 1.0 # Detik antar snapshot metrics dari worker ke supervisor
+RESTART_DELAY = 1.0 # Jeda sebelum worker yang mati dijalankan ulang
+MAX_RESTART_DELAY = 30.0 # Jeda maksimum untuk worker yang terus crash
+STABLE_RUNTIME = 10.0 # Worker yang hidup selama ini dianggap stabil dan jedanya direset
+SUMMARY_INTERVAL = 10.0 # Detik antar log ringkasan supervisor
+
+logger = get_logger("subscriber_supervisor")
+
+
+def worker_main(index, group, supervisor_id, stop_event, metrics_queue):
+    setup_logging()
+    subscriber.CLIENT_ID = f"{subscriber.CLIENT_ID_BASE}_{supervisor_id}_w{index}"
+    subscriber.SHARED_GROUP = group
+    subscriber.SPILL_DIR = os.path.join(subscriber.SPILL_DIR, f"worker{index}") # Segmen spill tidak boleh dipakai bersama
+    if subscriber.STATE_SNAPSHOT_PATH:
+        subscriber.STATE_SNAPSHOT_PATH = f"{subscriber.STATE_SNAPSHOT_PATH}.worker{index}"
+    client = subscriber.create_subscriber_client(subscriber.CLIENT_ID)
+    subscriber.subscriber_client = client
+    client.username_pw_set(subscriber.USERNAME, subscriber.PASSWORD)
+    subscriber.connect_subscriber(client)
+    subscriber.start_workers()
+    subscriber.start_network_loop(client)
+    if not subscriber.wait_until_ready(client=client):
+        logger.warning(f"Supervisor: Worker {index} not subscribed after {subscriber.CONNECT_TIMEOUT}s, still retrying")
+    try:
+        while not stop_event.wait(METRICS_REPORT_INTERVAL):
+            metrics_queue.put((index, metrics.snapshot()))
+    except KeyboardInterrupt:
+        pass # Supervisor yang memutuskan kapan berhenti lewat stop_event
+    finally:
+        subscriber.stop_workers(timeout=5)
+        subscriber.stop_network_loop(client)
+        metrics_queue.put((index, metrics.snapshot()))
+        shutdown_logging() # Proses anak keluar lewat os._exit, handler atexit tidak dijalankan
+
+
+class Supervisor:
+    def __init__(self, num_workers, group):
+        self.num_workers = num_workers
+        self.group = group
+        self.supervisor_id = f"{int(time.time())}{os.getpid() % 1000}"
+        self.context = multiprocessing.get_context("spawn")
+        self.metrics_queue = self.context.Queue()
+        self.workers = {} # index -> {'process', 'stop_event', 'started', 'delay', 'restart_at', 'restarts'}
+        self.snapshots = {} # index -> snapshot metrics terakhir
+        self.restarts = 0
+
+    def _start(self, index):
+        # Event per worker: multiprocessing.Event.set() menunggu semua proses yang sedang
+        # wait() bangun, jadi Event bersama akan macet selamanya setelah satu worker di-kill
+        stop_event = self.context.Event()
+        process = self.context.Process(
+            target=worker_main,
+            args=(index, self.group, self.supervisor_id, stop_event, self.metrics_queue),
+            name=f"subscriber-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        state = self.workers.setdefault(index, {'delay': RESTART_DELAY, 'restarts': 0})
+        state.update(process=process, stop_event=stop_event, started=time.monotonic(), restart_at=None)
+        logger.info(f"Supervisor: Started worker {index} (pid {process.pid}) in group '{self.group}'")
+
+    def _check_workers(self):
+        now = time.monotonic()
+        for index, state in self.workers.items():
+            process = state['process']
+            if process is not None and process.is_alive():
+                if now - state['started'] >= STABLE_RUNTIME:
+                    state['delay'] = RESTART_DELAY
+                continue
+            if state['restart_at'] is None:
+                logger.warning(f"Supervisor: Worker {index} (pid {process.pid}) exited with code {process.exitcode}, restarting in {state['delay']:.1f}s")
+                state['process'] = None
+                state['restart_at'] = now + state['delay']
+                # Crash berulang: jeda restart dilipatgandakan
+                state['delay'] = min(MAX_RESTART_DELAY, state['delay'] * 2)
+            elif now >= state['restart_at']:
+                state['restarts'] += 1
+                self.restarts += 1
+                self._start(index)
+
+    def _drain_metrics(self):
+        while True:
+            try:
+                index, snapshot = self.metrics_queue.get_nowait()
+            except Empty:
+                return
+            self.snapshots[index] = snapshot
+
+    def snapshot(self):
+        # Counter dari worker yang dijalankan ulang mulai lagi dari nol
+        self._drain_metrics()
+        return merge_snapshots(list(self.snapshots.values()))
+
+    def summary(self):
+        snapshot = self.snapshot()
+        totals = {}
+        for entry in snapshot['histograms']:
+            if entry['name'] == "stage_seconds" and entry['labels'].get('stage') == "process":
+                totals['processed'] = totals.get('processed', 0) + entry['count']
+        for entry in snapshot['counters']:
+            totals[entry['name']] = totals.get(entry['name'], 0) + entry['value']
+        alive = sum(1 for state in self.workers.values() if state['process'] is not None and state['process'].is_alive())
+        return {'workers_alive': alive, 'restarts': self.restarts, **totals}
+
+    def run(self):
+        for index in range(self.num_workers):
+            self._start(index)
+        if subscriber.METRICS_HTTP_PORT:
+            metrics.start_http_server(subscriber.METRICS_HTTP_PORT, snapshot_fn=self.snapshot)
+        last_summary = time.monotonic()
+        try:
+            while True:
+                time.sleep(0.5)
+                self._drain_metrics()
+                self._check_workers()
+                if time.monotonic() - last_summary >= SUMMARY_INTERVAL:
+                    logger.info(f"Supervisor: {self.summary()}")
+                    last_summary = time.monotonic()
+        except KeyboardInterrupt:
+            logger.info("Supervisor: Interrupt received, stopping workers...")
+        finally:
+            self.stop()
+
+    def stop(self, timeout=10):
+        processes = []
+        for state in self.workers.values():
+            if state['process'] is not None and state['process'].is_alive():
+                state['stop_event'].set()
+                processes.append(state['process'])
+        deadline = time.monotonic() + timeout
+        # Tetap baca metrics_queue selama menunggu: worker tidak bisa keluar sebelum datanya terbaca
+        while any(process.is_alive() for process in processes) and time.monotonic() < deadline:
+            self._drain_metrics()
+            time.sleep(0.05)
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        self._drain_metrics()
+        logger.info(f"Supervisor: Done. {self.summary()}")
+
+
+def run_supervisor(num_workers, group="subscriber"):
+    Supervisor(num_workers, group).run()
@@ -8,8 +8,10 @@ from publisher import (
     BROKER_HOST,
     BROKER_PORT,
     USERNAME,         # Jika menggunakan otentikasi
-    PASSWORD          # Jika menggunakan otentikasi
+    PASSWORD,         # Jika menggunakan otentikasi
+    wait_until_ready  # Menunggu CONNACK + SUBACK, tanpa polling
 )
+from mqtt_logging import setup_logging # Log publisher ditulis lewat thread logging
 import ssl # Untuk TLS
 import paho.mqtt.client as mqtt # Untuk properties
 
@@ -70,13 +72,14 @@ def test_expiry_scenario():
         expiry=10 # MQTT Expiry Interval cukup panjang agar broker tidak membuangnya
     )
     print(f"Sent payload3 to {TOPIC_QOS1} with application-level expiry field.")
-    # Subscriber akan sleep 2 detik karena ada field 'expiry' di payload, lalu mengeceknya.
+    # Subscriber membuang pesan ini dari antrean jika belum diproses dalam 2 detik.
 
     print("\nWaiting a bit more to observe subscriber logs...")
     time.sleep(5)
     print("\nTest scenarios sent. Check subscriber logs.")
 
 if __name__ == "__main__":
+    setup_logging()
     # Setup publisher_client di sini karena kita tidak menjalankan blok __main__ dari publisher.py
     print(f"Test Script: Connecting publisher client ({publisher_client._client_id.decode()})...")
     try:
@@ -87,13 +90,9 @@ if __name__ == "__main__":
         publisher_client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
         publisher_client.loop_start() # Penting untuk memproses callback publish dan on_message (jika publisher juga subscribe)
         
-        # Tunggu koneksi berhasil
+        # Tunggu koneksi siap (CONNACK dan SUBACK topik respons)
         connect_timeout = 5
-        start_time = time.time()
-        while not publisher_client.is_connected() and (time.time() - start_time < connect_timeout):
-            time.sleep(0.1)
-
-        if not publisher_client.is_connected():
+        if not wait_until_ready(connect_timeout):
             print("Test Script: Publisher client failed to connect. Exiting.")
             publisher_client.loop_stop()
             exit()
@@ -1,6 +1,7 @@
 import time
 import json
-from publisher import send_message_with_flow_control, TOPIC_QOS1, publisher_client, BROKER_HOST, BROKER_PORT
+from publisher import send_message_with_flow_control, TOPIC_QOS1, publisher_client, BROKER_HOST, BROKER_PORT, RATE_LIMIT, BURST_SIZE, get_window_stats, wait_until_ready
+from mqtt_logging import setup_logging # Log publisher ditulis lewat thread logging
 from threading import Thread
 import paho.mqtt.client as mqtt
 
@@ -12,8 +13,7 @@ def test_flow_control():
         print("Publisher not connected, attempting to connect...")
         publisher_client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
         publisher_client.loop_start()
-        time.sleep(2)
-        if not publisher_client.is_connected():
+        if not wait_until_ready():
             print("Failed to connect publisher")
             return
     
@@ -78,7 +78,11 @@ def test_flow_control():
     elapsed_time = time.time() - start_time
     rate = 5 / elapsed_time
     print(f"Time to send 5 concurrent messages: {elapsed_time:.2f} seconds")
-    print(f"Actual rate: {rate:.2f} messages/second")
+    print(f"Actual rate: {rate:.2f} messages/second (QoS 1 paced by the in-flight window; QoS 0 limit: {RATE_LIMIT}/s, burst {BURST_SIZE})")
+    # RATE_LIMIT hanya berlaku untuk QoS 0; laju QoS 1 diatur oleh jendela in-flight adaptif
+    window = get_window_stats()
+    print(f"In-flight window: {window['window']} (limit {window['limit']}), ack latency: {window['latency_ms']} ms, decreases: {window['decreases']}")
 
 if __name__ == "__main__":
+    setup_logging()
     test_flow_control()
\ No newline at end of file
@@ -3,13 +3,17 @@ import json
 import uuid # Untuk request_id jika diperlukan di sini, meskipun send_request sudah menanganinya
 from publisher import (
     send_request,       # Fungsi utama untuk mengirim request
+    send_request_many,  # Mengirim banyak request sekaligus, hasilnya berupa Future
+    get_request_stats,
     publisher_client,   # Client object
     BROKER_HOST,
     BROKER_PORT,
     USERNAME,           # Jika menggunakan otentikasi
     PASSWORD,           # Jika menggunakan otentikasi
-    YOUR_UNIQUE_TOPIC_PREFIX # Untuk memastikan konsistensi jika diperlukan
+    YOUR_UNIQUE_TOPIC_PREFIX, # Untuk memastikan konsistensi jika diperlukan
+    wait_until_ready    # Menunggu CONNACK + SUBACK topik respons, tanpa polling
 )
+from mqtt_logging import setup_logging # Log publisher ditulis lewat thread logging
 # import ssl # Tidak perlu di sini karena sudah dihandle di publisher.py
 # import paho.mqtt.client as mqtt # Tidak perlu di sini karena sudah dihandle di publisher.py
 
@@ -78,9 +82,28 @@ def run_request_response_tests():
     else:
         print("Publisher: Test Case 3 - No response, as might be expected if action is unhandled or timeout occurred.")
 
+    time.sleep(1)
+
+    # Test Case 4: Banyak request sekaligus tanpa satu thread per request
+    print("\nTest Case 4: Sending 20 pipelined requests...")
+    futures = send_request_many(
+        [{'action': 'get_device_status', 'device_id': f'temp_sensor_{i:03d}'} for i in range(20)],
+        timeout=10
+    )
+    answered = 0
+    for future in futures:
+        try:
+            if future.result().get('status') == 'success':
+                answered += 1
+        except Exception as e:
+            print(f"Publisher: Test Case 4 - Request failed: {e}")
+    print(f"Publisher: Test Case 4 - {answered}/{len(futures)} requests answered.")
+    print(f"Publisher: Request stats: {get_request_stats()}")
+
     print("\nRequest-Response tests completed. Check subscriber logs for processing details.")
 
 if __name__ == "__main__":
+    setup_logging()
     # Setup publisher_client di sini karena kita tidak menjalankan blok __main__ dari publisher.py
     print(f"Test Script: Connecting publisher client ({publisher_client._client_id.decode()})...")
     try:
@@ -89,13 +112,9 @@ if __name__ == "__main__":
         publisher_client.connect(BROKER_HOST, BROKER_PORT, keepalive=60)
         publisher_client.loop_start() # Penting untuk memproses callback on_message untuk respons
 
-        # Tunggu koneksi berhasil
+        # Tunggu koneksi siap; request baru aman dikirim setelah SUBACK topik respons
         connect_timeout = 10 # Tambah timeout koneksi
-        start_time = time.time()
-        while not publisher_client.is_connected() and (time.time() - start_time < connect_timeout):
-            time.sleep(0.1)
-
-        if not publisher_client.is_connected():
+        if not wait_until_ready(connect_timeout):
             print("Test Script: Publisher client failed to connect. Exiting.")
             if publisher_client.loop_started: # Cek apakah loop sudah start sebelum stop
                  publisher_client.loop_stop()
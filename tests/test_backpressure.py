@@ -0,0 +1,170 @@
+import time
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from backpressure import AckTracker, ReadGate
+from coalescer import BATCH_USER_PROPERTY, pack_envelope, split_envelope
+from deadline_queue import DeadlineQueue
+
+
+class FakeClient:
+    # Mencatat ack manual yang akan dikirim paho sebagai PUBACK/PUBREC
+    def __init__(self):
+        self.acks = []
+
+    def ack(self, mid, qos):
+        self.acks.append((mid, qos))
+
+
+def message(mid, qos=1, timestamp=10.0, payload=b"1", properties=None):
+    msg = mqtt.MQTTMessage(mid, b"t")
+    msg.payload = payload
+    msg.qos = qos
+    msg.timestamp = timestamp
+    msg.properties = properties
+    return msg
+
+
+def envelope_message(mid, count):
+    properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    properties.UserProperty = (BATCH_USER_PROPERTY, str(count))
+    items = [(str(i).encode(), "text/plain") for i in range(count)]
+    return message(mid, payload=pack_envelope(items), properties=properties)
+
+
+def test_ack_is_sent_once_after_last_release():
+    client, tracker = FakeClient(), AckTracker()
+    msg = message(5, qos=2)
+    tracker.hold(client, msg) # on_message
+    tracker.retain(msg) # Masuk antrean
+    tracker.release(msg) # on_message selesai
+    assert client.acks == []
+    tracker.release(msg) # Worker selesai memproses
+    assert client.acks == [(5, 2)]
+    tracker.release(msg) # Release berlebih diabaikan
+    assert client.acks == [(5, 2)]
+    assert tracker.snapshot() == {'acked': 1, 'discarded': 0, 'unacked': 0}
+
+
+def test_split_envelope_is_acked_after_every_item():
+    # Semua pesan di dalam envelope berbagi mid dan timestamp, jadi satu PUBACK untuk seluruh batch
+    client, tracker = FakeClient(), AckTracker()
+    msg = envelope_message(7, 3)
+    tracker.hold(client, msg)
+    items = split_envelope(msg)
+    for item in items:
+        tracker.retain(item)
+    tracker.release(msg)
+    for item in items[:-1]:
+        tracker.release(item)
+        assert client.acks == []
+    tracker.release(items[-1])
+    assert client.acks == [(7, 1)]
+    assert len(tracker) == 0
+
+
+def test_spilled_message_is_acked_when_on_message_returns():
+    # Pesan yang masuk spill buffer tidak di-retain: sudah aman di disk, jadi langsung di-ack
+    client, tracker = FakeClient(), AckTracker()
+    msg = message(3)
+    tracker.hold(client, msg)
+    tracker.release(msg)
+    assert client.acks == [(3, 1)]
+
+
+def test_expired_queue_items_are_released():
+    client, tracker = FakeClient(), AckTracker()
+    queue = DeadlineQueue(deadline_fn=lambda msg: 0.0, on_expired=lambda items: [tracker.release(item) for item in items])
+    msg = message(9)
+    tracker.hold(client, msg)
+    tracker.retain(msg)
+    queue.put(msg)
+    tracker.release(msg)
+    assert client.acks == []
+    assert queue.purge_expired() == 1
+    assert client.acks == [(9, 1)]
+    assert len(tracker) == 0
+
+
+def test_unheld_messages_are_ignored():
+    # QoS 0 tidak pernah di-hold; retain/release untuknya tidak boleh mengirim ack
+    client, tracker = FakeClient(), AckTracker()
+    msg = message(0, qos=0)
+    tracker.retain(msg)
+    tracker.release(msg)
+    assert client.acks == []
+    assert tracker.snapshot()['acked'] == 0
+
+
+def test_reused_mid_is_tracked_separately():
+    client, tracker = FakeClient(), AckTracker()
+    first, second = message(1, timestamp=10.0), message(1, timestamp=11.0)
+    tracker.hold(client, first)
+    tracker.retain(first)
+    tracker.hold(client, second)
+    tracker.release(second)
+    assert client.acks == [(1, 1)]
+    assert len(tracker) == 1
+
+
+def test_clear_discards_without_acking():
+    # Setelah reconnect, release dari worker untuk pesan koneksi lama tidak mengirim ack
+    client, tracker = FakeClient(), AckTracker()
+    msg = message(4)
+    tracker.hold(client, msg)
+    tracker.retain(msg)
+    tracker.clear()
+    tracker.release(msg)
+    tracker.release(msg)
+    assert client.acks == []
+    assert tracker.snapshot() == {'acked': 0, 'discarded': 1, 'unacked': 0}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_invalid_water_marks_are_rejected():
+    with pytest.raises(ValueError):
+        ReadGate(lambda: 0, high_water=10, low_water=11)
+
+
+def test_gate_pauses_at_high_water_and_resumes_at_low_water(clock):
+    depth, paused_at = [0], []
+    gate = ReadGate(lambda: depth[0], high_water=10, low_water=4, on_pause=paused_at.append)
+    depth[0] = 9
+    assert not gate.update()
+    depth[0] = 10
+    assert gate.update()
+    assert paused_at == [10]
+    clock[0] += 1
+    depth[0] = 5 # Di antara low dan high water: tetap paused
+    assert gate.update()
+    clock[0] += 1
+    depth[0] = 4
+    assert not gate.update()
+    assert gate.stats == {'pauses': 1, 'paused_seconds': 2.0, 'timeouts': 0}
+    depth[0] = 7 # Di bawah high water: tidak pause lagi
+    assert not gate.update()
+
+
+def test_max_pause_opens_gate_until_depth_drops_below_high_water(clock):
+    # Jeda terlalu lama akan memutus koneksi karena PINGRESP tidak terbaca
+    depth = [20]
+    gate = ReadGate(lambda: depth[0], high_water=10, low_water=4, max_pause=5)
+    assert gate.update()
+    clock[0] += 5
+    assert not gate.update()
+    assert gate.stats['timeouts'] == 1
+    clock[0] += 1
+    assert not gate.update() # Masih di atas high water, tetapi gate tidak langsung pause lagi
+    depth[0] = 9
+    assert not gate.update()
+    depth[0] = 10
+    assert gate.update()
+    assert gate.stats['pauses'] == 2
+    assert gate.snapshot()['paused']
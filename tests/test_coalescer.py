@@ -0,0 +1,145 @@
+from threading import Event, Lock
+
+import paho.mqtt.client as mqtt
+import pytest
+
+from codec import decode_payload
+from coalescer import Coalescer, ENVELOPE_VERSION, ITEM_HEADER, is_envelope, pack_envelope, split_envelope, unpack_envelope
+
+
+ITEMS = [
+    (b'{"a": 1}', "application/json"),
+    (b"\x01\x02\x03", "application/vnd.insisdemomqtt.sensor"),
+    (b"", "application/json"),
+    (b"x" * 300, "text/plain"),
+]
+
+
+class Recorder:
+    # Pengganti send() publisher: mencatat envelope, bisa ditahan per topik
+    def __init__(self):
+        self.sent = []
+        self.lock = Lock()
+        self.blocked = {}
+
+    def __call__(self, topic, envelope, qos, properties):
+        gate = self.blocked.get(topic)
+        if gate is not None:
+            gate.wait(5)
+        with self.lock:
+            self.sent.append((topic, envelope, qos, properties))
+            return len(self.sent)
+
+
+def received(topic, envelope, qos, properties):
+    msg = mqtt.MQTTMessage(1, topic.encode())
+    msg.payload = envelope
+    msg.qos = qos
+    msg.properties = properties
+    return msg
+
+
+def test_round_trip_with_mixed_content_types():
+    assert unpack_envelope(pack_envelope(ITEMS)) == ITEMS
+    assert unpack_envelope(pack_envelope(ITEMS), expected=len(ITEMS)) == ITEMS
+
+
+def test_truncated_envelope_is_rejected():
+    envelope = pack_envelope(ITEMS)
+    for cut in range(len(envelope)):
+        with pytest.raises(ValueError):
+            unpack_envelope(envelope[:cut], expected=len(ITEMS))
+
+
+def test_malformed_envelopes_are_rejected():
+    envelope = pack_envelope(ITEMS)
+    with pytest.raises(ValueError):
+        unpack_envelope(bytes((ENVELOPE_VERSION + 1,)) + envelope[1:])
+    with pytest.raises(ValueError):
+        unpack_envelope(envelope + b"\x00") # Header pesan terpotong
+    with pytest.raises(ValueError):
+        unpack_envelope(bytes((ENVELOPE_VERSION, 0)) + pack_envelope([(b"x", "a")])[5:]) # Indeks content type tidak ada
+
+
+def test_full_batch_is_sent_and_split_back():
+    send = Recorder()
+    coalescer = Coalescer(send, max_messages=3, linger=60)
+    objects = [{'device_id': "d", 'value': float(i)} for i in range(3)]
+    futures = [coalescer.add("t", obj, qos=1) for obj in objects]
+    assert [future.result(1) for future in futures] == [1, 1, 1]
+    (topic, envelope, qos, properties), = send.sent
+    assert is_envelope(properties)
+    messages = split_envelope(received(topic, envelope, qos, properties))
+    assert [decode_payload(msg.payload, msg.properties) for msg in messages] == objects
+    assert {msg.qos for msg in messages} == {1}
+    assert coalescer.snapshot()['full'] == 1
+    coalescer.close()
+
+
+def test_split_checks_declared_count():
+    # Envelope yang terpotong tepat di batas pesan masih bisa di-unpack; jumlah di user property menangkapnya
+    send = Recorder()
+    coalescer = Coalescer(send, max_messages=2, linger=60)
+    coalescer.add("t", {'a': 1})
+    coalescer.add("t", {'a': 2})
+    topic, envelope, qos, properties = send.sent[0]
+    last_payload = unpack_envelope(envelope)[-1][0]
+    cut = envelope[:len(envelope) - ITEM_HEADER.size - len(last_payload)]
+    assert len(unpack_envelope(cut)) == 1
+    with pytest.raises(ValueError):
+        split_envelope(received(topic, cut, qos, properties))
+    coalescer.close()
+
+
+def test_linger_flushes_partial_batch():
+    send = Recorder()
+    coalescer = Coalescer(send, max_messages=100, linger=0.01)
+    future = coalescer.add("t", {'a': 1})
+    assert future.result(2) == 1
+    assert coalescer.snapshot()['lingered'] == 1
+    coalescer.close()
+
+
+def test_batches_for_one_topic_keep_their_order():
+    send = Recorder()
+    coalescer = Coalescer(send, max_messages=1, linger=60)
+    for i in range(20):
+        coalescer.add("t", {'i': i})
+    coalescer.flush()
+    messages = [msg for record in send.sent for msg in split_envelope(received(*record))]
+    assert [decode_payload(msg.payload, msg.properties)['i'] for msg in messages] == list(range(20))
+    coalescer.close()
+
+
+def test_slow_topic_does_not_stall_other_topics():
+    # send() untuk "slow" tertahan (misalnya rate limit per topik); batch "fast" tetap terkirim
+    send = Recorder()
+    send.blocked["slow"] = Event()
+    coalescer = Coalescer(send, max_messages=100, linger=0)
+    slow = coalescer.add("slow", {'a': 1})
+    fast = coalescer.add("fast", {'a': 2})
+    assert fast.result(2) == 1
+    assert not slow.done()
+    send.blocked["slow"].set()
+    assert slow.result(2) == 2
+    coalescer.close()
+
+
+def test_flush_waits_for_batches_sent_by_other_threads():
+    send = Recorder()
+    gate = send.blocked["t"] = Event()
+    coalescer = Coalescer(send, max_messages=100, linger=0)
+    future = coalescer.add("t", {'a': 1})
+    gate.set()
+    coalescer.flush()
+    assert future.done()
+
+
+def test_closed_coalescer_rejects_messages():
+    send = Recorder()
+    coalescer = Coalescer(send, linger=60)
+    future = coalescer.add("t", {'a': 1})
+    coalescer.close()
+    assert future.result(0) == 1 # Sisa batch dikirim saat close
+    with pytest.raises(RuntimeError):
+        coalescer.add("t", {'a': 2})
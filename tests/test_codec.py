@@ -0,0 +1,56 @@
+import pytest
+
+from codec import (CONTENT_TYPE_JSON, CONTENT_TYPE_SENSOR, SensorReadingCodec, decode_payload,
+                   encode_with_codec, select_codec)
+
+
+class Properties:
+    def __init__(self, content_type):
+        self.ContentType = content_type
+
+
+READING = {'device_id': 'temp_sensor_001', 'timestamp': 1700000000.25, 'value': 22.5, 'unit': 'C'}
+
+
+def test_sensor_reading_round_trip():
+    payload, codec = encode_with_codec(READING)
+    assert codec.content_type == CONTENT_TYPE_SENSOR
+    assert decode_payload(payload, Properties(CONTENT_TYPE_SENSOR)) == READING
+
+
+@pytest.mark.parametrize("reading", [
+    {'device_id': 'a', 'timestamp': 1700000000.0, 'value': 21},
+    {'device_id': 'a', 'timestamp': 1700000000, 'value': 21.0},
+    {'device_id': 'a', 'timestamp': 1700000000.0, 'value': 21.0, 'unit': ''},
+    {'device_id': 'a', 'timestamp': 1700000000.0, 'value': True},
+])
+def test_auto_selection_falls_back_to_json_when_not_exact(reading):
+    payload, codec = encode_with_codec(reading)
+    assert codec.content_type == CONTENT_TYPE_JSON
+    assert decode_payload(payload) == reading
+
+
+def test_explicit_content_type_is_used():
+    assert select_codec(READING, CONTENT_TYPE_JSON).content_type == CONTENT_TYPE_JSON
+
+
+@pytest.mark.parametrize("length", [0, 5, 17, 18, 19, 20])
+def test_truncated_sensor_reading_raises_value_error(length):
+    payload = SensorReadingCodec().encode(READING)
+    assert length < len(payload)
+    with pytest.raises(ValueError):
+        decode_payload(payload[:length], Properties(CONTENT_TYPE_SENSOR))
+
+
+def test_corrupt_sensor_reading_raises_value_error():
+    payload = bytearray(SensorReadingCodec().encode(READING))
+    payload[18] = 0xff # Karakter pertama device_id bukan UTF-8 yang valid
+    with pytest.raises(ValueError):
+        decode_payload(bytes(payload), Properties(CONTENT_TYPE_SENSOR))
+    with pytest.raises(ValueError):
+        decode_payload(SensorReadingCodec().encode(READING) + b"x", Properties(CONTENT_TYPE_SENSOR))
+
+
+def test_unknown_content_type_raises_value_error():
+    with pytest.raises(ValueError):
+        decode_payload(b"{}", Properties("application/x-unknown"))
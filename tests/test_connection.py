@@ -0,0 +1,96 @@
+import random
+
+import pytest
+
+from connection import ConnectionReadiness, RECONNECT_BASE_DELAY, RECONNECT_MAX_DELAY, schedule_reconnect
+
+
+class FakeClient:
+    def __init__(self):
+        self.delays = []
+
+    def socket(self):
+        return None
+
+    def reconnect_delay_set(self, min_delay, max_delay):
+        self.delays.append((min_delay, max_delay))
+
+
+def test_ready_after_connack_and_every_suback():
+    readiness = ConnectionReadiness()
+    readiness.connected(FakeClient(), subscribe_mids=(1, 2))
+    assert not readiness.is_ready()
+    readiness.subscribed(1, [1])
+    assert not readiness.wait(timeout=0)
+    readiness.subscribed(3, [0]) # SUBACK untuk SUBSCRIBE lain tidak dihitung
+    assert not readiness.is_ready()
+    readiness.subscribed(2, [0, 1])
+    assert readiness.wait(timeout=0)
+    assert readiness.future().result(0) == [1, 0, 1]
+
+
+def test_ready_immediately_without_subscriptions():
+    # Publisher tidak mengirim SUBSCRIBE: CONNACK saja sudah cukup
+    readiness = ConnectionReadiness()
+    readiness.connected(FakeClient())
+    assert readiness.is_ready()
+    assert readiness.stats['connects'] == 1
+
+
+def test_refused_connection_fails_future():
+    readiness = ConnectionReadiness()
+    readiness.refused("Not authorized")
+    assert not readiness.wait(timeout=0)
+    with pytest.raises(ConnectionRefusedError):
+        readiness.future().result(0)
+
+
+def test_disconnect_resets_readiness():
+    readiness = ConnectionReadiness()
+    readiness.connected(FakeClient(), subscribe_mids=(1,))
+    readiness.subscribed(1, [1])
+    ready = readiness.future()
+    readiness.disconnected()
+    assert not readiness.is_ready()
+    assert ready.done() # Future koneksi lama tetap selesai
+    readiness.subscribed(1, [1]) # SUBACK terlambat dari koneksi lama diabaikan
+    assert not readiness.is_ready()
+    readiness.connected(FakeClient(), subscribe_mids=(5,))
+    readiness.subscribed(5, [0])
+    assert readiness.is_ready()
+    assert readiness.stats == {'connects': 2, 'disconnects': 1, 'tls_resumed': 0}
+
+
+def test_pending_future_carries_over_to_next_connection():
+    # Pemanggil wait() sebelum koneksi pertama tetap dibangunkan setelah reconnect
+    readiness = ConnectionReadiness()
+    waiting = readiness.future()
+    readiness.disconnected()
+    readiness.connected(FakeClient())
+    assert waiting.result(0) == []
+
+
+def test_backoff_upper_bound_doubles_up_to_cap(monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda low, high: high)
+    readiness = ConnectionReadiness()
+    delays = [readiness.next_reconnect_delay(base=1, cap=10) for _ in range(6)]
+    assert delays == [1, 2, 4, 8, 10, 10]
+
+
+def test_jitter_stays_within_bounds():
+    readiness = ConnectionReadiness()
+    for attempt in range(20):
+        delay = readiness.next_reconnect_delay()
+        assert 0 <= delay <= min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** attempt)
+
+
+def test_successful_connect_resets_backoff(monkeypatch):
+    monkeypatch.setattr(random, "uniform", lambda low, high: high)
+    client, readiness = FakeClient(), ConnectionReadiness()
+    for _ in range(3):
+        schedule_reconnect(client, readiness)
+    readiness.connected(client)
+    assert schedule_reconnect(client, readiness) == RECONNECT_BASE_DELAY
+    assert readiness.reconnect_delay == RECONNECT_BASE_DELAY
+    assert [delay for delay, _ in client.delays] == [RECONNECT_BASE_DELAY * 2 ** i for i in range(3)] + [RECONNECT_BASE_DELAY]
+    assert {cap for _, cap in client.delays} == {RECONNECT_MAX_DELAY}
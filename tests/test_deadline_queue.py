@@ -0,0 +1,65 @@
+import time
+from queue import Empty
+
+import pytest
+
+from deadline_queue import DeadlineQueue, ORDER_EDF, ORDER_FIFO
+
+
+def queue_with_deadlines(order, **kwargs):
+    # Item berupa (nama, deadline monotonic atau None)
+    return DeadlineQueue(order=order, deadline_fn=lambda item: item[1], **kwargs)
+
+
+def test_fifo_order_is_kept():
+    queue = queue_with_deadlines(ORDER_FIFO)
+    now = time.monotonic()
+    for name, deadline in (("a", now + 30), ("b", now + 10), ("c", None)):
+        queue.put((name, deadline))
+    assert [queue.get(timeout=1)[0] for _ in range(3)] == ["a", "b", "c"]
+
+
+def test_edf_returns_earliest_deadline_first():
+    queue = queue_with_deadlines(ORDER_EDF)
+    now = time.monotonic()
+    for name, deadline in (("late", now + 30), ("none", None), ("early", now + 10)):
+        queue.put((name, deadline))
+    assert [queue.get(timeout=1)[0] for _ in range(3)] == ["early", "late", "none"]
+
+
+def test_expired_items_are_discarded_before_get():
+    expired = []
+    queue = queue_with_deadlines(ORDER_FIFO, on_expired=expired.extend)
+    now = time.monotonic()
+    queue.put(("old", now - 1))
+    queue.put(("fresh", now + 30))
+    assert queue.get(timeout=1)[0] == "fresh"
+    assert [item[0] for item in expired] == ["old"]
+    assert queue.expired == 1
+    assert queue.qsize() == 0
+    with pytest.raises(Empty):
+        queue.get(block=False)
+
+
+def test_purge_frees_space_and_task_count():
+    queue = queue_with_deadlines(ORDER_FIFO, maxsize=2)
+    now = time.monotonic()
+    queue.put(("a", now + 0.05))
+    queue.put(("b", now + 0.05))
+    assert queue.full()
+    assert queue.purge_expired(now + 1) == 2
+    assert not queue.full()
+    queue.join() # Item kedaluwarsa dihitung selesai
+
+
+@pytest.mark.parametrize("order", [ORDER_FIFO, ORDER_EDF])
+def test_consumed_entries_do_not_accumulate(order):
+    queue = queue_with_deadlines(order)
+    deadline = time.monotonic() + 3600
+    for i in range(10000):
+        queue.put((i, deadline + i % 7))
+        if i % 2:
+            queue.get(block=False)
+            queue.get(block=False)
+    assert queue.qsize() == 0
+    assert len(queue._deadlines) <= 64
@@ -0,0 +1,100 @@
+import time
+
+import pytest
+
+from dedup import BloomFilter, DedupIndex, ResponseCache
+
+
+def keys(count, prefix="msg"):
+    return [f"{prefix}-{i}".encode() for i in range(count)]
+
+
+def test_invalid_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        DedupIndex(capacity=0)
+    with pytest.raises(ValueError):
+        DedupIndex(error_rate=1)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 1e-6)
+    hashes = [DedupIndex._hash(key) for key in keys(1000)]
+    for h1, h2 in hashes:
+        bloom.add(h1, h2)
+    assert all(bloom.contains(h1, h2) for h1, h2 in hashes)
+
+
+def test_second_sighting_is_duplicate():
+    index = DedupIndex(capacity=1000, window=None)
+    assert [index.check_and_add(key) for key in keys(100)] == [False] * 100
+    assert [index.check_and_add(key) for key in keys(100)] == [True] * 100
+    stats = index.snapshot()
+    assert (stats['hits'], stats['misses'], stats['hit_ratio']) == (100, 100, 0.5)
+
+
+def test_keys_survive_one_rotation_and_expire_after_two():
+    # Generasi diganti setiap `capacity` kunci baru; kunci lama masih dikenali di generasi
+    # sebelumnya, lalu dilupakan setelah generasi itu juga diganti
+    index = DedupIndex(capacity=100, window=None)
+    old = keys(100, "old")
+    for key in old:
+        index.check_and_add(key)
+    for key in keys(100, "mid"):
+        index.check_and_add(key)
+    assert index.stats['rotations'] == 1
+    assert all(index.check_and_add(key) for key in old)
+    for key in keys(100, "new"):
+        index.check_and_add(key)
+    assert index.stats['rotations'] == 2
+    assert not any(index.check_and_add(key) for key in old)
+
+
+def test_window_expires_keys(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    index = DedupIndex(capacity=1000, window=60)
+    assert not index.check_and_add(b"a")
+    now[0] += 61
+    assert not index.check_and_add(b"b") # Rotasi: "a" pindah ke generasi sebelumnya
+    assert index.check_and_add(b"a")
+    now[0] += 61
+    assert not index.check_and_add(b"c")
+    assert not index.check_and_add(b"a") # Dua window berlalu: "a" sudah dilupakan
+    assert index.stats['rotations'] == 2
+
+
+def test_memory_is_fixed():
+    index = DedupIndex(capacity=1000, window=None)
+    for key in keys(10000):
+        index.check_and_add(key)
+    assert index.snapshot()['bytes'] <= 2 * BloomFilter(1000, 1e-6).nbytes
+
+
+def test_response_cache_states():
+    cache = ResponseCache()
+    assert cache.begin("r1") is None
+    assert cache.begin("r1") is ResponseCache.PENDING
+    cache.complete("r1", {"status": "ok"})
+    assert cache.begin("r1") == {"status": "ok"}
+    assert cache.snapshot() == {'hits': 1, 'misses': 1, 'in_progress': 1, 'size': 1}
+
+
+def test_response_cache_discard_allows_retry():
+    cache = ResponseCache()
+    cache.begin("r1")
+    cache.discard("r1")
+    assert cache.begin("r1") is None
+    cache.complete("r1", "done")
+    cache.discard("r1") # Respons yang sudah tersimpan tidak dihapus
+    assert cache.begin("r1") == "done"
+
+
+def test_response_cache_evicts_least_recently_used():
+    cache = ResponseCache(maxsize=2)
+    for request_id in ("a", "b"):
+        cache.begin(request_id)
+        cache.complete(request_id, request_id.upper())
+    cache.begin("a") # "a" baru dipakai, jadi "b" yang digusur
+    cache.begin("c")
+    assert cache.begin("a") == "A"
+    assert cache.begin("b") is None
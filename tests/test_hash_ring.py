@@ -0,0 +1,44 @@
+from collections import Counter
+
+from publisher_pool import HashRing
+
+NODES = [f"publisher_{i}" for i in range(4)]
+TOPICS = [f"insisdemomqtt/iot/device_{i}/data" for i in range(10000)]
+
+
+def assignments(nodes):
+    ring = HashRing(nodes)
+    return {topic: nodes[ring.lookup(topic)] for topic in TOPICS}
+
+
+def test_mapping_is_stable():
+    # Ring yang dibangun ulang (misalnya di proses lain) memetakan topik ke koneksi yang sama
+    assert assignments(NODES) == assignments(list(NODES))
+
+
+def test_topics_are_spread_over_all_nodes():
+    counts = Counter(assignments(NODES).values())
+    assert set(counts) == set(NODES)
+    share = len(TOPICS) / len(NODES)
+    assert all(0.7 * share < count < 1.3 * share for count in counts.values())
+
+
+def test_adding_node_only_moves_topics_to_it():
+    before = assignments(NODES)
+    after = assignments(NODES + ["publisher_4"])
+    moved = [topic for topic in TOPICS if before[topic] != after[topic]]
+    assert {after[topic] for topic in moved} == {"publisher_4"}
+    # Idealnya 1/5 topik pindah; modulo biasa akan memindahkan sekitar 4/5
+    assert 0.1 < len(moved) / len(TOPICS) < 0.3
+
+
+def test_removing_node_only_moves_its_topics():
+    before = assignments(NODES)
+    remaining = [node for node in NODES if node != "publisher_1"]
+    after = assignments(remaining)
+    moved = {topic for topic in TOPICS if before[topic] != after[topic]}
+    assert moved == {topic for topic in TOPICS if before[topic] == "publisher_1"}
+
+
+def test_single_node_gets_every_topic():
+    assert set(assignments(["only"]).values()) == {"only"}
@@ -0,0 +1,120 @@
+import time
+
+import pytest
+
+from inflight_window import InflightWindow, REASON_QUOTA_EXCEEDED
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "perf_counter", lambda: now[0])
+    return now
+
+
+def round_trip(window, clock, mid, latency, reason_code=0):
+    # Satu publish QoS 1: ambil slot, catat mid, lalu ack setelah `latency` detik
+    assert window.acquire(timeout=0)
+    window.sent(mid, "t", clock[0])
+    clock[0] += latency
+    return window.acked(mid, reason_code)
+
+
+def test_invalid_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        InflightWindow(initial=0)
+    with pytest.raises(ValueError):
+        InflightWindow(decrease=1)
+
+
+def test_slow_start_grows_by_one_per_ack(clock):
+    window = InflightWindow(initial=2, maximum=100)
+    for mid in range(1, 6):
+        assert round_trip(window, clock, mid, 0.01) == ("t", pytest.approx(0.01))
+    assert int(window.window) == 7
+    assert window.in_flight() == 0
+
+
+def test_congestion_avoidance_grows_by_one_per_window(clock):
+    window = InflightWindow(initial=10, maximum=100)
+    window.ssthresh = 10.0
+    for mid in range(1, 11):
+        round_trip(window, clock, mid, 0.01)
+    assert window.window == pytest.approx(11, abs=0.1)
+
+
+def test_window_never_exceeds_receive_maximum(clock):
+    window = InflightWindow(initial=4, maximum=100)
+    window.set_receive_maximum(5)
+    for mid in range(1, 20):
+        round_trip(window, clock, mid, 0.01)
+    assert window.window == 5
+    assert window.snapshot()['limit'] == 5
+
+
+def test_rising_latency_shrinks_window(clock):
+    # Perkiraan antrean di broker = window * (1 - dasar / rata-rata) melewati queue_threshold
+    window = InflightWindow(initial=40, maximum=100, queue_threshold=4)
+    round_trip(window, clock, 1, 0.01)
+    grown = window.window
+    for mid in range(2, 10):
+        round_trip(window, clock, mid, 0.5)
+    assert window.window < grown
+    assert window.stats['decreases'] >= 1
+
+
+def test_quota_exceeded_shrinks_once_per_window(clock):
+    window = InflightWindow(initial=16, maximum=100)
+    for mid in range(1, 5):
+        assert window.acquire(timeout=0)
+        window.sent(mid, "t", clock[0])
+    clock[0] += 0.01
+    for mid in range(1, 5):
+        window.acked(mid, REASON_QUOTA_EXCEEDED)
+    # Pesan yang sudah in-flight saat jendela dikecilkan tidak mengecilkannya lagi
+    assert window.window == 8
+    assert window.stats['quota_exceeded'] == 4
+    assert window.stats['decreases'] == 1
+    assert window.ssthresh == 8
+
+
+def test_rejected_ack_frees_slot_without_latency_sample(clock):
+    window = InflightWindow(initial=4)
+    round_trip(window, clock, 1, 5.0, reason_code=0x87)
+    assert window.stats['rejected'] == 1
+    assert window.smoothed_latency is None
+    assert window.in_flight() == 0
+
+
+def test_early_ack_completes_on_sent(clock):
+    # PUBACK bisa diproses thread jaringan sebelum publish() kembali dan sent() dipanggil
+    window = InflightWindow(initial=4)
+    assert window.acquire(timeout=0)
+    sent_at = clock[0]
+    clock[0] += 0.02
+    assert window.acked(7) is None
+    assert window.sent(7, "t", sent_at) == pytest.approx(0.02)
+    assert window.in_flight() == 0
+    assert window.stats['acked'] == 1
+
+
+def test_stale_early_ack_is_not_applied_to_new_publish(clock):
+    # Ack lama untuk mid yang sama (misalnya dari koneksi sebelumnya) datang sebelum publish ini
+    window = InflightWindow(initial=4)
+    window.acked(7)
+    clock[0] += 1
+    assert window.acquire(timeout=0)
+    assert window.sent(7, "t", clock[0]) is None
+    assert window.in_flight() == 1
+    clock[0] += 0.01
+    assert window.acked(7) == ("t", pytest.approx(0.01))
+
+
+def test_acquire_waits_for_free_slot_and_cancel_releases(clock):
+    window = InflightWindow(initial=2, maximum=2)
+    assert window.acquire(timeout=0)
+    assert window.acquire(timeout=0)
+    assert not window.acquire(timeout=0)
+    assert window.stats['waits'] == 1
+    window.cancel()
+    assert window.acquire(timeout=0)
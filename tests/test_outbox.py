@@ -0,0 +1,147 @@
+import time
+
+import pytest
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from outbox import Outbox, REASON_QUOTA_EXCEEDED
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "outbox.db")
+
+
+@pytest.fixture
+def outbox(path):
+    box = Outbox(path, commit_batch=100, commit_interval=0)
+    yield box
+    box.close()
+
+
+def replayable_ids(outbox):
+    _, rows = outbox.replayable(0, 100)
+    return [row[0] for row in rows]
+
+
+def publish(outbox, mid, topic="a", payload=b"1"):
+    # Seperti _publish: catat baris, lalu hubungkan dengan mid dari paho
+    row_id = outbox.add(topic, payload, 1)
+    outbox.sent(mid, row_id, time.perf_counter())
+    return row_id
+
+
+def test_store_keeps_message_fields(outbox):
+    properties = Properties(PacketTypes.PUBLISH)
+    properties.ContentType = "application/json"
+    row_id = outbox.add("a/b", b"payload", 1, retain=True, properties=properties)
+    outbox.release(row_id, keep=True) # Tidak lagi dikirim oleh proses ini, jadi bisa di-replay
+    _, rows = outbox.replayable(0, 100)
+    assert len(outbox) == 1
+    (stored_id, topic, payload, qos, retain, stored_properties), = rows
+    assert (stored_id, topic, payload, qos, retain) == (row_id, "a/b", b"payload", 1, True)
+    assert stored_properties.ContentType == "application/json"
+
+
+def test_active_rows_are_not_replayed(outbox):
+    # Pesan yang sedang dikirim proses ini dikirim ulang oleh paho, bukan oleh replay
+    row_id = publish(outbox, 10)
+    assert replayable_ids(outbox) == []
+    assert not outbox.claim(row_id)
+
+
+def test_ack_deletes_row(outbox):
+    publish(outbox, 10)
+    assert outbox.acked(10) is False
+    outbox.flush()
+    assert len(outbox) == 0
+    assert replayable_ids(outbox) == []
+    assert outbox.snapshot()['acked'] == 1
+
+
+def test_early_ack_is_applied_on_sent(outbox):
+    # PUBACK bisa diproses sebelum _publish memanggil sent()
+    sent_at = time.perf_counter()
+    row_id = outbox.add("a", b"1", 1)
+    outbox.acked(10)
+    assert outbox.sent(10, row_id, sent_at) is False
+    assert len(outbox) == 0
+
+
+def test_quota_exceeded_keeps_row_for_replay(outbox):
+    row_id = publish(outbox, 10)
+    assert outbox.acked(10, REASON_QUOTA_EXCEEDED) is True
+    assert len(outbox) == 1
+    assert replayable_ids(outbox) == [row_id]
+    assert outbox.claim(row_id)
+    assert not outbox.claim(row_id) # Sudah diklaim oleh replay yang sedang berjalan
+    assert outbox.snapshot()['deferred'] == 1
+
+
+def test_early_quota_exceeded_is_reported_by_sent(outbox):
+    sent_at = time.perf_counter()
+    row_id = outbox.add("a", b"1", 1)
+    outbox.acked(10, REASON_QUOTA_EXCEEDED)
+    assert outbox.sent(10, row_id, sent_at) is True
+    assert replayable_ids(outbox) == [row_id]
+
+
+def test_release_deletes_new_rows_and_keeps_replayed_rows(outbox):
+    new_row = outbox.add("a", b"1", 1)
+    replayed_row = outbox.add("a", b"2", 1)
+    outbox.release(new_row)
+    outbox.release(replayed_row, keep=True)
+    assert replayable_ids(outbox) == [replayed_row]
+    assert len(outbox) == 1
+
+
+def test_replay_pages_in_id_order(outbox):
+    row_ids = [outbox.add("a", str(i).encode(), 1) for i in range(5)]
+    for row_id in row_ids:
+        outbox.release(row_id, keep=True)
+    after_id, rows = outbox.replayable(0, 2)
+    assert [row[0] for row in rows] == row_ids[:2]
+    after_id, rows = outbox.replayable(after_id, 10)
+    assert [row[0] for row in rows] == row_ids[2:]
+    assert outbox.replayable(after_id, 10) == (None, [])
+
+
+def test_expired_rows_are_dropped_and_remaining_expiry_is_shortened(outbox, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    for interval in (10, 60):
+        properties = Properties(PacketTypes.PUBLISH)
+        properties.MessageExpiryInterval = interval
+        outbox.release(outbox.add("a", b"1", 1, properties=properties), keep=True)
+    now[0] += 30
+    _, rows = outbox.replayable(0, 100)
+    assert [row[5].MessageExpiryInterval for row in rows] == [30]
+    assert outbox.snapshot()['expired'] == 1
+    assert len(outbox) == 1
+
+
+def test_unacked_rows_survive_restart(path):
+    outbox = Outbox(path, commit_interval=0)
+    publish(outbox, 1, payload=b"acked")
+    pending_row = publish(outbox, 2, payload=b"pending")
+    outbox.acked(1)
+    outbox.close() # Proses berhenti sebelum PUBACK untuk mid 2
+
+    restarted = Outbox(path, commit_interval=0)
+    try:
+        assert len(restarted) == 1
+        _, rows = restarted.replayable(0, 100)
+        assert [(row[0], row[2]) for row in rows] == [(pending_row, b"pending")]
+        # Replay: baris diklaim, dikirim dengan mid baru, lalu di-ack
+        assert restarted.claim(pending_row)
+        restarted.sent(7, pending_row, time.perf_counter())
+        restarted.acked(7)
+        restarted.count_replayed(1)
+        restarted.flush()
+        assert len(restarted) == 0
+        assert restarted.snapshot()['replayed'] == 1
+    finally:
+        restarted.close()
+    reopened = Outbox(path)
+    assert len(reopened) == 0
+    reopened.close()
@@ -0,0 +1,26 @@
+import time
+
+import paho.mqtt.client as mqtt
+
+from publisher import encode_message
+
+
+def test_encode_message_does_not_modify_caller_properties():
+    # Properties yang sama dipakai ulang untuk banyak pesan: field dari pesan sebelumnya tidak boleh menumpuk
+    properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    properties.UserProperty = ("source", "test")
+    payload = {'device_id': "d", 'value': 1.0, 'expiry': time.time() + 60}
+    for _ in range(3):
+        _, sent = encode_message(payload, properties, expiry=10)
+    assert [key for key, _ in sent.UserProperty] == ["source", "expiry"]
+    assert sent.MessageExpiryInterval == 10
+    assert hasattr(sent, 'ContentType')
+    assert properties.UserProperty == [("source", "test")]
+    assert not hasattr(properties, 'MessageExpiryInterval')
+    assert not hasattr(properties, 'ContentType')
+
+
+def test_encode_message_keeps_raw_payload_and_properties():
+    properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    assert encode_message(b"raw", properties) == (b"raw", properties)
+    assert encode_message(b"raw") == (b"raw", None)
@@ -0,0 +1,113 @@
+import time
+
+import pytest
+
+from rate_limiter import RateLimiter, TokenBucket
+
+
+class FakeClock:
+    # Jam monotonic palsu; sleep() memajukan jam alih-alih menunggu
+    def __init__(self, now=1000.0):
+        self.now = now
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(time, "monotonic", fake.monotonic)
+    monkeypatch.setattr(time, "sleep", fake.sleep)
+    return fake
+
+
+def test_invalid_arguments_are_rejected():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+    with pytest.raises(ValueError):
+        TokenBucket(10, burst=0)
+
+
+def test_burst_then_refill_at_rate(clock):
+    bucket = TokenBucket(rate=10, burst=3)
+    assert [bucket.try_acquire() for _ in range(4)] == [True, True, True, False]
+    clock.now += 0.1 # Satu token per 0,1 detik
+    assert bucket.try_acquire()
+    assert not bucket.try_acquire()
+
+
+def test_refill_is_capped_at_burst(clock):
+    bucket = TokenBucket(rate=10, burst=2)
+    bucket.try_acquire()
+    clock.now += 60
+    assert [bucket.try_acquire() for _ in range(3)] == [True, True, False]
+
+
+def test_reserve_spaces_callers_at_rate(clock):
+    # Setiap pemanggil setelah burst menunggu giliran sendiri, bukan semuanya bangun bersamaan
+    bucket = TokenBucket(rate=10, burst=1)
+    waits = [bucket.reserve() for _ in range(4)]
+    assert waits == pytest.approx([0.0, 0.1, 0.2, 0.3])
+
+
+def test_acquire_sleeps_outside_the_bucket(clock):
+    bucket = TokenBucket(rate=4, burst=1)
+    assert bucket.acquire() == 0.0
+    assert bucket.acquire() == pytest.approx(0.25)
+    assert clock.sleeps == [pytest.approx(0.25)]
+
+
+def test_refund_returns_tokens(clock):
+    bucket = TokenBucket(rate=1, burst=1)
+    assert bucket.try_acquire()
+    bucket.refund()
+    assert bucket.try_acquire()
+
+
+def test_limiter_without_rate_never_waits(clock):
+    limiter = RateLimiter(None)
+    assert all(limiter.reserve("a/b") == 0.0 for _ in range(100))
+
+
+def test_topic_bucket_limits_each_topic_separately(clock):
+    limiter = RateLimiter(None, topic_rate=10, topic_burst=1)
+    assert limiter.try_acquire("a")
+    assert not limiter.try_acquire("a")
+    assert limiter.try_acquire("b")
+
+
+def test_failed_try_acquire_refunds_other_buckets(clock):
+    # Token global habis: token topik "c" yang sempat diambil harus dikembalikan
+    limiter = RateLimiter(10, burst=2, topic_rate=10, topic_burst=1)
+    assert limiter.try_acquire("a")
+    assert limiter.try_acquire("b")
+    assert not limiter.try_acquire("c")
+    assert limiter.topic_bucket("c").try_acquire()
+
+
+def test_wait_is_the_longest_reservation(clock):
+    limiter = RateLimiter(100, burst=1, topic_rates={"slow": (2, 1)})
+    assert limiter.reserve("slow") == 0.0
+    assert limiter.reserve("slow") == pytest.approx(0.5)
+
+
+def test_set_topic_rate_replaces_bucket(clock):
+    limiter = RateLimiter(None, topic_rate=1, topic_burst=1)
+    assert limiter.try_acquire("a")
+    limiter.set_topic_rate("a", 100, burst=5)
+    assert all(limiter.try_acquire("a") for _ in range(5))
+
+
+def test_use_global_false_skips_the_global_bucket(clock):
+    # Publish QoS 1/2 hanya memakai bucket per topik; lajunya diatur jendela in-flight
+    limiter = RateLimiter(10, burst=1, topic_rate=10, topic_burst=5)
+    assert limiter.try_acquire("a")
+    assert not limiter.try_acquire("a")
+    assert all(limiter.try_acquire("a", use_global=False) for _ in range(3))
+    assert limiter.reserve("b", use_global=False) == 0.0
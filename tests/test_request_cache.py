@@ -0,0 +1,77 @@
+import time
+
+import pytest
+
+from request_cache import HIT, MISS, WAIT, RequestCache, request_key
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_request_key_ignores_request_id_and_field_order():
+    first = request_key({'request_id': "1", 'action': "get_device_status", 'device_id': "dev1"})
+    second = request_key({'device_id': "dev1", 'action': "get_device_status", 'request_id': "2"})
+    assert first == second
+    assert first != request_key({'action': "get_device_status", 'device_id': "dev2"})
+
+
+def test_miss_then_hit(clock):
+    cache = RequestCache()
+    assert cache.lookup("k", "w1") == (MISS, None)
+    assert cache.complete("k", {'status': "ok"}, ttl=5) == []
+    assert cache.lookup("k", "w2") == (HIT, {'status': "ok"})
+
+
+def test_identical_requests_wait_for_the_first(clock):
+    cache = RequestCache()
+    assert cache.lookup("k", "w1") == (MISS, None)
+    assert cache.lookup("k", "w2") == (WAIT, None)
+    assert cache.lookup("k", "w3") == (WAIT, None)
+    assert cache.complete("k", "result", ttl=5) == ["w2", "w3"]
+    stats = cache.snapshot()
+    assert (stats['misses'], stats['coalesced'], stats['inflight']) == (1, 2, 0)
+
+
+def test_result_expires_after_ttl(clock):
+    cache = RequestCache()
+    cache.lookup("k", "w1")
+    cache.complete("k", "result", ttl=5)
+    clock[0] += 4.9
+    assert cache.lookup("k", "w2") == (HIT, "result")
+    clock[0] += 0.2
+    assert cache.lookup("k", "w3") == (MISS, None)
+    assert cache.snapshot()['expired'] == 1
+
+
+def test_zero_ttl_answers_waiters_without_caching(clock):
+    cache = RequestCache()
+    cache.lookup("k", "w1")
+    cache.lookup("k", "w2")
+    assert cache.complete("k", "result", ttl=0) == ["w2"]
+    assert cache.lookup("k", "w3") == (MISS, None)
+
+
+def test_failure_is_not_cached(clock):
+    cache = RequestCache()
+    cache.lookup("k", "w1")
+    cache.lookup("k", "w2")
+    assert cache.fail("k") == ["w2"]
+    assert cache.lookup("k", "w3") == (MISS, None)
+
+
+def test_least_recently_used_result_is_evicted(clock):
+    cache = RequestCache(maxsize=2)
+    for key in ("a", "b"):
+        cache.lookup(key, None)
+        cache.complete(key, key.upper(), ttl=60)
+    cache.lookup("a", None) # "a" baru dipakai, jadi "b" yang digusur
+    cache.lookup("c", None)
+    cache.complete("c", "C", ttl=60)
+    assert cache.lookup("a", None) == (HIT, "A")
+    assert cache.lookup("b", None) == (MISS, None)
+    stats = cache.snapshot()
+    assert (stats['evictions'], stats['size']) == (1, 2)
@@ -0,0 +1,67 @@
+import time
+
+import paho.mqtt.client as mqtt
+from paho.mqtt.packettypes import PacketTypes
+from paho.mqtt.properties import Properties
+
+from deadline_queue import message_deadline
+from spill_buffer import SpillBuffer, decode_message, encode_message
+
+
+def make_message(topic, payload, qos=1, expiry=None, age=0.0):
+    msg = mqtt.MQTTMessage(topic=topic.encode())
+    msg.payload = payload
+    msg.qos = qos
+    msg.timestamp = time.monotonic() - age
+    msg.properties = Properties(PacketTypes.PUBLISH)
+    if expiry is not None:
+        msg.properties.MessageExpiryInterval = expiry
+    return msg
+
+
+def test_encode_decode_round_trip():
+    msg = make_message("a/b", b"payload", qos=2, expiry=30, age=1.0)
+    decoded = decode_message(encode_message(msg))
+    assert (decoded.topic, decoded.payload, decoded.qos) == ("a/b", b"payload", 2)
+    assert decoded.properties.MessageExpiryInterval == 30
+    assert abs(decoded.timestamp - msg.timestamp) < 0.01
+
+
+def test_pop_in_fifo_order_across_segments(tmp_path):
+    buffer = SpillBuffer(str(tmp_path), segment_size=256)
+    for i in range(20):
+        buffer.append(make_message("t", f"message {i}".encode()))
+    assert len(buffer) == 20
+    assert [buffer.pop().payload for _ in range(20)] == [f"message {i}".encode() for i in range(20)]
+    assert buffer.pop() is None
+    buffer.close()
+
+
+def test_recover_skips_consumed_records(tmp_path):
+    buffer = SpillBuffer(str(tmp_path), segment_size=256)
+    for i in range(10):
+        buffer.append(make_message("t", str(i).encode()))
+    assert buffer.pop().payload == b"0"
+    buffer.close()
+
+    recovered = SpillBuffer(str(tmp_path), segment_size=256)
+    assert len(recovered) == 9
+    assert [recovered.pop().payload for _ in range(9)] == [str(i).encode() for i in range(1, 10)]
+    recovered.close()
+
+
+def test_recovered_message_keeps_its_age(tmp_path, monkeypatch):
+    buffer = SpillBuffer(str(tmp_path))
+    buffer.append(make_message("t", b"fresh", expiry=60, age=5.0))
+    buffer.append(make_message("t", b"stale", expiry=60, age=50.0))
+    buffer.close()
+
+    # Proses baru: jam monotonic dimulai dari nilai lain, dan 20 detik wall-clock sudah berlalu
+    real_time = time.time
+    monkeypatch.setattr(time, "monotonic", lambda: 1000.0)
+    monkeypatch.setattr(time, "time", lambda: real_time() + 20)
+    recovered = SpillBuffer(str(tmp_path))
+    fresh, stale = recovered.pop(), recovered.pop()
+    recovered.close()
+    assert abs(message_deadline(fresh) - (1000.0 + 60 - 25)) < 0.5
+    assert message_deadline(stale) < 1000.0 # Sudah kedaluwarsa selama proses mati
@@ -0,0 +1,101 @@
+import pytest
+
+from state_cache import StateCache
+from topic_router import topic_matches
+
+
+TOPICS = [
+    ("sensors/dev1/temp", "dev1"),
+    ("sensors/dev1/humidity", "dev1"),
+    ("sensors/dev2/temp", "dev2"),
+    ("sensors", None),
+    ("status/dev1", "dev1"),
+    ("$SYS/broker/uptime", None),
+]
+
+
+def filled_cache():
+    cache = StateCache()
+    for topic, device_id in TOPICS:
+        cache.update(topic, {'topic': topic}, device_id=device_id, updated=1.0)
+    return cache
+
+
+def topics_of(entries):
+    return sorted(entry['topic'] for entry in entries)
+
+
+@pytest.mark.parametrize("topic_filter", [
+    "sensors/dev1/temp",
+    "sensors/+/temp",
+    "sensors/#",
+    "sensors/dev1/#",
+    "+/dev1",
+    "#",
+    "+/+/+",
+    "$SYS/#",
+    "unknown/#",
+])
+def test_query_matches_topic_router_rules(topic_filter):
+    cache = filled_cache()
+    expected = sorted(topic for topic, _ in TOPICS if topic_matches(topic_filter, topic))
+    assert topics_of(cache.query(topic_filter)) == expected
+
+
+def test_query_rejects_invalid_filter():
+    with pytest.raises(ValueError):
+        StateCache().query("sensors/#/temp")
+
+
+def test_update_replaces_value_and_device_index():
+    cache = filled_cache()
+    cache.update("sensors/dev1/temp", {'value': 2}, device_id="dev3")
+    assert cache.get("sensors/dev1/temp")['data'] == {'value': 2}
+    assert set(cache.get_device("dev1")) == {"sensors/dev1/humidity", "status/dev1"}
+    assert set(cache.get_device("dev3")) == {"sensors/dev1/temp"}
+    assert len(cache) == len(TOPICS)
+
+
+def test_get_device_and_get_many():
+    cache = filled_cache()
+    assert set(cache.get_device("dev2")) == {"sensors/dev2/temp"}
+    assert cache.get_device("missing") is None
+    result = cache.get_many(["dev1", "missing"])
+    assert len(result["dev1"]) == 3
+    assert result["missing"] is None
+    stats = cache.snapshot()
+    assert (stats['hits'], stats['misses'], stats['devices']) == (2, 2, 2)
+
+
+def test_returned_entries_are_copies():
+    cache = filled_cache()
+    cache.get("sensors")['data'] = "changed"
+    cache.query("sensors")[0]['retain'] = True
+    entry = cache.get("sensors")
+    assert entry['data'] == {'topic': "sensors"}
+    assert entry['retain'] is False
+
+
+def test_remove_prunes_trie_and_device_index():
+    cache = filled_cache()
+    cache.remove("sensors/dev2/temp")
+    cache.remove("sensors/dev2/temp") # Topik yang tidak ada diabaikan
+    assert cache.get("sensors/dev2/temp") is None
+    assert cache.get_device("dev2") is None
+    assert "dev2" not in cache._root.children["sensors"].children
+    assert topics_of(cache.query("sensors/+/temp")) == ["sensors/dev1/temp"]
+    assert cache.snapshot()['removals'] == 1
+
+
+def test_save_and_load_round_trip(tmp_path):
+    cache = filled_cache()
+    path = str(tmp_path / "state.json")
+    assert cache.dirty
+    assert cache.save(path) == len(TOPICS)
+    assert not cache.dirty
+    restored = StateCache()
+    assert restored.load(path) == len(TOPICS)
+    assert not restored.dirty
+    assert restored.get("sensors/dev1/temp") == cache.get("sensors/dev1/temp")
+    assert topics_of(restored.query("#")) == topics_of(cache.query("#"))
+    assert StateCache().load(str(tmp_path / "missing.json")) == 0
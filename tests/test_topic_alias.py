@@ -0,0 +1,86 @@
+import paho.mqtt.client as mqtt
+
+from topic_alias import ALIAS_PROPERTY_SIZE, TopicAliasManager
+
+
+def connected(maximum=65535, min_uses=1, broker_maximum=10):
+    aliases = TopicAliasManager(maximum, min_uses)
+    aliases.reset(broker_maximum) # Seperti on_connect dengan TopicAliasMaximum dari CONNACK
+    return aliases
+
+
+def alias_of(properties):
+    return getattr(properties, 'TopicAlias', None) if properties is not None else None
+
+
+def test_no_alias_without_broker_support():
+    aliases = connected(broker_maximum=0)
+    assert aliases.apply("a/b") == ("a/b", None)
+    assert aliases.apply("a/b") == ("a/b", None)
+
+
+def test_assign_then_reuse():
+    aliases = connected()
+    topic, properties = aliases.apply("sensors/temp")
+    assert (topic, alias_of(properties)) == ("sensors/temp", 1) # Paket pertama: topik + alias
+    topic, properties = aliases.apply("sensors/temp")
+    assert (topic, alias_of(properties)) == ("", 1) # Berikutnya hanya alias
+    assert aliases.stats['assigned'] == 1
+    assert aliases.stats['hits'] == 1
+
+
+def test_topic_needs_min_uses_before_alias():
+    aliases = connected(min_uses=2)
+    assert aliases.apply("once") == ("once", None)
+    topic, properties = aliases.apply("once")
+    assert (topic, alias_of(properties)) == ("once", 1)
+
+
+def test_least_recently_used_alias_is_reassigned():
+    aliases = connected(broker_maximum=2)
+    aliases.apply("a")
+    aliases.apply("b")
+    aliases.apply("a") # "a" baru dipakai, jadi alias "b" yang diberikan ke "c"
+    topic, properties = aliases.apply("c")
+    assert (topic, alias_of(properties)) == ("c", 2)
+    assert aliases.stats['evictions'] == 1
+    topic, properties = aliases.apply("b")
+    assert (topic, alias_of(properties)) == ("b", 1) # "b" mendapat alias lagi lewat paket lengkap
+
+
+def test_capacity_is_limited_by_broker_and_local_maximum():
+    aliases = connected(maximum=1, broker_maximum=10)
+    aliases.apply("a")
+    aliases.apply("b")
+    assert aliases.snapshot()['capacity'] == 1
+    assert aliases.snapshot()['aliases'] == 1
+
+
+def test_reset_forgets_aliases_of_previous_connection():
+    aliases = connected()
+    aliases.apply("a")
+    aliases.reset() # Koneksi putus: alias lama tidak berlaku
+    assert aliases.apply("a") == ("a", None)
+    aliases.reset(10) # CONNACK baru
+    topic, properties = aliases.apply("a")
+    assert (topic, alias_of(properties)) == ("a", 1)
+
+
+def test_caller_properties_are_not_modified():
+    aliases = connected()
+    properties = mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+    properties.ContentType = "application/json"
+    _, sent = aliases.apply("a", properties)
+    assert alias_of(sent) == 1
+    assert sent.ContentType == "application/json"
+    assert alias_of(properties) is None
+
+
+def test_bytes_saved_subtracts_assigning_packet():
+    aliases = connected()
+    topic = "insisdemomqtt/iot/data/qos0"
+    for _ in range(3):
+        aliases.apply(topic)
+    # Paket pertama menambah properti alias, dua paket berikutnya menghemat topik dikurangi properti
+    expected = 2 * (len(topic) - ALIAS_PROPERTY_SIZE) - ALIAS_PROPERTY_SIZE
+    assert aliases.stats['bytes_saved'] == expected
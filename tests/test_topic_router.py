@@ -0,0 +1,78 @@
+import pytest
+
+from topic_router import TopicRouter, topic_matches, validate_filter
+
+
+CASES = [
+    # (filter, topic, cocok)
+    ("sensors/temp", "sensors/temp", True),
+    ("sensors/temp", "sensors/humidity", False),
+    ("sensors/+", "sensors/temp", True),
+    ("sensors/+", "sensors/temp/1", False),
+    ("sensors/+/1", "sensors/temp/1", True),
+    ("sensors/#", "sensors", True),
+    ("sensors/#", "sensors/temp/1", True),
+    ("#", "sensors/temp", True),
+    ("+/+", "/temp", True),
+    ("+", "sensors/temp", False),
+    ("#", "$SYS/broker/uptime", False),
+    ("+/broker/uptime", "$SYS/broker/uptime", False),
+    ("$SYS/#", "$SYS/broker/uptime", True),
+    ("$SYS/+/uptime", "$SYS/broker/uptime", True),
+]
+
+
+def route(topic_filter):
+    router = TopicRouter()
+    router.add(topic_filter, topic_filter)
+    return router
+
+
+@pytest.mark.parametrize("topic_filter,topic,expected", CASES)
+def test_topic_matches(topic_filter, topic, expected):
+    assert topic_matches(topic_filter, topic) is expected
+
+
+@pytest.mark.parametrize("topic_filter,topic,expected", CASES)
+def test_router_agrees_with_topic_matches(topic_filter, topic, expected):
+    assert route(topic_filter).match(topic) == ((topic_filter,) if expected else ())
+
+
+@pytest.mark.parametrize("topic_filter", ["a/#/b", "a/b#", "a+/b", "#/"])
+def test_invalid_filters_are_rejected(topic_filter):
+    with pytest.raises(ValueError):
+        validate_filter(topic_filter)
+    with pytest.raises(ValueError):
+        TopicRouter().add(topic_filter, print)
+
+
+def test_handler_on_overlapping_filters_runs_once():
+    router = TopicRouter()
+    router.add("sensors/#", "all")
+    router.add("sensors/+", "all")
+    router.add("sensors/temp", "temp")
+    assert router.match("sensors/temp") == ("all", "temp")
+
+
+def test_remove_handler_and_prune():
+    router = TopicRouter()
+    router.add("a/b/c", "x")
+    router.add("a/b/c", "y")
+    router.remove("a/b/c", "x")
+    assert router.match("a/b/c") == ("y",)
+    router.remove("a/b/c")
+    assert router.match("a/b/c") == ()
+    assert router.filters() == []
+    assert router._root.children == {} # Cabang kosong ikut dihapus
+
+
+def test_cache_is_invalidated_and_bounded():
+    router = TopicRouter(cache_size=2)
+    assert router.match("a/b") == ()
+    router.add("a/+", "h")
+    assert router.match("a/b") == ("h",) # Hasil lama di cache tidak dipakai setelah add
+    router.match("a/c")
+    router.match("a/d")
+    assert list(router._cache) == ["a/c", "a/d"]
+    router.remove("a/+", "h")
+    assert router.match("a/c") == ()
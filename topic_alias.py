@@ -0,0 +1,71 @@
+import copy
+from collections import OrderedDict
+from threading import Lock
+
+import paho.mqtt.client as mqtt
+
+ALIAS_PROPERTY_SIZE = 3 # Identifier properti TopicAlias (1 byte) + nilai (2 byte)
+MAX_TRACKED_TOPICS = 10000 # Batas penghitung pemakaian topik yang belum punya alias
+
+
+class TopicAliasManager:
+    # Topic alias MQTT v5 untuk satu koneksi. Topik yang sudah dipakai min_uses kali
+    # mendapat alias: publish pertama mengirim topik + alias, berikutnya hanya alias
+    # dengan topik kosong. Jika semua alias terpakai, alias milik topik yang paling
+    # lama tidak dipakai (LRU) diberikan ke topik baru. Alias hanya berlaku untuk satu
+    # koneksi, jadi reset() dipanggil saat koneksi putus dan saat CONNACK diterima.
+    # Pemanggil memegang `lock` dari apply() sampai publish selesai diantrekan, agar
+    # paket yang memperkenalkan alias selalu terkirim sebelum paket yang memakainya.
+    def __init__(self, maximum=65535, min_uses=2):
+        self.maximum = maximum
+        self.min_uses = min_uses
+        self.lock = Lock()
+        self.capacity = 0 # min(maximum, TopicAliasMaximum broker); 0 = alias tidak dipakai
+        self._aliases = OrderedDict() # topik -> alias, urut dari yang paling lama tidak dipakai
+        self._uses = {} # topik -> jumlah publish sebelum mendapat alias
+        self.stats = {'hits': 0, 'assigned': 0, 'evictions': 0, 'bytes_saved': 0}
+
+    def reset(self, broker_maximum=0):
+        # broker_maximum: TopicAliasMaximum dari CONNACK (tidak ada = 0, broker tidak menerima alias)
+        with self.lock:
+            self.capacity = min(self.maximum, broker_maximum or 0)
+            self._aliases.clear()
+            self._uses.clear()
+
+    def apply(self, topic, properties=None):
+        # Mengembalikan (topik untuk dikirim, properties). Properties milik pemanggil disalin
+        # sebelum TopicAlias diisi, karena bisa dipakai ulang untuk publish lain.
+        if not self.capacity:
+            return topic, properties
+        alias = self._aliases.get(topic)
+        if alias is not None:
+            self._aliases.move_to_end(topic)
+            self.stats['hits'] += 1
+            self.stats['bytes_saved'] += len(topic.encode()) - ALIAS_PROPERTY_SIZE
+            return "", self._with_alias(properties, alias)
+        uses = self._uses.get(topic, 0) + 1
+        if uses < self.min_uses:
+            if len(self._uses) >= MAX_TRACKED_TOPICS:
+                self._uses.clear()
+            self._uses[topic] = uses
+            return topic, properties
+        self._uses.pop(topic, None)
+        if len(self._aliases) < self.capacity:
+            alias = len(self._aliases) + 1
+        else:
+            _, alias = self._aliases.popitem(last=False)
+            self.stats['evictions'] += 1
+        self._aliases[topic] = alias
+        self.stats['assigned'] += 1
+        self.stats['bytes_saved'] -= ALIAS_PROPERTY_SIZE # Paket pertama membawa topik dan alias
+        return topic, self._with_alias(properties, alias)
+
+    @staticmethod
+    def _with_alias(properties, alias):
+        properties = copy.copy(properties) if properties is not None else mqtt.Properties(mqtt.PacketTypes.PUBLISH)
+        properties.TopicAlias = alias
+        return properties
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats, capacity=self.capacity, aliases=len(self._aliases))
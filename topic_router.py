@@ -0,0 +1,133 @@
+from collections import OrderedDict
+from threading import Lock
+
+
+def validate_filter(topic_filter):
+    levels = topic_filter.split("/")
+    for i, level in enumerate(levels):
+        if level == "#" and i != len(levels) - 1:
+            raise ValueError(f"'#' must be the last level in topic filter '{topic_filter}'")
+        if level not in ("#", "+") and ("#" in level or "+" in level):
+            raise ValueError(f"Wildcards must occupy a whole level in topic filter '{topic_filter}'")
+    return levels
+
+
+def topic_matches(topic_filter, topic):
+    # Pencocokan satu filter, untuk kasus yang tidak perlu membangun trie
+    filter_levels = topic_filter.split("/")
+    topic_levels = topic.split("/")
+    if topic.startswith("$") and filter_levels[0] in ("+", "#"):
+        return False
+    for i, level in enumerate(filter_levels):
+        if level == "#":
+            return True
+        if i >= len(topic_levels):
+            return False
+        if level != "+" and level != topic_levels[i]:
+            return False
+    return len(filter_levels) == len(topic_levels)
+
+
+class _Node:
+    __slots__ = ("children", "handlers")
+
+    def __init__(self):
+        self.children = {}
+        self.handlers = []
+
+
+class TopicRouter:
+    # Trie of topic filters split on '/', with '+' and '#' as ordinary children.
+    # Matching walks the topic once, so cost grows with topic depth rather than
+    # with the number of filters; results for hot topics are kept in an LRU cache.
+    def __init__(self, cache_size=1024):
+        self._root = _Node()
+        self._lock = Lock()
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._filters = {}
+
+    def add(self, topic_filter, handler):
+        levels = validate_filter(topic_filter)
+        with self._lock:
+            node = self._root
+            for level in levels:
+                node = node.children.setdefault(level, _Node())
+            node.handlers.append(handler)
+            self._filters.setdefault(topic_filter, []).append(handler)
+            self._cache.clear()
+
+    def remove(self, topic_filter, handler=None):
+        levels = validate_filter(topic_filter)
+        with self._lock:
+            path = [self._root]
+            for level in levels:
+                node = path[-1].children.get(level)
+                if node is None:
+                    return
+                path.append(node)
+            node = path[-1]
+            if handler is None:
+                node.handlers.clear()
+                self._filters.pop(topic_filter, None)
+            elif handler in node.handlers:
+                node.handlers.remove(handler)
+                self._filters[topic_filter].remove(handler)
+                if not self._filters[topic_filter]:
+                    del self._filters[topic_filter]
+            # Hapus node kosong agar trie tidak menyimpan cabang mati
+            for i in range(len(levels), 0, -1):
+                child = path[i]
+                if child.handlers or child.children:
+                    break
+                del path[i - 1].children[levels[i - 1]]
+            self._cache.clear()
+
+    def filters(self):
+        with self._lock:
+            return list(self._filters)
+
+    def match(self, topic):
+        with self._lock:
+            handlers = self._cache.get(topic)
+            if handlers is not None:
+                self._cache.move_to_end(topic)
+                return handlers
+            # Handler yang sama lewat beberapa filter yang tumpang tindih hanya dipanggil sekali
+            handlers = tuple(dict.fromkeys(self._match(topic)))
+            self._cache[topic] = handlers
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+            return handlers
+
+    def _match(self, topic):
+        levels = topic.split("/")
+        # Topik yang diawali '$' (misal $SYS) tidak cocok dengan wildcard di level pertama
+        system_topic = topic.startswith("$")
+        matched = []
+        nodes = [self._root]
+        for depth, level in enumerate(levels):
+            next_nodes = []
+            for node in nodes:
+                wildcard_allowed = not (system_topic and depth == 0)
+                if wildcard_allowed:
+                    multi = node.children.get("#")
+                    if multi is not None:
+                        matched.extend(multi.handlers)
+                child = node.children.get(level)
+                if child is not None:
+                    next_nodes.append(child)
+                if wildcard_allowed:
+                    single = node.children.get("+")
+                    if single is not None:
+                        next_nodes.append(single)
+            if not next_nodes:
+                return matched
+            nodes = next_nodes
+        for node in nodes:
+            matched.extend(node.handlers)
+            # 'a/#' juga cocok dengan 'a'
+            multi = node.children.get("#")
+            if multi is not None:
+                matched.extend(multi.handlers)
+        return matched